@@ -1,19 +1,104 @@
-from django.contrib import admin
-from .models import Bhandara
+from django.contrib import admin, messages
+from django.shortcuts import redirect, render
+from django.urls import path
+from django.utils import timezone
+from .bulk_import import BhandaraImporter, detect_format
+from .forms import BhandaraUploadForm
+from .models import Bhandara, BhandaraArchive, CoordinateJob, RadarEvent, ResolvedMapsUrl, TableVersion, default_end_time
+from .spatial_index import bhandara_index
 
 @admin.register(Bhandara)
 class BhandaraAdmin(admin.ModelAdmin):
-    list_display = ('area_name', 'business_name', 'is_approved', 'is_verified_owner', 'current_crowd_status', 'start_time')
-    list_filter = ('is_approved', 'is_verified_owner', 'is_active', 'current_crowd_status')
+    list_display = ('area_name', 'business_name', 'is_approved', 'is_verified_owner', 'current_crowd_status', 'start_time', 'end_time')
+    list_filter = ('is_approved', 'is_verified_owner', 'is_active', 'current_crowd_status', 'observed_crowd_status')
     search_fields = ('area_name', 'business_name', 'organizer_name', 'menu_details')
     
     # Custom bulk actions
     actions = ['approve_bhandaras', 'verify_owners']
 
     def approve_bhandaras(self, request, queryset):
+        # What save() does: submissions without an end time get the default duration from now on
+        now = timezone.now()
+        late = list(queryset.filter(end_time__isnull=True).only('id', 'start_time'))
+        for bhandara in late:
+            bhandara.end_time = default_end_time(max(bhandara.start_time, now))
+        Bhandara.objects.bulk_update(late, ['end_time'], batch_size=500)
         queryset.update(is_approved=True)
+        # update() skips post_save, so rebuild the radar index on the next request
+        bhandara_index.invalidate()
+        TableVersion.bump('radar')
+        RadarEvent.record_live(queryset.filter(is_active=True, end_time__gt=now))
     approve_bhandaras.short_description = "Mark selected as Approved (Go Live)"
 
     def verify_owners(self, request, queryset):
         queryset.update(is_verified_owner=True)
-    verify_owners.short_description = "Give selected the Blue Tick"
\ No newline at end of file
+        TableVersion.bump('radar')
+    verify_owners.short_description = "Give selected the Blue Tick"
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='bhandara_radar_bhandara_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """
+        Bulk upload of a CSV / NDJSON file (see bulk_import.py). Links without
+        coordinates in them are left to the coordinate queue, so the upload
+        never waits on Google Maps.
+        """
+        if not self.has_add_permission(request):
+            return redirect('admin:bhandara_radar_bhandara_changelist')
+
+        form = BhandaraUploadForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            file_format = form.cleaned_data['file_format'] or detect_format(upload.name)
+            if file_format is None:
+                form.add_error('file_format', 'Cannot tell the format from the file name; pick one.')
+            else:
+                importer = BhandaraImporter(approve=form.cleaned_data['approve']).import_file(upload, file_format)
+                self.message_user(
+                    request,
+                    f"Imported {importer.created} Bhandara(s); {importer.queued} queued for a coordinate lookup.",
+                    messages.SUCCESS,
+                )
+                for line_number, error in importer.errors[:10]:
+                    self.message_user(request, f"Line {line_number} skipped: {error}", messages.WARNING)
+                if len(importer.errors) > 10:
+                    self.message_user(request, f"... and {len(importer.errors) - 10} more invalid row(s).", messages.WARNING)
+                return redirect('admin:bhandara_radar_bhandara_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import Bhandara locations',
+            'form': form,
+        }
+        return render(request, 'admin/bhandara_radar/bhandara/import.html', context)
+
+
+@admin.register(BhandaraArchive)
+class BhandaraArchiveAdmin(admin.ModelAdmin):
+    list_display = ('area_name', 'business_name', 'is_approved', 'current_crowd_status', 'start_time', 'end_time', 'archived_at')
+    list_filter = ('is_approved', 'current_crowd_status', 'observed_crowd_status')
+    search_fields = ('area_name', 'business_name', 'organizer_name', 'menu_details')
+    date_hierarchy = 'start_time'
+
+
+@admin.register(CoordinateJob)
+class CoordinateJobAdmin(admin.ModelAdmin):
+    list_display = ('content_type', 'object_id', 'status', 'attempts', 'run_after', 'last_error')
+    list_filter = ('status', 'content_type')
+    search_fields = ('google_maps_url',)
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected lookups now')
+    def retry_jobs(self, request, queryset):
+        queryset.update(status='PENDING', attempts=0, run_after=timezone.now(), last_error='')
+
+
+
+@admin.register(ResolvedMapsUrl)
+class ResolvedMapsUrlAdmin(admin.ModelAdmin):
+    list_display = ('url', 'latitude', 'longitude', 'resolved_at', 'expires_at')
+    search_fields = ('url',)
@@ -0,0 +1,183 @@
+"""
+Bulk import of Bhandara locations from the CSV / NDJSON files organizers
+send us, used by the admin upload and `manage.py import_bhandaras`.
+
+Rows are read and validated one at a time and inserted with bulk_create in
+batches, so a file never sits in memory and nothing is saved row by row.
+bulk_create skips save() and the post_save receivers, so what they would
+do (coordinates, area score, coordinate queue, radar index, TableVersion,
+RadarEvents) is done here once per batch instead.
+"""
+import codecs
+import csv
+import json
+import os
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from .density import area_score
+from .forms import BhandaraImportForm
+from .geocoding import cached_coordinates, make_session, resolve_many
+from .models import Bhandara, CoordinateJob, RadarEvent, TableVersion, default_end_time
+from .spatial_index import bhandara_index
+
+FORMATS = ('csv', 'ndjson')
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+
+def detect_format(filename):
+    """'csv' or 'ndjson' from the file name's extension; None when it can't tell."""
+    return EXTENSIONS.get(os.path.splitext(filename or '')[1].lower())
+
+
+def read_rows(lines, file_format):
+    """
+    Yields (line_number, data, error) for every record of a file given as an
+    iterable of byte lines (an open binary file or an UploadedFile).
+    data is a dict of column -> value; error is set instead when the record
+    can't even be parsed.
+    """
+    if file_format == 'csv':
+        reader = csv.reader(codecs.iterdecode(lines, 'utf-8-sig'))
+        header = next(reader, None)
+        if header is None:
+            return
+        # "Google Maps URL" and "google_maps_url" are the same column
+        columns = [name.strip().lower().replace(' ', '_') for name in header]
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield reader.line_num, dict(zip(columns, values)), None
+    elif file_format == 'ndjson':
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(data, dict):
+                yield line_number, None, 'Expected a JSON object'
+                continue
+            yield line_number, data, None
+    else:
+        raise ValueError(f'Unknown import format: {file_format!r}')
+
+
+class BhandaraImporter:
+    """
+    Imports validated rows in batches of `batch_size` (one bulk_create and
+    one transaction each); invalid rows are skipped and reported in
+    `errors` as (line_number, message).
+
+    approve: the rows go live at once (a vetted file) instead of waiting for approval.
+    resolve: links without coordinates in them are looked up right away, with
+    at most `concurrency` Google Maps requests in flight (see
+    geocoding.resolve_many). Otherwise, and for lookups that fail, they are
+    queued for `manage.py resolve_coordinates`.
+    dry_run: validate only.
+    """
+
+    def __init__(self, batch_size=200, approve=False, resolve=False, concurrency=4, dry_run=False):
+        self.batch_size = batch_size
+        self.approve = approve
+        self.resolve = resolve
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+
+        self.valid = 0
+        self.created = 0
+        self.queued = 0
+        self.errors = []
+        self.now = timezone.now()
+        self._session = None
+
+    def import_file(self, lines, file_format):
+        batch = []
+        for line_number, data, error in read_rows(lines, file_format):
+            instance = self.validate(line_number, data, error)
+            if instance is None:
+                continue
+            self.valid += 1
+            batch.append(instance)
+            if len(batch) >= self.batch_size:
+                self.insert(batch)
+                batch = []
+        self.insert(batch)
+        return self
+
+    def validate(self, line_number, data, error=None):
+        """An unsaved Bhandara for a valid row; None (and an entry in errors) otherwise."""
+        if error is None:
+            form = BhandaraImportForm({name: value for name, value in data.items() if value not in ('', None)})
+            if form.is_valid():
+                instance = form.save(commit=False)
+                instance.is_approved = self.approve
+                # save() would fill the end time; past events go straight in as history
+                if instance.end_time is None and (self.approve or default_end_time(instance.start_time) <= self.now):
+                    instance.end_time = default_end_time(instance.start_time)
+                # A pending upcoming one gets its end time when approved, like a public submission
+                instance.is_active = instance.end_time is None or instance.end_time > self.now
+                return instance
+            error = '; '.join(
+                f"{name}: {' '.join(messages)}" if name != '__all__' else ' '.join(messages)
+                for name, messages in form.errors.items()
+            )
+        self.errors.append((line_number, error))
+        return None
+
+    def insert(self, batch):
+        if not batch or self.dry_run:
+            return
+
+        self.fill_coordinates(batch)
+        for bhandara in batch:
+            bhandara.area_score = area_score(bhandara.latitude, bhandara.longitude, bhandara.area_name)
+
+        with transaction.atomic():
+            created = Bhandara.objects.bulk_create(batch)
+
+            # What the coordinate queue would have picked up from save()
+            unresolved = [b for b in created if b.latitude is None or b.longitude is None]
+            content_type = ContentType.objects.get_for_model(Bhandara)
+            CoordinateJob.objects.bulk_create(
+                [CoordinateJob(content_type=content_type, object_id=b.pk, google_maps_url=b.google_maps_url) for b in unresolved],
+                ignore_conflicts=True,
+            )
+
+            # ...and what the post_save receivers would have done
+            live = [b for b in created if b.is_approved and b.is_active]
+            RadarEvent.record_live(live)
+            TableVersion.bump('radar')
+        for bhandara in live:
+            bhandara_index.sync(bhandara)
+
+        self.created += len(created)
+        self.queued += len(unresolved)
+
+    def fill_coordinates(self, batch):
+        missing = [b for b in batch if b.latitude is None or b.longitude is None]
+        if not missing:
+            return
+
+        if self.resolve:
+            if self._session is None:
+                self._session = make_session(self.concurrency)
+            found = resolve_many([b.google_maps_url for b in missing], self.concurrency, self._session)
+        else:
+            # Only what needs no network call: the link itself, or a lookup we cached before
+            found = {url: cached_coordinates(url) for url in dict.fromkeys(b.google_maps_url for b in missing)}
+
+        for bhandara in missing:
+            lat, lng, _ = found[bhandara.google_maps_url]
+            if lat is not None and lng is not None:
+                bhandara.latitude = lat
+                bhandara.longitude = lng
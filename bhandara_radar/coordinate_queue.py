@@ -0,0 +1,86 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CoordinateJob
+from .geocoding import resolve_many
+
+MAX_ATTEMPTS = getattr(settings, 'RADAR_GEOCODE_MAX_ATTEMPTS', 5)
+BACKOFF_SECONDS = getattr(settings, 'RADAR_GEOCODE_BACKOFF_SECONDS', 30)
+MAX_BACKOFF_SECONDS = 60 * 60
+# How long a claimed job stays reserved before another worker may take it over (crashed worker)
+LEASE_SECONDS = 120
+
+
+def claim_jobs(limit):
+    """
+    Reserves up to `limit` due jobs for this worker. A claimed job is pushed
+    LEASE_SECONDS into the future, so if the worker dies it simply comes due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job_ids = list(
+            CoordinateJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['PENDING', 'RUNNING'], run_after__lte=now)
+            .order_by('run_after')
+            .values_list('id', flat=True)[:limit]
+        )
+        CoordinateJob.objects.filter(id__in=job_ids).update(
+            status='RUNNING',
+            run_after=now + timedelta(seconds=LEASE_SECONDS),
+        )
+    return list(CoordinateJob.objects.filter(id__in=job_ids).select_related('content_type'))
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with jitter: ~30s, 60s, 120s, ... capped at an hour."""
+    delay = min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def finish_job(job, coordinates, error=''):
+    """Writes the looked-up coordinates to the row, or schedules a retry."""
+    lat, lng = coordinates
+    target = job.target
+
+    if target is None:
+        job.delete() # Row was deleted while waiting
+        return 'DONE'
+
+    if lat is not None and lng is not None:
+        target.latitude = lat
+        target.longitude = lng
+        # A normal save so post_save listeners (the radar index) see the new location
+        target.save(update_fields=['latitude', 'longitude'])
+        job.status = 'DONE'
+        job.last_error = ''
+    else:
+        job.attempts += 1
+        job.last_error = (error or 'No coordinates found in the resolved URL')[:255]
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = 'FAILED'
+        else:
+            job.status = 'PENDING'
+            job.run_after = timezone.now() + backoff_delay(job.attempts)
+
+    job.save()
+    return job.status
+
+
+def run_jobs(jobs, concurrency):
+    """
+    Looks up the coordinates of `jobs` with at most `concurrency` Google Maps
+    requests in flight (see geocoding.resolve_many), then records each outcome.
+    Returns {status: count}.
+    """
+    resolved = resolve_many([job.google_maps_url for job in jobs], concurrency)
+
+    summary = {}
+    for job in jobs:
+        lat, lng, error = resolved[job.google_maps_url]
+        status = finish_job(job, (lat, lng), error)
+        summary[status] = summary.get(status, 0) + 1
+    return summary
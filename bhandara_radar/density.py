@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+MAX_SCORE = 10
+
+
+def grid_cells(lats, lngs, cell_degrees):
+    """(rows, cols) integer arrays of the grid cells the points fall in."""
+    rows = np.floor(np.asarray(lats, dtype=np.float64) / cell_degrees).astype(np.int64)
+    cols = np.floor(np.asarray(lngs, dtype=np.float64) / cell_degrees).astype(np.int64)
+    return rows, cols
+
+
+def density_scores(lats, lngs, cell_degrees, weights=None):
+    """
+    Scores every cell in or next to an observed point from 1 to 10.
+
+    Each cell counts the points in itself and its 8 neighbours (so a spot on a
+    cell edge is not scored as isolated), and the counts are ranked: the
+    busiest tenth of the cells scores 10, the quietest tenth 1.
+    Returns (rows, cols, observations, scores) arrays.
+    """
+    rows, cols = grid_cells(lats, lngs, cell_degrees)
+    weights = np.ones(len(rows), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+    if not len(rows):
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty, empty
+
+    # Spread every point over its 3 x 3 block of cells, then add up per cell
+    offsets = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)]
+    spread_rows = np.concatenate([rows + dr for dr, _ in offsets])
+    spread_cols = np.concatenate([cols + dc for _, dc in offsets])
+    cells, inverse = np.unique(np.column_stack([spread_rows, spread_cols]), axis=0, return_inverse=True)
+    observations = np.bincount(inverse.ravel(), weights=np.tile(weights, len(offsets))).astype(np.int64)
+
+    # Rank-based, so one huge hotspot doesn't squash every other cell down to 1
+    ranked = np.sort(observations)
+    below = np.searchsorted(ranked, observations, side='left')
+    scores = np.minimum(1 + below * MAX_SCORE // len(observations), MAX_SCORE)
+    return cells[:, 0], cells[:, 1], observations, scores
+
+
+class DensityGrid:
+    """
+    This process's copy of the DensityCell table (built by `manage.py
+    build_density_grid`): a {(row, col): score} dict, so scoring a location
+    is one dict lookup. Reloaded when TableVersion('density') moves on
+    (checked every RADAR_DENSITY_CHECK_SECONDS) and at least every
+    RADAR_DENSITY_MAX_AGE seconds.
+    """
+
+    def __init__(self, cell_degrees=0.01, max_age=3600, check_interval=10):
+        self.cell_degrees = cell_degrees
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.version = None
+        self._scores = {}
+        self._loaded_at = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def ensure_fresh(self, version=None):
+        """
+        Reloads the grid when it is too old, or older than `version` (when not
+        given, TableVersion('density') is read if the last check is older
+        than check_interval).
+        """
+        from .models import TableVersion
+
+        with self._lock:
+            now = time.monotonic()
+            if version is None and (self._checked_at is None or now - self._checked_at >= self.check_interval):
+                version, _ = TableVersion.current('density')
+                self._checked_at = now
+            if (
+                self._loaded_at is None
+                or now - self._loaded_at > self.max_age
+                or (version is not None and (self.version is None or self.version < version))
+            ):
+                self.reload()
+        return self
+
+    def reload(self):
+        from .models import DensityCell, TableVersion
+
+        # Counter first: the cells read after it are at least that new
+        version, _ = TableVersion.current('density')
+        self._scores = {(row, col): score for row, col, score in DensityCell.objects.values_list('row', 'col', 'score')}
+        self._loaded_at = self._checked_at = time.monotonic()
+        self.version = version
+
+    def score(self, lat, lng):
+        """The score of the location's cell; None if nothing was seen in or next to it."""
+        cell = (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+        return self._scores.get(cell)
+
+
+density_grid = DensityGrid(
+    cell_degrees=getattr(settings, 'RADAR_DENSITY_CELL_DEGREES', 0.01),
+    max_age=getattr(settings, 'RADAR_DENSITY_MAX_AGE', 3600),
+    check_interval=getattr(settings, 'RADAR_DENSITY_CHECK_SECONDS', 10),
+)
+
+
+def area_score(latitude, longitude, area_name=None):
+    """
+    The crowd model's area_score feature for one location: the density grid
+    score of its cell, or the old area-name guess while the row has no
+    coordinates or the grid has seen nothing around them (no grid built yet,
+    or a place no one has been to).
+    """
+    if latitude is not None and longitude is not None:
+        score = density_grid.ensure_fresh().score(latitude, longitude)
+        if score is not None:
+            return score
+
+    from .ml_engine.predict import get_area_score
+    return get_area_score(area_name)
@@ -0,0 +1,154 @@
+"""
+Live radar updates pushed to browsers over Server-Sent Events.
+
+Every change (see models.RadarEvent) is written to the database, by
+whichever process made it. Each ASGI worker runs one broadcaster task that
+tails that table and fans new events out to all of its connected clients,
+so the database sees one small query per worker per interval instead of
+one per client.
+"""
+import asyncio
+
+from django.conf import settings
+
+from upzunction.serialization import dumps
+
+# Events sent to a client per replay query, and buffered per client before it is dropped
+BATCH_SIZE = 500
+# Ids are handed out at insert but show up at commit, so a lower id can appear after higher ones
+# were read: the broadcaster looks skipped ids up again for this long (seconds)
+LATE_COMMIT_SECONDS = 30
+
+
+def sse_message(event):
+    """One RadarEvent as an SSE message; the id lets the browser resume with Last-Event-ID."""
+    return b'id: %d\nevent: %s\ndata: %s\n\n' % (event.pk, event.kind.encode(), dumps(event.as_dict()))
+
+
+async def latest_event_id():
+    from .models import RadarEvent
+
+    latest = await RadarEvent.objects.order_by('-id').values_list('id', flat=True).afirst()
+    return latest or 0
+
+
+async def events_since(cursor, limit=BATCH_SIZE):
+    from .models import RadarEvent
+
+    return [event async for event in RadarEvent.objects.filter(id__gt=cursor).order_by('id')[:limit].aiterator()]
+
+
+async def events_by_id(ids):
+    from .models import RadarEvent
+
+    return [event async for event in RadarEvent.objects.filter(id__in=list(ids)).order_by('id').aiterator()]
+
+
+class RadarBroadcaster:
+    """
+    Fans RadarEvents out to the subscribers of this process. The polling task
+    starts with the first subscriber and stops when the last one leaves.
+    A client too slow to keep up is disconnected; its browser reconnects with
+    Last-Event-ID and catches up from the database.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._subscribers = set()
+        self._task = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, cursor):
+        """
+        A queue of the events after `cursor`. A broadcaster already running
+        may be past it: the subscriber replays from the database afterwards.
+        """
+        queue = asyncio.Queue(maxsize=BATCH_SIZE)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(cursor))
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    async def _run(self, cursor):
+        loop = asyncio.get_running_loop()
+        # Skipped ids -> when they were first missed
+        missing = {}
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            now = loop.time()
+            missing = {pk: since for pk, since in missing.items() if now - since < LATE_COMMIT_SECONDS}
+            late = await events_by_id(missing) if missing else []
+            for event in late:
+                del missing[event.pk]
+            events = await events_since(cursor)
+            if events:
+                read = {event.pk for event in events}
+                for pk in range(max(cursor, events[-1].pk - BATCH_SIZE) + 1, events[-1].pk):
+                    if pk not in read:
+                        missing[pk] = now
+                cursor = events[-1].pk
+            events = late + events
+            if not events:
+                continue
+            for queue in list(self._subscribers):
+                for event in events:
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        self._drop(queue)
+                        break
+        self._task = None
+
+    def _drop(self, queue):
+        self.unsubscribe(queue)
+        # The client resumes from the last event it actually received, so the buffer can go
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+broadcaster = RadarBroadcaster(poll_interval=getattr(settings, 'RADAR_EVENT_POLL_SECONDS', 1.0))
+
+
+async def event_stream(cursor=None, heartbeat=15.0):
+    """
+    SSE body for one client: everything after `cursor` (from the database),
+    then live events from the broadcaster. Comment lines every `heartbeat`
+    seconds keep proxies from closing an idle connection.
+    """
+    fresh = cursor is None
+    if fresh:
+        cursor = await latest_event_id()
+    # Subscribe from the replay cursor before replaying, so nothing falls
+    # between the two; what both deliver is sent once
+    queue = broadcaster.subscribe(cursor)
+    replayed = set()
+    try:
+        if fresh:
+            yield b'id: %d\nevent: ready\ndata: {}\n\n' % cursor
+        while True:
+            backlog = await events_since(cursor)
+            for event in backlog:
+                replayed.add(event.pk)
+                yield sse_message(event)
+            if not backlog:
+                break
+            cursor = backlog[-1].pk
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            if event is None:
+                return # Fell behind: the browser reconnects and replays from its last id
+            if event.pk not in replayed:
+                yield sse_message(event)
+    finally:
+        broadcaster.unsubscribe(queue)
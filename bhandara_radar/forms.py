@@ -1,11 +1,12 @@
 from django import forms
+from django.utils import timezone
 from .models import Bhandara
 
 class BhandaraSubmitForm(forms.ModelForm):
     class Meta:
         model = Bhandara
         # We ONLY want the public to fill out these specific fields
-        fields = ['google_maps_url', 'area_name', 'organizer_name', 'business_name', 'menu_details']
+        fields = ['google_maps_url', 'area_name', 'organizer_name', 'business_name', 'menu_details', 'end_time']
         
         widgets = {
             'google_maps_url': forms.URLInput(attrs={'class': 'form-control', 'placeholder': 'Paste Google Maps Share Link Here...', 'required': True}),
@@ -13,4 +14,48 @@ class BhandaraSubmitForm(forms.ModelForm):
             'organizer_name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Your Name (Optional)'}),
             'business_name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Business/Shop Name (Optional)'}),
             'menu_details': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g., Poori-Sabzi, Halwa (Optional)'}),
-        }
\ No newline at end of file
+            'end_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        }
+
+    def clean_end_time(self):
+        end_time = self.cleaned_data['end_time']
+        if end_time is not None and end_time <= timezone.now():
+            raise forms.ValidationError('The end time has already passed.')
+        return end_time
+
+class BhandaraImportForm(forms.ModelForm):
+    """Validates one row of a bulk import file (see bulk_import.py)."""
+    class Meta:
+        model = Bhandara
+        fields = ['google_maps_url', 'area_name', 'organizer_name', 'business_name', 'menu_details', 'start_time', 'end_time', 'latitude', 'longitude']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Spreadsheets mostly list places that are on now
+        self.fields['start_time'].required = False
+
+    def clean_start_time(self):
+        return self.cleaned_data['start_time'] or timezone.now()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        lat, lng = cleaned_data.get('latitude'), cleaned_data.get('longitude')
+        if (lat is None) != (lng is None):
+            raise forms.ValidationError('Give both latitude and longitude, or neither.')
+        if lat is not None and not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise forms.ValidationError('Latitude/longitude out of range.')
+        start_time, end_time = cleaned_data.get('start_time'), cleaned_data.get('end_time')
+        if start_time and end_time and end_time <= start_time:
+            raise forms.ValidationError('end_time must be after start_time.')
+        return cleaned_data
+
+
+class BhandaraUploadForm(forms.Form):
+    """The admin's bulk import upload."""
+    file = forms.FileField(help_text='CSV with a header row, or NDJSON (one JSON object per line).')
+    file_format = forms.ChoiceField(
+        choices=[('', 'From the file name'), ('csv', 'CSV'), ('ndjson', 'NDJSON')],
+        required=False,
+        label='Format',
+    )
+    approve = forms.BooleanField(required=False, help_text='Put every imported location live right away.')
@@ -0,0 +1,106 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ResolvedMapsUrl
+from .utils import MAPS_HEADERS, parse_coordinates, normalize_maps_url, expand_maps_url
+
+CACHE_TTL = timedelta(seconds=getattr(settings, 'RADAR_MAPS_CACHE_TTL', 30 * 24 * 60 * 60))
+NEGATIVE_CACHE_TTL = timedelta(seconds=getattr(settings, 'RADAR_MAPS_NEGATIVE_CACHE_TTL', 60 * 60))
+
+
+def _url_hash(url):
+    return hashlib.sha256(normalize_maps_url(url).encode()).hexdigest()
+
+
+def cached_coordinates(url):
+    """
+    Coordinates we can get without touching the network: parsed from the URL
+    itself, or from an unexpired cache entry.
+    Returns (lat, lng, hit) - hit is False when only a network lookup can tell.
+    """
+    lat, lng = parse_coordinates(url)
+    if lat is not None:
+        return lat, lng, True
+
+    entry = ResolvedMapsUrl.objects.filter(
+        url_hash=_url_hash(url),
+        expires_at__gt=timezone.now()
+    ).values_list('latitude', 'longitude').first()
+    if entry is None:
+        return None, None, False
+    return entry[0], entry[1], True
+
+
+def remember_coordinates(url, lat, lng):
+    """Stores a network lookup result (positive or negative) in the cache."""
+    now = timezone.now()
+    ResolvedMapsUrl.objects.update_or_create(
+        url_hash=_url_hash(url),
+        defaults={
+            'url': normalize_maps_url(url)[:500],
+            'latitude': lat,
+            'longitude': lng,
+            'resolved_at': now,
+            'expires_at': now + (CACHE_TTL if lat is not None else NEGATIVE_CACHE_TTL),
+        },
+    )
+
+
+def make_session(pool_size=4):
+    """A keep-alive session whose connection pool fits `pool_size` threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(MAPS_HEADERS)
+    return session
+
+
+def resolve_many(urls, concurrency=4, session=None):
+    """
+    Resolves a batch of Maps links. Offline parses and cache hits are answered
+    first; each remaining distinct link is looked up once, with at most
+    `concurrency` requests in flight over one shared keep-alive session.
+    Database reads and writes all happen on the calling thread.
+
+    Returns {url: (lat, lng, error)}: lat/lng are None when nothing was found,
+    and error is only set for network failures (worth retrying later).
+    """
+    results = {}
+    pending = {}
+    for url in dict.fromkeys(urls):
+        lat, lng, hit = cached_coordinates(url)
+        if hit:
+            results[url] = (lat, lng, '')
+        else:
+            pending.setdefault(normalize_maps_url(url), []).append(url)
+
+    if not pending:
+        return results
+
+    session = session or make_session(concurrency)
+
+    def lookup(url):
+        try:
+            return parse_coordinates(expand_maps_url(url, session)), ''
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        lookups = zip(pending, pool.map(lookup, pending))
+
+        for normalized, (coordinates, error) in lookups:
+            if coordinates is None:
+                lat, lng = None, None # Network error: never cached
+            else:
+                lat, lng = coordinates
+                remember_coordinates(normalized, lat, lng)
+            for url in pending[normalized]:
+                results[url] = (lat, lng, error)
+    return results
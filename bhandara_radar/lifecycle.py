@@ -0,0 +1,62 @@
+"""
+End of a Bhandara's life, run by `manage.py expire_bhandaras`: rows past
+their end_time are taken off the radar (is_active=False), and rows that
+ended RADAR_ARCHIVE_AFTER_DAYS ago move to BhandaraArchive, so the live
+table and its indexes only ever hold current events.
+
+Both steps work through the rows chunk_size at a time, one short
+transaction per chunk, and do what update()/delete() skip in post_save.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from .models import Bhandara, BhandaraArchive, CoordinateJob, RadarEvent, TableVersion
+from .spatial_index import bhandara_index
+
+# Columns copied into the archive ('id' becomes original_id)
+ARCHIVE_COLUMNS = (
+    'id', 'google_maps_url', 'latitude', 'longitude', 'area_name', 'organizer_name', 'business_name',
+    'menu_details', 'start_time', 'end_time', 'current_crowd_status', 'observed_crowd_status', 'crowd_observed_at',
+    'crowd_recorded_at', 'area_score', 'is_approved', 'is_verified_owner',
+)
+
+
+def deactivate_expired(now, chunk_size=500):
+    """Switches off every active Bhandara whose end_time has passed. Returns how many."""
+    expired = Bhandara.objects.filter(is_active=True, end_time__lte=now)
+    total = 0
+    while True:
+        rows = list(expired.values_list('id', 'is_approved')[:chunk_size])
+        if not rows:
+            break
+        ids = [bhandara_id for bhandara_id, _ in rows]
+        with transaction.atomic():
+            Bhandara.objects.filter(pk__in=ids).update(is_active=False)
+            # Connected radar clients drop the ones they were showing
+            RadarEvent.record_gone([bhandara_id for bhandara_id, is_approved in rows if is_approved])
+            version = TableVersion.bump('radar')
+        bhandara_index.remove(ids, version)
+        total += len(ids)
+    return total
+
+
+def archive_ended(cutoff, chunk_size=500):
+    """Moves the inactive Bhandaras that ended before `cutoff` into BhandaraArchive. Returns how many."""
+    ended = Bhandara.objects.filter(is_active=False, end_time__lte=cutoff).order_by('pk')
+    content_type = ContentType.objects.get_for_model(Bhandara)
+    total = 0
+    while True:
+        rows = list(ended.values(*ARCHIVE_COLUMNS)[:chunk_size])
+        if not rows:
+            break
+        ids = [row['id'] for row in rows]
+        with transaction.atomic():
+            # ignore_conflicts: a chunk copied by an interrupted run is simply deleted this time
+            BhandaraArchive.objects.bulk_create(
+                [BhandaraArchive(original_id=row.pop('id'), **row) for row in rows],
+                ignore_conflicts=True,
+            )
+            CoordinateJob.objects.filter(content_type=content_type, object_id__in=ids).delete()
+            Bhandara.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+    return total
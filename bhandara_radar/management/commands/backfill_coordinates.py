@@ -0,0 +1,113 @@
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils.text import capfirst
+
+from bhandara_radar.density import area_score
+from bhandara_radar.geocoding import make_session, resolve_many
+from bhandara_radar.models import Bhandara, CoordinateJob, TableVersion
+from bhandara_radar.spatial_index import bhandara_index
+from tourism.models import SpotCard, TouristSpot
+
+class Command(BaseCommand):
+    help = 'Resolves coordinates for every Bhandara and Tourist Spot that is still missing them.'
+
+    MODELS = {
+        'bhandara': Bhandara,
+        'touristspot': TouristSpot,
+    }
+    # TableVersion counter each model's read APIs are validated against
+    TABLES = {
+        'bhandara': 'radar',
+        'touristspot': 'tourism',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(self.MODELS), action='append',
+                            help='Only backfill this model (can be repeated). Default: all.')
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'RADAR_GEOCODE_CONCURRENCY', 4) * 2,
+                            help='Maximum number of Google Maps lookups in flight at once.')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Rows resolved and written back per bulk_update.')
+
+    def handle(self, *args, **options):
+        session = make_session(options['concurrency'])
+
+        for name in options['model'] or sorted(self.MODELS):
+            self.backfill(self.MODELS[name], session, options['concurrency'], options['batch_size'])
+            # bulk_update skips post_save: tell the read APIs' ETags the rows changed
+            TableVersion.bump(self.TABLES[name])
+
+        # bulk_update skips post_save, so the radar index must reload from the database
+        bhandara_index.invalidate()
+
+    def backfill(self, model, session, concurrency, batch_size):
+        missing = model.objects.filter(
+            Q(latitude__isnull=True) | Q(longitude__isnull=True)
+        ).exclude(google_maps_url='').order_by('pk')
+        content_type = ContentType.objects.get_for_model(model)
+        label = capfirst(model._meta.verbose_name_plural)
+        fields = ['latitude', 'longitude']
+        if model is Bhandara:
+            # What Bhandara.save() does when the coordinates change
+            fields += ['area_score', 'crowd_status_updated_at']
+        columns = ['pk', 'google_maps_url', *fields] + (['area_name'] if model is Bhandara else [])
+
+        started = time.perf_counter()
+        scanned = resolved = not_found = errors = 0
+        last_pk = 0
+
+        while True:
+            # Keyset pagination: rows that stay unresolved don't shift the next page
+            rows = list(missing.filter(pk__gt=last_pk).only(*columns)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            scanned += len(rows)
+
+            results = resolve_many([row.google_maps_url for row in rows], concurrency, session)
+
+            updated = []
+            for row in rows:
+                lat, lng, error = results[row.google_maps_url]
+                if lat is not None and lng is not None:
+                    row.latitude = lat
+                    row.longitude = lng
+                    if model is Bhandara:
+                        self.rescore(row)
+                    updated.append(row)
+                elif error:
+                    errors += 1
+                else:
+                    not_found += 1
+
+            model.objects.bulk_update(updated, fields)
+            if model is TouristSpot:
+                # bulk_update skips post_save, which keeps the tourism APIs' spot cards current
+                SpotCard.refresh([row.pk for row in updated])
+            # The queue has nothing left to do for these rows
+            CoordinateJob.objects.filter(
+                content_type=content_type,
+                object_id__in=[row.pk for row in updated]
+            ).update(status='DONE', last_error='')
+            resolved += len(updated)
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{label}: {scanned} scanned, {resolved} resolved ({scanned / elapsed:.1f} rows/s)')
+
+        elapsed = time.perf_counter() - started
+        rate = scanned / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: resolved {resolved} of {scanned} row(s) in {elapsed:.1f}s '
+            f'({rate:.1f} rows/s); {not_found} without coordinates, {errors} network error(s).'
+        ))
+
+    def rescore(self, bhandara):
+        """The area score from the new coordinates (the name-based fallback until now)."""
+        score = area_score(bhandara.latitude, bhandara.longitude, bhandara.area_name)
+        if score != bhandara.area_score:
+            bhandara.area_score = score
+            bhandara.crowd_status_updated_at = None # Its snapshot was scored from the old area score
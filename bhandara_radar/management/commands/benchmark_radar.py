@@ -0,0 +1,217 @@
+import json
+import os
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from bhandara_radar.models import Bhandara, TableVersion
+from bhandara_radar.ml_engine.predict import get_live_crowd_prediction, get_live_crowd_predictions, get_smart_alternatives
+from bhandara_radar.nearest_cache import nearest_cache
+from bhandara_radar.spatial_index import bhandara_index
+from bhandara_radar.utils import calculate_haversine_distance, haversine_distances
+from tourism.models import City, SpotCard, State, TouristSpot
+
+# Seeded rows are spread over ~60 x 60 km around the center of Lucknow
+CENTER = (26.8467, 80.9462)
+SPREAD_DEGREES = 0.3
+AREAS = ['Alambagh', 'Hazratganj', 'Gomti Nagar', 'Charbagh', 'Aminabad', 'Jankipuram', 'Indira Nagar']
+
+class Command(BaseCommand):
+    help = ('Benchmarks the radar hot paths (distance, crowd prediction, smart alternatives and both nearest APIs) '
+            'on a throwaway test database seeded with N live rows, and saves the timings as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 1000, 10000, 100000],
+                            help='Numbers of live Bhandaras and Tourist Spots to benchmark at.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per case (after one warm-up run).')
+        parser.add_argument('--budget', type=float, default=10.0,
+                            help='Stop repeating a case after this many seconds (it still runs at least once).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='JSON file to write (default: benchmarks/radar-<timestamp>.json).')
+        parser.add_argument('--compare', help='An earlier results file; prints the median change per case.')
+
+    def handle(self, *args, **options):
+        if min(options['sizes']) < 1:
+            raise CommandError('--sizes must be positive.')
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"radar-{timezone.now():%Y%m%d-%H%M%S}.json"
+        )
+
+        # Never touch the real data: everything runs in a fresh test database
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Repeating one URL would only time nearest_cache hits: time the full ranking instead
+        cache_precision, nearest_cache.precision = nearest_cache.precision, 0
+        try:
+            results = self.run_benchmarks(options)
+        finally:
+            nearest_cache.precision = cache_precision
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'spatial_index': getattr(settings, 'RADAR_SPATIAL_INDEX', False),
+            'nearest_cache': False,
+            'seed': options['seed'],
+            'results': results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run_benchmarks(self, options):
+        rng = random.Random(options['seed'])
+        client = Client()
+        user = User.objects.create(username='benchmark')
+        city = City.objects.create(name='Lucknow', state=State.objects.create(name='Uttar Pradesh'))
+
+        results = []
+        for size in sorted(set(options['sizes'])):
+            self.seed_rows(rng, size, user, city)
+            self.stdout.write(f'--- {size} live row(s) ---')
+
+            user_lat, user_lng = self.random_point(rng)
+            bhandaras = Bhandara.objects.filter(is_approved=True)
+            lats, lngs, scores = map(list, zip(*bhandaras.values_list('latitude', 'longitude', 'area_score')))
+            target_id = bhandaras.values_list('id', flat=True).first()
+
+            cases = [
+                ('calculate_haversine_distance (every row)',
+                 lambda: [calculate_haversine_distance(user_lat, user_lng, lat, lng) for lat, lng in zip(lats, lngs)]),
+                ('haversine_distances (every row)',
+                 lambda: haversine_distances(user_lat, user_lng, lats, lngs)),
+                ('get_live_crowd_prediction (one row)',
+                 lambda: get_live_crowd_prediction(scores[0])),
+                ('get_live_crowd_predictions (every row)',
+                 lambda: get_live_crowd_predictions(scores)),
+                ('get_smart_alternatives (one row)',
+                 lambda: get_smart_alternatives(target_id, user_lat, user_lng, bhandaras)),
+                ('bhandara_index.rebuild',
+                 bhandara_index.rebuild),
+                ('GET /radar/api/nearest/?k=50',
+                 lambda: self.get(client, f'/radar/api/nearest/?lat={user_lat}&lng={user_lng}&k=50', 'bhandaras')),
+                ('GET /radar/api/nearest/ (every row, as the feed page asks)',
+                 lambda: self.get(client, f'/radar/api/nearest/?lat={user_lat}&lng={user_lng}', 'bhandaras')),
+                ('GET /tourism/api/nearest/?k=50',
+                 lambda: self.get(client, f'/tourism/api/nearest/?lat={user_lat}&lng={user_lng}&k=50', 'spots')),
+            ]
+            for name, func in cases:
+                timings = self.measure(func, options['repeat'], options['budget'])
+                result = dict(case=name, rows=size, **timings)
+                results.append(result)
+                self.stdout.write(
+                    f"{name:<60} median {result['median_ms']:>10.3f} ms   p95 {result['p95_ms']:>10.3f} ms   ({result['runs']} runs)"
+                )
+        return results
+
+    def random_point(self, rng):
+        return (CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES))
+
+    def seed_rows(self, rng, size, user, city):
+        """Tops both tables up to `size` live rows (bulk_create: no geocoding, no signals, so their work is done here)."""
+        now = timezone.now()
+
+        missing = size - Bhandara.objects.count()
+        bhandaras = []
+        for _ in range(max(missing, 0)):
+            lat, lng = self.random_point(rng)
+            bhandaras.append(Bhandara(
+                google_maps_url=f'https://www.google.com/maps/@{lat},{lng},17z',
+                latitude=lat,
+                longitude=lng,
+                area_name=rng.choice(AREAS),
+                area_score=rng.randint(1, 10),
+                start_time=now,
+                is_approved=True,
+            ))
+        Bhandara.objects.bulk_create(bhandaras, batch_size=2000)
+
+        missing = size - TouristSpot.objects.count()
+        spots = []
+        for i in range(max(missing, 0)):
+            lat, lng = self.random_point(rng)
+            spots.append(TouristSpot(
+                user=user,
+                city=city,
+                name=f'Spot {i}',
+                google_maps_url=f'https://www.google.com/maps/@{lat},{lng},17z',
+                latitude=lat,
+                longitude=lng,
+                area_name=rng.choice(AREAS),
+                rating=round(rng.uniform(0, 5), 1),
+                is_approved=True,
+            ))
+        TouristSpot.objects.bulk_create(spots, batch_size=2000)
+
+        # bulk_create skips post_save: the radar index reloads from the database,
+        # and the tourism nearest API reads spot cards, not TouristSpot
+        bhandara_index.invalidate()
+        SpotCard.refresh()
+        TableVersion.bump('tourism')
+
+    def get(self, client, url, rows_key=None):
+        """GETs url and reads the whole body; with rows_key, the response must have rows in it."""
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url} returned {response.status_code}')
+        if response.streaming:
+            body = b''.join(response.streaming_content) # Streamed bodies are only encoded while being read
+        else:
+            body = response.content
+        if rows_key and not json.loads(body)[rows_key]:
+            raise CommandError(f'{url} returned no {rows_key}')
+        return response
+
+    def measure(self, func, repeat, budget):
+        func() # Warm-up: caches, the spatial index, the crowd model
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < repeat and (not timings or time.perf_counter() - started < budget):
+            run_started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - run_started) * 1000)
+
+        timings.sort()
+        return {
+            'runs': len(timings),
+            'min_ms': round(timings[0], 4),
+            'median_ms': round(statistics.median(timings), 4),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+            'mean_ms': round(statistics.fmean(timings), 4),
+        }
+
+    def compare(self, path, results):
+        with open(path) as f:
+            previous = {(r['case'], r['rows']): r for r in json.load(f)['results']}
+
+        self.stdout.write(f'--- Compared with {path} (median) ---')
+        for result in results:
+            before = previous.get((result['case'], result['rows']))
+            if before is None:
+                continue
+            change = (result['median_ms'] / before['median_ms'] - 1) * 100 if before['median_ms'] else 0
+            self.stdout.write(
+                f"{result['case']:<60} {result['rows']:>7} rows: "
+                f"{before['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({change:+.1f}%)"
+            )
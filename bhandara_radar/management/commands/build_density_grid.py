@@ -0,0 +1,96 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bhandara_radar.density import density_grid, density_scores
+from bhandara_radar.ml_engine.predict import get_area_score
+from bhandara_radar.models import Bhandara, BhandaraArchive, DensityCell, TableVersion
+from social.models import Post
+from tourism.models import TouristSpot
+
+class Command(BaseCommand):
+    help = 'Rebuilds the area-density grid from Bhandara (live and archived), Tourist Spot and Post locations, and re-scores every Bhandara.'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        cell_degrees = density_grid.cell_degrees
+
+        # Past seasons count too: archived Bhandaras say where people gather just as well
+        points = []
+        for model in (Bhandara, BhandaraArchive):
+            points += model.objects.filter(is_approved=True, latitude__isnull=False, longitude__isnull=False).values_list(
+                'latitude', 'longitude', 'area_name'
+            )
+        points += TouristSpot.objects.filter(is_approved=True, latitude__isnull=False, longitude__isnull=False).values_list(
+            'latitude', 'longitude', 'area_name'
+        )
+        lats = [lat for lat, _, _ in points]
+        lngs = [lng for _, lng, _ in points]
+        weights = [1] * len(points)
+
+        # Posts only name a Location, so they count at the centre of the places with that area name
+        centres = self.area_centres(points)
+        post_counts = Counter(
+            name.strip().lower() for name in Post.objects.filter(is_active=True, location__isnull=False).values_list('location__name', flat=True)
+        )
+        placed_posts = 0
+        for name, count in post_counts.items():
+            if name in centres:
+                lats.append(centres[name][0])
+                lngs.append(centres[name][1])
+                weights.append(count)
+                placed_posts += count
+
+        rows, cols, observations, scores = density_scores(lats, lngs, cell_degrees, weights)
+        with transaction.atomic():
+            DensityCell.objects.all().delete()
+            DensityCell.objects.bulk_create(
+                [
+                    DensityCell(row=int(row), col=int(col), observations=int(count), score=int(score))
+                    for row, col, count, score in zip(rows, cols, observations, scores)
+                ],
+                batch_size=1000,
+            )
+            # Other processes reload their copy when they see it
+            TableVersion.bump('density')
+        density_grid.reload()
+
+        rescored = self.rescore_bhandaras()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Density grid: {len(rows)} cell(s) from {len(points)} location(s) and {placed_posts} post(s); '
+            f'{rescored} Bhandara(s) re-scored ({elapsed:.2f}s).'
+        ))
+
+    def area_centres(self, points):
+        """{area name: (mean lat, mean lng)} of the located rows."""
+        sums = {}
+        for lat, lng, name in points:
+            if name:
+                total = sums.setdefault(name.strip().lower(), [0.0, 0.0, 0])
+                total[0] += lat
+                total[1] += lng
+                total[2] += 1
+        return {name: (lat / n, lng / n) for name, (lat, lng, n) in sums.items()}
+
+    def rescore_bhandaras(self):
+        if not len(density_grid):
+            return 0 # Nothing located yet: rows keep their area-name scores
+        changed = []
+        rows = Bhandara.objects.filter(latitude__isnull=False, longitude__isnull=False).only(
+            'id', 'latitude', 'longitude', 'area_name', 'area_score', 'crowd_status_updated_at'
+        )
+        for bhandara in rows.iterator(chunk_size=2000):
+            score = density_grid.score(bhandara.latitude, bhandara.longitude)
+            if score is None: # Nothing seen around it: what area_score() falls back to
+                score = get_area_score(bhandara.area_name)
+            if score != bhandara.area_score:
+                bhandara.area_score = score
+                bhandara.crowd_status_updated_at = None # Its snapshot was scored from the old area score
+                changed.append(bhandara)
+        Bhandara.objects.bulk_update(changed, ['area_score', 'crowd_status_updated_at'], batch_size=500)
+        if changed:
+            TableVersion.bump('radar') # New scores can change crowd predictions
+        return len(changed)
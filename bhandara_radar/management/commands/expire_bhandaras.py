@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bhandara_radar.lifecycle import archive_ended, deactivate_expired
+
+class Command(BaseCommand):
+    help = ('Takes Bhandaras past their end time off the radar and moves the ones that ended '
+            'RADAR_ARCHIVE_AFTER_DAYS ago to the archive table (run every few minutes).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per update / archive transaction.')
+        parser.add_argument('--archive-after-days', type=float, default=getattr(settings, 'RADAR_ARCHIVE_AFTER_DAYS', 7),
+                            help='Archive Bhandaras that ended this many days ago.')
+        parser.add_argument('--every', type=int, default=0,
+                            help='Keep running in-process and repeat every N seconds (default: run once, for cron).')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        while True:
+            self.expire(options)
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def expire(self, options):
+        started = time.perf_counter()
+        now = timezone.now()
+        deactivated = deactivate_expired(now, options['chunk_size'])
+        archived = archive_ended(now - timedelta(days=options['archive_after_days']), options['chunk_size'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{deactivated} ended Bhandara(s) taken off the radar, {archived} archived ({elapsed:.2f}s).'
+        ))
@@ -0,0 +1,67 @@
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bhandara_radar.bulk_import import FORMATS, BhandaraImporter, detect_format
+
+# Invalid rows listed in the output (the rest are only counted)
+MAX_REPORTED_ERRORS = 50
+
+class Command(BaseCommand):
+    help = ('Imports Bhandara locations from a CSV (with a header row) or NDJSON file. Columns: google_maps_url, '
+            'area_name, organizer_name, business_name, menu_details, start_time, end_time, latitude, longitude.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import ('-' reads standard input).")
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension (.csv, .ndjson, .jsonl).')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows per bulk_create.')
+        parser.add_argument('--approve', action='store_true', help='Put the imported locations live right away.')
+        parser.add_argument('--queue-lookups', action='store_true',
+                            help='Leave links without coordinates to the coordinate queue instead of looking them up now.')
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'RADAR_GEOCODE_CONCURRENCY', 4) * 2,
+                            help='Maximum number of Google Maps lookups in flight at once.')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the file.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        if file_format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        importer = BhandaraImporter(
+            batch_size=options['batch_size'],
+            approve=options['approve'],
+            resolve=not options['queue_lookups'],
+            concurrency=options['concurrency'],
+            dry_run=options['dry_run'],
+        )
+
+        started = time.perf_counter()
+        if options['path'] == '-':
+            importer.import_file(sys.stdin.buffer, file_format)
+        else:
+            try:
+                f = open(options['path'], 'rb')
+            except OSError as e:
+                raise CommandError(f'Cannot read {options["path"]}: {e}')
+            with f:
+                importer.import_file(f, file_format)
+        elapsed = time.perf_counter() - started
+
+        for line_number, error in importer.errors[:MAX_REPORTED_ERRORS]:
+            self.stdout.write(self.style.WARNING(f'Line {line_number}: {error}'))
+        if len(importer.errors) > MAX_REPORTED_ERRORS:
+            self.stdout.write(self.style.WARNING(f'... and {len(importer.errors) - MAX_REPORTED_ERRORS} more invalid row(s).'))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Dry run: {importer.valid} valid and {len(importer.errors)} invalid row(s) ({elapsed:.2f}s).'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.created} Bhandara(s) in {elapsed:.2f}s; {len(importer.errors)} invalid row(s) skipped, '
+            f'{importer.queued} queued for a coordinate lookup.'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bhandara_radar.coordinate_queue import claim_jobs, run_jobs
+
+class Command(BaseCommand):
+    help = 'Worker that resolves queued Google Maps links into coordinates for Bhandaras and Tourist Spots.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'RADAR_GEOCODE_CONCURRENCY', 4),
+                            help='Maximum number of Google Maps lookups in flight at once.')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Jobs claimed from the queue per round.')
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Process everything that is currently due, then exit (for cron).')
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = claim_jobs(options['batch_size'])
+
+            if not jobs:
+                if options['once']:
+                    self.stdout.write(self.style.SUCCESS('Coordinate queue is empty.'))
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            summary = run_jobs(jobs, options['concurrency'])
+            details = ', '.join(f'{count} {status.lower()}' for status, count in sorted(summary.items()))
+            self.stdout.write(f'Processed {len(jobs)} job(s): {details}')
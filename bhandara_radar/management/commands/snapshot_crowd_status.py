@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bhandara_radar.models import Bhandara, RadarEvent
+from bhandara_radar.ml_engine.predict import current_model_version, current_time_bucket, get_live_crowd_predictions
+
+class Command(BaseCommand):
+    help = 'Re-scores every live Bhandara and stores the result in current_crowd_status (run at least once per hour).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=0,
+                            help='Keep running in-process: check every N seconds and snapshot once per hourly bucket (default: run once, for cron).')
+
+    def handle(self, *args, **options):
+        if not options['every']:
+            self.snapshot()
+            return
+
+        last_bucket = None
+        while True:
+            # Predictions only change with the hour, so one snapshot per bucket is enough
+            bucket = current_time_bucket()
+            if bucket != last_bucket:
+                self.snapshot()
+                last_bucket = bucket
+            time.sleep(options['every'])
+
+    def snapshot(self):
+        started = time.perf_counter()
+        live = list(Bhandara.objects.filter(is_approved=True, is_active=True).only('id', 'area_score', 'current_crowd_status'))
+
+        now = timezone.now()
+        # Read first: if a new model goes live meanwhile, readers see a mismatch and score the rows themselves
+        model_version = current_model_version() or ''
+        predictions = get_live_crowd_predictions(b.area_score for b in live)
+        changed = []
+        for b, (raw_status, _) in zip(live, predictions):
+            if b.current_crowd_status != raw_status:
+                changed.append(b)
+            b.current_crowd_status = raw_status
+            b.crowd_status_updated_at = now
+            b.crowd_status_model = model_version
+
+        Bhandara.objects.bulk_update(live, ['current_crowd_status', 'crowd_status_updated_at', 'crowd_status_model'], batch_size=500)
+        # Connected radar clients get only the rows whose badge changes
+        RadarEvent.record_crowd(changed)
+
+        # The change log only has to cover clients that briefly lost their connection
+        retention = getattr(settings, 'RADAR_EVENT_RETENTION', 24 * 60 * 60)
+        RadarEvent.objects.filter(created_at__lt=now - timedelta(seconds=retention)).delete()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Crowd snapshot: {len(live)} live Bhandara(s) scored, {len(changed)} changed status ({elapsed:.2f}s).'
+        ))
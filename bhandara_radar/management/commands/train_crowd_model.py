@@ -0,0 +1,231 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from bhandara_radar.models import Bhandara, BhandaraArchive
+from bhandara_radar.ml_engine import training
+from bhandara_radar.ml_engine.forest import CompactForest, export_forest
+from bhandara_radar.ml_engine.lookup import build_prediction_table
+from bhandara_radar.ml_engine.registry import LoadedModel, load_checkpoint, publish, registry_path
+
+DEFAULT_CSV = os.path.join(settings.BASE_DIR, 'bhandara_radar', 'ml_engine', 'bhandara_training_data.csv')
+
+class Command(BaseCommand):
+    help = 'Trains the crowd Random Forest from a CSV file or from Bhandara history and publishes it to the model registry.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['csv', 'db'], default='csv',
+                            help='csv: a file with hour, day_of_week, area_score, crowd_level columns (oldest rows first). '
+                                 'db: every Bhandara (live and archived) with an observed crowd level, by observation time.')
+        parser.add_argument('--csv', default=DEFAULT_CSV, help='Training file for --source csv.')
+        parser.add_argument('--chunk-size', type=int, default=100_000, help='Rows read per chunk.')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Newest fraction of the rows kept out of training for evaluation.')
+        parser.add_argument('--n-estimators', type=int, default=100)
+        parser.add_argument('--max-depth', type=int, default=None)
+        parser.add_argument('--n-jobs', type=int, default=-1, help='Trees fitted in parallel (-1 = all cores).')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Fold only the crowd levels recorded since the active version into its training counts and refit '
+                                 '(falls back to a full --source db run when there is no checkpoint yet).')
+        parser.add_argument('--dry-run', action='store_true', help='Train and evaluate, but do not publish.')
+        parser.add_argument('--benchmark', metavar='ROWS', nargs='+', type=int,
+                            help='Time ingestion and fitting on synthetic data of these sizes instead of training (nothing is published).')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['holdout'] < 1:
+            raise CommandError('--holdout must be in [0, 1).')
+
+        if options['benchmark']:
+            self.benchmark(options)
+            return
+
+        if options['incremental']:
+            counts, previous = load_checkpoint()
+            if counts is None:
+                self.stdout.write('No training checkpoint in the registry yet; running a full training from the database.')
+            elif previous.get('source') == 'db:bhandara' and 'recorded_up_to' not in previous:
+                # Counted from current_crowd_status (the model's own snapshots), or windowed by observation time: start over
+                self.stdout.write('The active version was not trained on recorded crowd levels; running a full training from the database.')
+            else:
+                self.train_incremental(counts, previous, options)
+                return
+            options['source'] = 'db'
+
+        recorded_up_to = None
+        if options['source'] == 'csv':
+            if not os.path.exists(options['csv']):
+                raise CommandError(f"Training file not found: {options['csv']}")
+            total_rows = training.count_csv_rows(options['csv'])
+            chunks = training.csv_chunks(options['csv'], options['chunk_size'])
+            source = options['csv']
+        else:
+            # Observations recorded while we read are left for the next incremental run
+            recorded_up_to = self.latest_recording()
+            history = self.history(None, recorded_up_to)
+            total_rows = history.count() if recorded_up_to else 0
+            chunks = training.queryset_chunks(self.training_rows(history, options), options['chunk_size'])
+            source = 'db:bhandara'
+
+        if not total_rows:
+            raise CommandError('No training rows found.')
+
+        model, metrics, counts = self.train(chunks, total_rows, options)
+        self.report(metrics)
+        self.publish(model, dict(metrics, source=source, recorded_up_to=recorded_up_to and recorded_up_to.isoformat()), counts, options)
+
+    def train_incremental(self, counts, previous, options):
+        """
+        Reads only crowd levels recorded after the checkpoint's recorded_up_to
+        (whatever time they were observed at), so the cost grows with new data;
+        refitting on the count table costs the same whatever the history size.
+        A changed observation is counted again, at its new time; the one it
+        replaced stays counted.
+        """
+        started = time.perf_counter()
+        recorded_after = parse_datetime(previous['recorded_up_to']) if previous.get('recorded_up_to') else None
+        recorded_up_to = self.latest_recording()
+        if recorded_up_to is None or (recorded_after is not None and recorded_up_to <= recorded_after):
+            self.stdout.write(f"No crowd levels recorded since model version {previous['version']}; nothing to do.")
+            return
+
+        # New observations may already have been archived since the last run
+        rows = self.training_rows(self.history(recorded_after, recorded_up_to), options)
+        new_counts = training.empty_counts()
+        for hours, days, scores, levels in training.queryset_chunks(rows, options['chunk_size']):
+            training.add_counts(new_counts, hours, days, scores, levels)
+        ingested = time.perf_counter()
+
+        # Score the new rows with the model they are about to update: an honest hold-out
+        previous_table = LoadedModel(os.path.join(registry_path(), previous['version'])).table
+        counts = counts + new_counts
+        model = training.fit_forest(
+            counts,
+            n_estimators=options['n_estimators'],
+            n_jobs=options['n_jobs'],
+            max_depth=options['max_depth'],
+        )
+        fitted = time.perf_counter()
+
+        new_total = int(new_counts.sum())
+        metrics = {
+            'training_rows': int(counts.sum()),
+            'new_rows': new_total,
+            'distinct_inputs': int((counts.sum(axis=1) > 0).sum()),
+            'training': training.evaluate(build_prediction_table(model), counts),
+            'holdout': training.evaluate(previous_table, new_counts),
+            'ingest_seconds': round(ingested - started, 3),
+            'fit_seconds': round(fitted - ingested, 3),
+            'rows_per_second': round(new_total / max(fitted - started, 1e-9)),
+        }
+        self.stdout.write(f"{new_total} new row(s) since model version {previous['version']}.")
+        self.report(metrics)
+        self.publish(model, dict(
+            metrics,
+            source='db:bhandara',
+            incremental_from=previous['version'],
+            recorded_up_to=recorded_up_to.isoformat(),
+        ), counts, options)
+
+    def latest_recording(self):
+        """Newest crowd_recorded_at, whether the row is still live or archived."""
+        live = Bhandara.objects.aggregate(Max('crowd_recorded_at'))['crowd_recorded_at__max']
+        archived = BhandaraArchive.objects.aggregate(Max('crowd_recorded_at'))['crowd_recorded_at__max']
+        return max((at for at in (live, archived) if at is not None), default=None)
+
+    def history(self, after, up_to):
+        """
+        Every crowd level recorded with after < crowd_recorded_at <= up_to (after
+        None: from the start), from the live and the archive table, oldest
+        observation first.
+        """
+        columns = ('crowd_observed_at', 'area_score', 'observed_crowd_status')
+        window = {'observed_crowd_status__isnull': False, 'crowd_recorded_at__lte': up_to}
+        if after is not None:
+            window['crowd_recorded_at__gt'] = after
+        live = Bhandara.objects.filter(**window).values_list(*columns, 'id')
+        archived = BhandaraArchive.objects.filter(**window).values_list(*columns, 'original_id')
+        return live.union(archived, all=True).order_by('crowd_observed_at', 'id')
+
+    def training_rows(self, history, options):
+        # Features are the local hour and weekday the crowd was seen at; the pk only breaks ties
+        return (
+            (timezone.localtime(observed_at), area_score, status)
+            for observed_at, area_score, status, _ in history.iterator(chunk_size=options['chunk_size'])
+        )
+
+    def publish(self, model, metadata, counts, options):
+        if options['dry_run']:
+            return
+        version = publish(model, metadata, counts=counts)
+        self.stdout.write(self.style.SUCCESS(f'Model version {version} published to the registry.'))
+
+    def train(self, chunks, total_rows, options):
+        started = time.perf_counter()
+        train_counts, holdout_counts = training.split_counts(chunks, total_rows, options['holdout'])
+        ingested = time.perf_counter()
+
+        model = training.fit_forest(
+            train_counts,
+            n_estimators=options['n_estimators'],
+            n_jobs=options['n_jobs'],
+            max_depth=options['max_depth'],
+        )
+        fitted = time.perf_counter()
+
+        table = build_prediction_table(model)
+        metrics = {
+            'training_rows': int(train_counts.sum()),
+            'distinct_inputs': int((train_counts.sum(axis=1) > 0).sum()),
+            'training': training.evaluate(table, train_counts),
+            'holdout': training.evaluate(table, holdout_counts),
+            'ingest_seconds': round(ingested - started, 3),
+            'fit_seconds': round(fitted - ingested, 3),
+            'rows_per_second': round(total_rows / max(fitted - started, 1e-9)),
+        }
+        # The checkpoint keeps every row read, hold-out included, for later incremental runs
+        return model, metrics, train_counts + holdout_counts
+
+    def report(self, metrics):
+        holdout = metrics['holdout']
+        self.stdout.write(
+            f"Trained on {metrics['training_rows']} row(s) ({metrics['distinct_inputs']} distinct inputs): "
+            f"ingest {metrics['ingest_seconds']:.2f}s, fit {metrics['fit_seconds']:.2f}s, "
+            f"{metrics['rows_per_second']} rows/s."
+        )
+        if holdout['rows']:
+            self.stdout.write(
+                f"Hold-out: {holdout['rows']} newest row(s), accuracy {holdout['accuracy']:.3f} "
+                f"(always guessing the most common level: {holdout['baseline_accuracy']:.3f})."
+            )
+        else:
+            self.stdout.write('Hold-out: no rows held out.')
+
+    def benchmark(self, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            for rows in options['benchmark']:
+                path = os.path.join(tmp, f'{rows}.csv')
+                training.synthetic_csv(path, rows)
+                size_mb = os.path.getsize(path) / 1024 / 1024
+
+                started = time.perf_counter()
+                total_rows = training.count_csv_rows(path)
+                model, metrics, _ = self.train(training.csv_chunks(path, options['chunk_size']), total_rows, options)
+                table_started = time.perf_counter()
+                export_forest(model, os.path.join(tmp, 'forest'))
+                build_prediction_table(CompactForest(os.path.join(tmp, 'forest')))
+                finished = time.perf_counter()
+
+                accuracy = metrics['holdout']['accuracy']
+                self.stdout.write(
+                    f"{rows:>10} rows ({size_mb:.0f} MB): ingest {metrics['ingest_seconds']:.2f}s, "
+                    f"fit {metrics['fit_seconds']:.2f}s, export {finished - table_started:.2f}s, "
+                    f"total {finished - started:.2f}s ({rows / (finished - started):,.0f} rows/s), "
+                    f"hold-out accuracy {'n/a' if accuracy is None else f'{accuracy:.3f}'}"
+                )
+                os.remove(path)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhandara_radar', '0004_resolvedmapsurl'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bhandara',
+            index=models.Index(fields=['latitude', 'longitude'], name='bhandara_lat_lng_idx'),
+        ),
+    ]
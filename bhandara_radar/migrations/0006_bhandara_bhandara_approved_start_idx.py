@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhandara_radar', '0005_bhandara_bhandara_lat_lng_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bhandara',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['-start_time'], name='bhandara_approved_start_idx'),
+        ),
+    ]
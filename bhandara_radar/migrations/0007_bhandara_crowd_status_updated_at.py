@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhandara_radar', '0006_bhandara_bhandara_approved_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bhandara',
+            name='crowd_status_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bhandara',
+            name='crowd_status_model',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:26
+
+from django.db import migrations, models
+
+
+def score_existing_rows(apps, schema_editor):
+    # Existing rows keep the score they are predicted with today (the old
+    # area-name rules, frozen here); build_density_grid replaces it later
+    Bhandara = apps.get_model('bhandara_radar', 'Bhandara')
+    rows = list(Bhandara.objects.only('id', 'area_name'))
+    for row in rows:
+        name_lower = (row.area_name or '').lower()
+        if 'alambagh' in name_lower or 'hazratganj' in name_lower or 'charbagh' in name_lower:
+            row.area_score = 9
+        elif 'gomti nagar' in name_lower or 'indira nagar' in name_lower:
+            row.area_score = 7
+        else:
+            row.area_score = 5
+    Bhandara.objects.bulk_update(rows, ['area_score'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhandara_radar', '0007_bhandara_crowd_status_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bhandara',
+            name='area_score',
+            field=models.PositiveSmallIntegerField(default=5),
+        ),
+        migrations.CreateModel(
+            name='DensityCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row', models.IntegerField()),
+                ('col', models.IntegerField()),
+                ('observations', models.PositiveIntegerField()),
+                ('score', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('row', 'col'), name='unique_density_cell')],
+            },
+        ),
+        migrations.RunPython(score_existing_rows, migrations.RunPython.noop),
+    ]
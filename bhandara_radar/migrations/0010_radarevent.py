@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhandara_radar', '0009_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RadarEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('live', 'Live / updated'), ('crowd', 'Crowd status changed'), ('gone', 'No longer live')], max_length=10)),
+                ('bhandara_id', models.PositiveBigIntegerField()),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
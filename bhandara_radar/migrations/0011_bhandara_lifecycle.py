@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:46
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_end_times(apps, schema_editor):
+    # Live rows get the default duration; the first expire_bhandaras run then clears out past seasons.
+    # Pending ones are left blank: their clock starts when they are approved
+    Bhandara = apps.get_model('bhandara_radar', 'Bhandara')
+    duration = timedelta(hours=getattr(settings, 'RADAR_DEFAULT_DURATION_HOURS', 6))
+    Bhandara.objects.filter(is_approved=True, end_time__isnull=True).update(end_time=F('start_time') + duration)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhandara_radar', '0010_radarevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BhandaraArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.PositiveBigIntegerField(unique=True)),
+                ('google_maps_url', models.URLField(max_length=500)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('area_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('organizer_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('business_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('menu_details', models.CharField(blank=True, max_length=255, null=True)),
+                ('start_time', models.DateTimeField(db_index=True)),
+                ('end_time', models.DateTimeField()),
+                ('current_crowd_status', models.CharField(choices=[('LOW', 'Moving Fast'), ('MODERATE', 'Moderate Rush'), ('HIGH', 'Heavy Rush')], default='LOW', max_length=20)),
+                ('observed_crowd_status', models.CharField(blank=True, choices=[('LOW', 'Moving Fast'), ('MODERATE', 'Moderate Rush'), ('HIGH', 'Heavy Rush')], max_length=20, null=True)),
+                ('crowd_observed_at', models.DateTimeField(blank=True, null=True)),
+                ('crowd_recorded_at', models.DateTimeField(blank=True, db_index=True, editable=False, null=True)),
+                ('area_score', models.PositiveSmallIntegerField(default=5)),
+                ('is_approved', models.BooleanField(default=False)),
+                ('is_verified_owner', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archived Bhandara',
+                'verbose_name_plural': 'Archived Bhandaras',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='bhandara',
+            name='bhandara_approved_start_idx',
+        ),
+        migrations.AddField(
+            model_name='bhandara',
+            name='end_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_end_times, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bhandara',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_approved', True)), fields=['-start_time'], name='bhandara_live_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bhandara',
+            index=models.Index(fields=['end_time'], name='bhandara_end_time_idx'),
+        ),
+    ]
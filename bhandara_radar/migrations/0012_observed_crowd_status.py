@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhandara_radar', '0011_bhandara_lifecycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bhandara',
+            name='crowd_observed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bhandara',
+            name='crowd_recorded_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='bhandara',
+            name='observed_crowd_status',
+            field=models.CharField(blank=True, choices=[('LOW', 'Moving Fast'), ('MODERATE', 'Moderate Rush'), ('HIGH', 'Heavy Rush')], max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,103 @@
+"""
+Compact, array-backed copy of a trained RandomForestClassifier.
+
+The training side exports the forest into a handful of flat .npy files; the
+web side evaluates them with NumPy only, so workers never import sklearn
+and the arrays can be memory-mapped (and shared between forked workers)
+instead of unpickled into every process.
+"""
+import json
+import os
+
+import numpy as np
+
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+META_FILE = 'forest.json'
+LEAF = -1
+
+
+def export_forest(model, path):
+    """
+    Writes a fitted sklearn RandomForestClassifier to `path` (a directory).
+    All trees are concatenated into one set of node arrays; child indexes are
+    global, and `roots` holds the first node of every tree.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == LEAF
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(np.where(is_leaf, LEAF, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, LEAF, tree.children_right + offset).astype(np.int32))
+
+        # Class fractions per node, bit for bit what RandomForestClassifier averages
+        # (sklearn >= 1.4 stores them as they are; older versions stored counts)
+        value = tree.value[:, 0, :].astype(np.float64)
+        if not np.allclose(value.sum(axis=1), 1.0):
+            value = value / value.sum(axis=1, keepdims=True)
+        values.append(value)
+
+        roots.append(offset)
+        offset += tree.node_count
+
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts),
+        'right': np.concatenate(rights),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump({
+            'classes': [int(c) for c in model.classes_],
+            'n_features': int(model.n_features_in_),
+            'n_trees': len(roots),
+            'n_nodes': int(offset),
+        }, f, indent=2)
+
+
+class CompactForest:
+    """NumPy-only evaluator for a forest written by export_forest."""
+
+    def __init__(self, path, mmap=True):
+        mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode))
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.classes_ = np.asarray(meta['classes'])
+        self.n_features_in_ = meta['n_features']
+
+    def apply(self, X):
+        """Leaf node reached in every tree: an (n_samples, n_trees) index array."""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+
+        while True:
+            left = self.left[nodes]
+            active = left != LEAF
+            if not active.any():
+                return nodes
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(active, np.where(go_left, left, self.right[nodes]), nodes)
+
+    def predict_proba(self, X):
+        # Summed tree by tree, then divided, as sklearn does: ties break the same way in predict()
+        leaves = self.apply(X)
+        proba = np.zeros((len(leaves), self.value.shape[1]))
+        for tree in range(leaves.shape[1]):
+            proba += self.value[leaves[:, tree]]
+        return proba / leaves.shape[1]
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
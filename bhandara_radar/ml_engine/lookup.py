@@ -0,0 +1,59 @@
+import hashlib
+import os
+
+import numpy as np
+
+# The model only ever sees these inputs, so every possible answer fits in a 24 x 7 x 10 table
+HOURS = 24
+DAYS_OF_WEEK = 7
+AREA_SCORES = 10 # area_score runs from 1 to 10
+
+
+def files_checksum(paths):
+    """sha256 over the contents of several files, in the given order."""
+    digest = hashlib.sha256()
+    for file_path in paths:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_prediction_table(model):
+    """
+    Scores all 1,680 (hour, day_of_week, area_score) combinations with one
+    predict call and returns them as an int8 array indexed
+    [hour, day_of_week, area_score - 1].
+    """
+    hour, day, score = np.meshgrid(
+        np.arange(HOURS),
+        np.arange(DAYS_OF_WEEK),
+        np.arange(1, AREA_SCORES + 1),
+        indexing='ij',
+    )
+    features = np.column_stack([hour.ravel(), day.ravel(), score.ravel()])
+    predictions = np.asarray(model.predict(features), dtype=np.int8)
+    return predictions.reshape(HOURS, DAYS_OF_WEEK, AREA_SCORES)
+
+
+def save_prediction_table(table, path, model_checksum):
+    np.savez(path, table=table, model_checksum=np.array(model_checksum))
+
+
+def load_prediction_table(path, model_checksum):
+    """
+    Returns the saved table, or None if it is missing or was built from a
+    different model file.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        if str(saved['model_checksum']) != model_checksum:
+            return None
+        return saved['table']
+
+
+def lookup(table, hours, days, area_scores):
+    """O(1) vectorized lookup; out-of-range area scores are clamped to 1-10."""
+    scores = np.clip(np.asarray(area_scores, dtype=np.int64), 1, AREA_SCORES)
+    return table[hours, days, scores - 1]
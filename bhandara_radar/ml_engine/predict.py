@@ -1,31 +1,34 @@
-import joblib
-import os
+import heapq
+import numpy as np
+from asgiref.sync import sync_to_async
 from datetime import datetime
 from django.conf import settings
-from bhandara_radar.utils import calculate_haversine_distance
-# Load the ML model once when the server starts
-MODEL_PATH = os.path.join(settings.BASE_DIR, 'bhandara_radar', 'ml_engine', 'crowd_model.joblib')
+from django.utils import timezone
+from bhandara_radar.utils import haversine_distances
+from .registry import ActiveModel
+from .lookup import lookup
+# The crowd model is loaded from the versioned registry (see registry.py) and
+# hot-swapped whenever a new version is published; sklearn is never imported here
+active_model = ActiveModel(check_interval=getattr(settings, 'RADAR_MODEL_CHECK_SECONDS', 10))
 
-try:
-    crowd_model = joblib.load(MODEL_PATH)
-except Exception as e:
-    crowd_model = None
-    print(f"Warning: ML model not found. {e}")
+def current_model_version():
+    """Version name of the model answering predictions in this worker (None = no model)."""
+    model = active_model.get()
+    return model.version if model else None
 
-def get_live_crowd_prediction(area_name):
+# Model output -> (RAW_STATUS, DISPLAY_TEXT)
+CROWD_LEVELS = {
+    2: ('HIGH', 'Heavy Rush'),
+    1: ('MODERATE', 'Moderate Rush'),
+    0: ('LOW', 'Moving Fast'),
+}
+
+def get_area_score(area_name):
     """
-    Feeds the current time, day, and area into the Random Forest model.
-    Returns a tuple: (RAW_STATUS, DISPLAY_TEXT)
+    Assign an 'area density score' (1-10) from the area name alone.
+    Only a fallback now: rows are scored from their coordinates with the
+    density grid (see bhandara_radar/density.py) when they are saved.
     """
-    if not crowd_model:
-        return 'LOW', 'Moving Fast' # Safety fallback
-        
-    now = datetime.now()
-    hour = now.hour
-    day_of_week = now.weekday() # 0 = Monday, 6 = Sunday
-    
-    # Assign an 'area density score' (1-10). 
-    # Since we don't have a live density API, we simulate it based on known busy areas.
     area_score = 5 # Default average density
     if area_name:
         name_lower = area_name.lower()
@@ -33,43 +36,202 @@ def get_live_crowd_prediction(area_name):
             area_score = 9 # High density commercial zones
         elif 'gomti nagar' in name_lower or 'indira nagar' in name_lower:
             area_score = 7
+    return area_score
+
+def get_live_crowd_prediction(area_score):
+    """
+    Looks up the Random Forest's answer for the current time, day, and area score.
+    Returns a tuple: (RAW_STATUS, DISPLAY_TEXT)
+    """
+    return get_live_crowd_predictions([area_score])[0]
+
+def get_live_crowd_predictions(area_scores):
+    """
+    Batch version of get_live_crowd_prediction: scores every area score with a
+    single table lookup. Returns a list of (RAW_STATUS, DISPLAY_TEXT) tuples in
+    the same order as the input.
+    """
+    area_scores = np.fromiter(area_scores, dtype=np.int64)
+    # Hold on to one version for the whole batch, even if a new one is swapped in meanwhile
+    model = active_model.get()
+    if model is None or not len(area_scores):
+        return [CROWD_LEVELS[0]] * len(area_scores) # Safety fallback
+
+    now = datetime.now()
+
+    # 🚀 The AI Prediction! Read straight from the precomputed table: [hour, day_of_week, area_score]
+    predictions = lookup(model.table, now.hour, now.weekday(), area_scores) # 0 = Monday, 6 = Sunday
+
+    return [CROWD_LEVELS.get(int(p), CROWD_LEVELS[0]) for p in predictions]
+
+def current_time_bucket():
+    """
+    Start of the current prediction bucket. The model only looks at the hour
+    and weekday, so every prediction stays valid until the hour changes.
+    """
+    return timezone.now().replace(minute=0, second=0, microsecond=0)
+
+# Columns predict_crowd_for_rows() expects, in order
+PREDICTION_COLUMNS = ('id', 'area_score', 'current_crowd_status', 'crowd_status_updated_at', 'crowd_status_model')
+
+def predict_crowd_for_rows(rows):
+    """
+    rows: (id, area_score, current_crowd_status, crowd_status_updated_at,
+    crowd_status_model) tuples.
+    Serves the status stored by the snapshot_crowd_status job when it was
+    written in the current time bucket by the model answering now, and
+    scores only the stale rows.
+    Returns {bhandara_id: (RAW_STATUS, DISPLAY_TEXT)}.
+    """
+    by_status = {raw: (raw, display) for raw, display in CROWD_LEVELS.values()}
+    bucket = current_time_bucket()
+    model_version = current_model_version() or ''
 
-    # 🚀 The AI Prediction!
-    # We pass the exact format we trained on: [hour, day_of_week, area_score]
-    prediction = crowd_model.predict([[hour, day_of_week, area_score]])[0]
-    
-    if prediction == 2:
-        return 'HIGH', 'Heavy Rush'
-    elif prediction == 1:
-        return 'MODERATE', 'Moderate Rush'
-    else:
-        return 'LOW', 'Moving Fast'
-    
-def get_smart_alternatives(target_bhandara_id, user_lat, user_lng, all_bhandaras):
+    predictions = {}
+    stale = []
+    for bhandara_id, area_score, status, updated_at, status_model in rows:
+        if updated_at is not None and updated_at >= bucket and status_model == model_version and status in by_status:
+            predictions[bhandara_id] = by_status[status]
+        else:
+            stale.append((bhandara_id, area_score))
+
+    live = get_live_crowd_predictions(area_score for _, area_score in stale)
+    predictions.update((bhandara_id, prediction) for (bhandara_id, _), prediction in zip(stale, live))
+    return predictions
+
+class SmartAlternatives:
+    """
+    Every 'smart alternatives' list of one response, computed from a single
+    candidate pool: the non-HIGH Bhandaras with GPS data, their coordinates
+    in NumPy arrays and their distance from the user, all built once.
+    `predictions` ({id: (RAW_STATUS, DISPLAY_TEXT)}) may be None: the pool
+    is then scored from the same read.
+
+    origin='user' ranks alternatives by distance from the user,
+    origin='site' by distance from the crowded Bhandara itself.
+    max_detour_km drops alternatives further than that from the crowded Bhandara.
+    """
+    ORIGINS = ('user', 'site')
+
+    def __init__(self, all_bhandaras, predictions, user_lat, user_lng, origin='user', max_detour_km=None, limit=3):
+        self.origin = origin if origin in self.ORIGINS else 'user'
+        self.max_detour_km = max_detour_km
+        self.limit = limit
+
+        rows = list(all_bhandaras.filter(
+            latitude__isnull=False,
+            longitude__isnull=False
+        ).values_list('id', 'latitude', 'longitude', 'area_name', 'business_name', 'is_verified_owner', *PREDICTION_COLUMNS[1:]))
+        if predictions is None:
+            # Scored from the same read, so only requests that need alternatives pay for the whole pool
+            predictions = predict_crowd_for_rows((row[0], *row[6:]) for row in rows)
+        rows = [row for row in rows if predictions.get(row[0], CROWD_LEVELS[0])[0] != 'HIGH']
+
+        self.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        self.lats = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        self.lngs = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        self.cards = [
+            {
+                'id': bhandara_id,
+                'title': business_name if is_verified_owner else f"📍 {area_name}",
+                'crowd_status': predictions.get(bhandara_id, CROWD_LEVELS[0])[1],
+            }
+            for bhandara_id, _, _, area_name, business_name, is_verified_owner, *_ in rows
+        ]
+        self.user_distances = haversine_distances(user_lat, user_lng, self.lats, self.lngs)
+        self._user_ranking = None
+        self._user_pool = None
+
+    @classmethod
+    async def acreate(cls, all_bhandaras, predictions, user_lat, user_lng, **options):
+        """Builds the engine from an async view, in the request's thread like the async ORM's own queries."""
+        return await sync_to_async(cls)(all_bhandaras, predictions, user_lat, user_lng, **options)
+
+    def for_site(self, target_bhandara_id, site_lat, site_lng):
+        """The closest non-crowded alternatives to one crowded Bhandara."""
+        if not len(self.ids):
+            return []
+
+        if self.origin == 'site' or self.max_detour_km is not None:
+            site_distances = haversine_distances(site_lat, site_lng, self.lats, self.lngs)
+        distances = site_distances if self.origin == 'site' else self.user_distances
+
+        if self.max_detour_km is None and self.origin == 'user':
+            # Same ranking for every crowded site: keep one extra in case the site itself is in it
+            if self._user_ranking is None:
+                self._user_ranking = heapq.nsmallest(self.limit + 1, range(len(self.ids)), key=distances.__getitem__)
+            candidates = self._user_ranking
+        else:
+            candidates = range(len(self.ids))
+            if self.max_detour_km is not None:
+                candidates = np.flatnonzero(site_distances <= self.max_detour_km)
+            # Bounded heap: O(n log k) instead of sorting every candidate
+            candidates = heapq.nsmallest(self.limit + 1, candidates, key=distances.__getitem__)
+
+        alternatives = []
+        for i in candidates:
+            if self.ids[i] == target_bhandara_id:
+                continue # Skip the one we are already looking at
+            alternatives.append(dict(self.cards[i], distance=round(float(distances[i]), 2)))
+        return alternatives[:self.limit]
+
+    def pool_for_site(self, site_lat, site_lng, reach_km):
+        """
+        origin='user' for a whole area: positions (in pool order) of every
+        candidate that can be in for_site()'s answer for a user standing
+        anywhere within reach_km of the point the engine was built for.
+        Each user then ranks just these (see rank_pool).
+
+        A user is at most reach_km from that point, so their limit + 1
+        closest candidates are all within (the (limit + 1)-th distance from
+        the point) + 2 x reach_km of it.
+        """
+        if self.max_detour_km is None and self._user_pool is not None:
+            return self._user_pool # Same pool for every crowded site
+
+        candidates = np.arange(len(self.ids))
+        if self.max_detour_km is not None:
+            site_distances = haversine_distances(site_lat, site_lng, self.lats, self.lngs)
+            candidates = np.flatnonzero(site_distances <= self.max_detour_km)
+        if len(candidates) > self.limit + 1:
+            distances = self.user_distances[candidates]
+            kth = np.partition(distances, self.limit)[self.limit]
+            # The slack only covers floating-point rounding in the distances
+            candidates = candidates[distances <= kth + 2 * reach_km + 1e-9]
+        pool = [int(i) for i in candidates]
+
+        if self.max_detour_km is None:
+            self._user_pool = pool
+        return pool
+
+    @staticmethod
+    def rank_pool(pool, lats, lngs, user_lat, user_lng, target_bhandara_id, limit=3):
+        """
+        for_site() for one user, out of a pool_for_site() pool given as its
+        cards and coordinates: the same alternatives, in the same order.
+        """
+        if not pool:
+            return []
+        distances = haversine_distances(user_lat, user_lng, lats, lngs)
+        alternatives = []
+        for i in heapq.nsmallest(limit + 1, range(len(pool)), key=distances.__getitem__):
+            if pool[i]['id'] == target_bhandara_id:
+                continue
+            alternatives.append(dict(pool[i], distance=round(float(distances[i]), 2)))
+        return alternatives[:limit]
+
+
+def get_smart_alternatives(target_bhandara_id, user_lat, user_lng, all_bhandaras, predictions=None, engine=None):
     """
     Finds the 3 closest alternative Bhandaras that are NOT highly crowded.
+    Pass an `engine` (a SmartAlternatives) so repeated calls reuse the same
+    work; without `predictions` the engine scores its candidates itself.
     """
-    alternatives = []
-    
-    for b in all_bhandaras:
-        # Skip the one we are already looking at
-        if b.id == target_bhandara_id:
-            continue
-            
-        # 1. Get the AI prediction for this alternative
-        raw_status, display = get_live_crowd_prediction(b.area_name)
-        
-        # 2. If it is NOT a heavy rush, calculate how far it is from the user
-        if raw_status != 'HIGH':
-            dist = calculate_haversine_distance(user_lat, user_lng, b.latitude, b.longitude)
-            if dist is not None:
-                alternatives.append({
-                    'id': b.id,
-                    'title': b.business_name if b.is_verified_owner else f"📍 {b.area_name}",
-                    'distance': dist,
-                    'crowd_status': display
-                })
-    
-    # 3. Sort by distance and return the top 3 (K=3 Nearest Neighbors logic)
-    alternatives.sort(key=lambda x: x['distance'])
-    return alternatives[:3]
\ No newline at end of file
+    if engine is None:
+        engine = SmartAlternatives(all_bhandaras, predictions, user_lat, user_lng)
+
+    target = all_bhandaras.filter(id=target_bhandara_id).values_list('latitude', 'longitude').first()
+    site_lat, site_lng = target if target else (None, None)
+    if site_lat is None or site_lng is None:
+        site_lat, site_lng = user_lat, user_lng
+    return engine.for_site(target_bhandara_id, site_lat, site_lng)
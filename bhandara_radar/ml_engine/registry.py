@@ -0,0 +1,218 @@
+"""
+Versioned store of crowd-model artifacts, with hot reload for web workers.
+
+Layout (settings.RADAR_MODEL_REGISTRY):
+
+    registry/
+        CURRENT                      <- name of the active version
+        20260609-110000-3f2a9c1e/
+            metadata.json            <- version, created_at, checksum, metrics...
+            forest.json, *.npy       <- compact forest (see forest.py)
+            crowd_lookup.npz         <- every possible prediction (see lookup.py)
+            training_counts.npy      <- observations seen so far (see training.py)
+
+Versions are written to a temporary directory and renamed into place, and
+CURRENT is replaced atomically, so a worker never sees half a model.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .forest import ARRAYS, META_FILE, CompactForest, export_forest
+from .lookup import files_checksum, build_prediction_table, save_prediction_table, load_prediction_table
+
+logger = logging.getLogger(__name__)
+
+POINTER_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+TABLE_FILE = 'crowd_lookup.npz'
+# Checkpoint for incremental training; not needed to serve predictions
+COUNTS_FILE = 'training_counts.npy'
+# Files whose checksum identifies a model version
+MODEL_FILES = [f'{name}.npy' for name in ARRAYS] + [META_FILE]
+
+
+def registry_path():
+    return str(getattr(settings, 'RADAR_MODEL_REGISTRY', os.path.join(settings.BASE_DIR, 'bhandara_radar', 'ml_engine', 'registry')))
+
+
+def model_checksum(version_path):
+    """
+    sha256 over the forest files of one version, in a fixed order
+    (metadata and the prediction table are derived from them).
+    """
+    return files_checksum(os.path.join(version_path, name) for name in MODEL_FILES)
+
+
+def list_versions(root=None):
+    root = root or registry_path()
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if os.path.isfile(os.path.join(root, name, METADATA_FILE))
+    )
+
+
+def current_version(root=None):
+    try:
+        with open(os.path.join(root or registry_path(), POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def activate(version, root=None):
+    """Points CURRENT at an existing version (publishing, or rolling back)."""
+    root = root or registry_path()
+    if version not in list_versions(root):
+        raise ValueError(f"Unknown model version: {version}")
+
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.current-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, os.path.join(root, POINTER_FILE))
+
+
+def publish(model, metadata=None, root=None, make_current=True, counts=None):
+    """
+    Stores a fitted RandomForestClassifier as a new version (compact forest,
+    prediction table, metadata with checksum, and optionally the training
+    count table it was fitted from) and, by default, activates it.
+    Returns the new version name.
+    """
+    root = root or registry_path()
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=root, prefix='.staging-')
+
+    try:
+        export_forest(model, staging)
+        checksum = model_checksum(staging)
+        save_prediction_table(build_prediction_table(CompactForest(staging, mmap=False)), os.path.join(staging, TABLE_FILE), checksum)
+        if counts is not None:
+            np.save(os.path.join(staging, COUNTS_FILE), counts)
+
+        created_at = timezone.now()
+        version = f"{created_at:%Y%m%d-%H%M%S}-{checksum[:8]}"
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump(dict(
+                metadata or {},
+                version=version,
+                created_at=created_at.isoformat(),
+                checksum=checksum,
+                n_trees=len(model.estimators_),
+            ), f, indent=2)
+
+        os.rename(staging, os.path.join(root, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if make_current:
+        activate(version, root)
+    return version
+
+
+def load_checkpoint(root=None):
+    """
+    (counts, metadata) of the active version, for incremental training.
+    counts is None when there is no active version or it has no checkpoint.
+    """
+    root = root or registry_path()
+    version = current_version(root)
+    if version is None:
+        return None, {}
+
+    version_path = os.path.join(root, version)
+    with open(os.path.join(version_path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    counts_path = os.path.join(version_path, COUNTS_FILE)
+    counts = np.load(counts_path) if os.path.exists(counts_path) else None
+    return counts, metadata
+
+
+class LoadedModel:
+    """One immutable model version: forest, full prediction table and metadata."""
+
+    def __init__(self, version_path):
+        with open(os.path.join(version_path, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        self.version = self.metadata['version']
+
+        checksum = model_checksum(version_path)
+        if checksum != self.metadata['checksum']:
+            raise ValueError(f"Checksum mismatch for model {self.version}")
+
+        self.forest = CompactForest(version_path)
+        self.table = load_prediction_table(os.path.join(version_path, TABLE_FILE), checksum)
+        if self.table is None:
+            self.table = build_prediction_table(self.forest)
+
+
+class ActiveModel:
+    """
+    The model this worker predicts with. Every `check_interval` seconds a
+    request stats CURRENT; when it points somewhere new, the new version is
+    loaded and swapped in with a single reference assignment. Requests that
+    already hold the old LoadedModel finish with it, and nobody waits for a
+    load running in another thread.
+    """
+
+    def __init__(self, root=None, check_interval=10):
+        self.root = root
+        self.check_interval = check_interval
+        self.model = None
+        self._pointer_stamp = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        model = self.model
+        return model.version if model else None
+
+    def get(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            # Only one thread reloads; the others keep using the current model
+            if self._lock.acquire(blocking=self.model is None):
+                try:
+                    self._checked_at = now
+                    self._reload_if_changed()
+                finally:
+                    self._lock.release()
+        return self.model
+
+    def _reload_if_changed(self):
+        root = self.root or registry_path()
+        try:
+            # CURRENT is always replaced, never edited, so a new inode/mtime means a new pointer
+            stat = os.stat(os.path.join(root, POINTER_FILE))
+        except FileNotFoundError:
+            if self._pointer_stamp is not False:
+                logger.warning("No active crowd model in %s; crowd status falls back to LOW.", root)
+            self._pointer_stamp = False
+            return
+
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._pointer_stamp:
+            return
+        self._pointer_stamp = stamp
+
+        version = current_version(root)
+        if version == self.version:
+            return
+        try:
+            self.model = LoadedModel(os.path.join(root, version))
+            logger.info("Crowd model %s loaded.", version)
+        except Exception as e:
+            # Keep serving the previous version rather than nothing
+            logger.warning("Could not load crowd model %s: %s", version, e)
@@ -1,25 +1,17 @@
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-import joblib
 import os
+import sys
+import django
+
+# Run as a script from anywhere: the project root is two levels up
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 def train_crowd_model():
-    # 1. Load data
-    data_path = 'bhandara_radar/ml_engine/bhandara_training_data.csv'
-    df = pd.read_csv(data_path)
-    
-    # 2. Features (X) and Target (y)
-    X = df[['hour', 'day_of_week', 'area_score']]
-    y = df['crowd_level']
-    
-    # 3. Initialize and Train Random Forest
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X, y)
-    
-    # 4. Save the model to a file
-    model_path = 'bhandara_radar/ml_engine/crowd_model.joblib'
-    joblib.dump(model, model_path)
-    print(f"🚀 Random Forest Model trained and saved to {model_path}")
+    # Kept for old habits: the real pipeline is `python manage.py train_crowd_model`
+    from django.core.management import call_command
+    call_command('train_crowd_model')
 
 if __name__ == "__main__":
-    train_crowd_model()
\ No newline at end of file
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'upzunction.settings')
+    django.setup()
+    train_crowd_model()
@@ -0,0 +1,149 @@
+"""
+Streaming ingestion and fitting for the crowd model.
+
+The model only has three small integer features (hour, day_of_week,
+area_score), so there are just 24 x 7 x 10 distinct inputs. Training data is
+therefore read in chunks and folded into a count table of observations per
+(input, crowd_level); memory stays constant whether the source holds five
+hundred rows or a full season. The forest is then fitted on the distinct
+inputs with the counts as sample weights.
+"""
+import numpy as np
+import pandas as pd
+
+from .lookup import HOURS, DAYS_OF_WEEK, AREA_SCORES
+
+FEATURES = ['hour', 'day_of_week', 'area_score']
+TARGET = 'crowd_level'
+CROWD_CLASSES = 3 # 0 = LOW, 1 = MODERATE, 2 = HIGH
+CROWD_LABELS = {'LOW': 0, 'MODERATE': 1, 'HIGH': 2}
+N_INPUTS = HOURS * DAYS_OF_WEEK * AREA_SCORES
+
+# Every column fits in one byte
+CSV_DTYPES = {name: np.int8 for name in FEATURES + [TARGET]}
+
+
+def empty_counts():
+    return np.zeros((N_INPUTS, CROWD_CLASSES), dtype=np.int64)
+
+
+def input_index(hours, days, area_scores):
+    """Flat index of each (hour, day_of_week, area_score) row into a count table."""
+    scores = np.clip(np.asarray(area_scores, dtype=np.int64), 1, AREA_SCORES) - 1
+    return (np.asarray(hours, dtype=np.int64) * DAYS_OF_WEEK + np.asarray(days, dtype=np.int64)) * AREA_SCORES + scores
+
+
+def add_counts(counts, hours, days, area_scores, levels):
+    """Adds one chunk of observations to `counts` in place."""
+    flat = input_index(hours, days, area_scores) * CROWD_CLASSES + np.asarray(levels, dtype=np.int64)
+    counts += np.bincount(flat, minlength=counts.size).reshape(counts.shape)
+
+
+def count_csv_rows(path):
+    """Data rows in a CSV file (header excluded), counted without parsing."""
+    lines, last = 0, b''
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            lines += chunk.count(b'\n')
+            last = chunk[-1:]
+    if last and last != b'\n':
+        lines += 1 # No trailing newline
+    return max(lines - 1, 0)
+
+
+def csv_chunks(path, chunk_size):
+    """Yields (hours, days, area_scores, levels) arrays, `chunk_size` rows at a time."""
+    reader = pd.read_csv(path, usecols=FEATURES + [TARGET], dtype=CSV_DTYPES, chunksize=chunk_size)
+    for chunk in reader:
+        yield chunk['hour'].to_numpy(), chunk['day_of_week'].to_numpy(), chunk['area_score'].to_numpy(), chunk[TARGET].to_numpy()
+
+
+def queryset_chunks(rows, chunk_size):
+    """
+    Same as csv_chunks, for an iterable of (observed_at, area_score,
+    observed_crowd_status) tuples such as a values_list() queryset.
+    """
+    hours, days, scores, levels = [], [], [], []
+    for observed_at, area_score, status in rows:
+        hours.append(observed_at.hour)
+        days.append(observed_at.weekday())
+        scores.append(area_score)
+        levels.append(CROWD_LABELS.get(status, 0))
+        if len(hours) == chunk_size:
+            yield tuple(np.asarray(column, dtype=np.int8) for column in (hours, days, scores, levels))
+            hours, days, scores, levels = [], [], [], []
+    if hours:
+        yield tuple(np.asarray(column, dtype=np.int8) for column in (hours, days, scores, levels))
+
+
+def split_counts(chunks, total_rows, holdout):
+    """
+    Folds `chunks` into (train, holdout) count tables. Sources are read in
+    time order, so the last `holdout` fraction of the rows is the newest data
+    and is kept for evaluation only.
+    """
+    train, test = empty_counts(), empty_counts()
+    n_train = total_rows - int(total_rows * holdout)
+    seen = 0
+    for hours, days, scores, levels in chunks:
+        cut = min(max(n_train - seen, 0), len(hours))
+        if cut:
+            add_counts(train, hours[:cut], days[:cut], scores[:cut], levels[:cut])
+        if cut < len(hours):
+            add_counts(test, hours[cut:], days[cut:], scores[cut:], levels[cut:])
+        seen += len(hours)
+    return train, test
+
+
+def weighted_samples(counts):
+    """Distinct (features, label) pairs with their observation counts as weights."""
+    inputs, labels = np.nonzero(counts)
+    hour, rest = np.divmod(inputs, DAYS_OF_WEEK * AREA_SCORES)
+    day, score = np.divmod(rest, AREA_SCORES)
+    X = np.column_stack([hour, day, score + 1]) # Columns in FEATURES order
+    return X, labels, counts[inputs, labels]
+
+
+def fit_forest(counts, n_estimators=100, n_jobs=-1, random_state=42, **params):
+    from sklearn.ensemble import RandomForestClassifier
+
+    X, y, weights = weighted_samples(counts)
+    model = RandomForestClassifier(n_estimators=n_estimators, n_jobs=n_jobs, random_state=random_state, **params)
+    model.fit(X, y, sample_weight=weights)
+    return model
+
+
+def evaluate(table, counts):
+    """
+    Accuracy of a prediction table (see lookup.build_prediction_table) on the
+    observations in `counts`, next to always guessing the most common level.
+    """
+    total = int(counts.sum())
+    if not total:
+        return {'rows': 0, 'accuracy': None, 'baseline_accuracy': None}
+    predicted = table.reshape(-1).astype(np.int64)
+    correct = counts[np.arange(N_INPUTS), predicted].sum()
+    return {
+        'rows': total,
+        'accuracy': round(float(correct / total), 4),
+        'baseline_accuracy': round(float(counts.sum(axis=0).max() / total), 4),
+    }
+
+
+def synthetic_csv(path, rows, chunk_size=1_000_000, seed=0):
+    """
+    Writes `rows` rows of mock observations (the generate_data.py rules,
+    vectorized) to `path`; used for benchmarks.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        f.write(','.join(FEATURES + [TARGET]) + '\n')
+        for start in range(0, rows, chunk_size):
+            n = min(chunk_size, rows - start)
+            hour = rng.integers(10, 23, n)
+            day = rng.integers(0, 7, n)
+            score = rng.integers(1, 11, n)
+            # Higher crowds on Tuesday and during lunch hours
+            rush = (day == 1) | ((hour >= 13) & (hour <= 15))
+            level = np.where(rush, 1 + (rng.random(n) < 0.7), (rng.random(n) < 0.3).astype(np.int64))
+            np.savetxt(f, np.column_stack([hour, day, score, level]), fmt='%d', delimiter=',')
@@ -1,5 +1,15 @@
-from .utils import extract_coordinates
+from .spatial_index import bhandara_index
+from .nearest_cache import nearest_cache
+from .density import area_score
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
 class Bhandara(models.Model):
@@ -16,6 +26,9 @@ class Bhandara(models.Model):
     
     # Time & Status
     start_time = models.DateTimeField(default=timezone.now)
+    # Left blank: filled in on approval, RADAR_DEFAULT_DURATION_HOURS after the start (or after a late approval).
+    # `manage.py expire_bhandaras` sets is_active=False after it
+    end_time = models.DateTimeField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
     
     # ML / Crowd Status (Will be updated by our Random Forest model later)
@@ -25,6 +38,17 @@ class Bhandara(models.Model):
         ('HIGH', 'Heavy Rush'),
     )
     current_crowd_status = models.CharField(max_length=20, choices=CROWD_CHOICES, default='LOW')
+    # When the snapshot_crowd_status job last wrote current_crowd_status, and the model version that scored it
+    crowd_status_updated_at = models.DateTimeField(blank=True, null=True)
+    crowd_status_model = models.CharField(max_length=40, blank=True)
+    # Crowd model input (1-10): density of the location's grid cell, set on save and by build_density_grid
+    area_score = models.PositiveSmallIntegerField(default=5)
+    # The crowd someone actually saw there (staff, the organizer) and when: the model's training labels.
+    # Left blank: nothing was observed. current_crowd_status is the model's own guess and is never trained on
+    observed_crowd_status = models.CharField(max_length=20, choices=CROWD_CHOICES, blank=True, null=True)
+    crowd_observed_at = models.DateTimeField(blank=True, null=True)
+    # When the observation was last written (set on save): incremental training runs pick up what changed by it
+    crowd_recorded_at = models.DateTimeField(blank=True, null=True, editable=False, db_index=True)
 
     # Security & Admin Controls
     is_approved = models.BooleanField(default=False) # False = Hidden from public, True = Live
@@ -33,18 +57,348 @@ class Bhandara(models.Model):
     class Meta:
         verbose_name = 'Bhandara Location'
         verbose_name_plural = 'Bhandara Locations'
+        indexes = [
+            # Bounding-box prefilter of the nearest queries
+            models.Index(fields=['latitude', 'longitude'], name='bhandara_lat_lng_idx'),
+            # Live feed and radar queries: approved, not yet ended rows only, newest first
+            models.Index(
+                fields=['-start_time'],
+                condition=models.Q(is_approved=True, is_active=True),
+                name='bhandara_live_start_idx',
+            ),
+            # Expiry and archiving jobs
+            models.Index(fields=['end_time'], name='bhandara_end_time_idx'),
+        ]
 
     def __str__(self):
         status = "🟢 Live" if self.is_approved else "🔴 Pending"
         return f"{self.area_name or 'Unknown'} | {status}"
     
     def save(self, *args, **kwargs):
-        # If latitude and longitude are empty, but we have a URL, extract them!
-        if self.google_maps_url and not (self.latitude and self.longitude):
-            lat, lng = extract_coordinates(self.google_maps_url)
-            if lat and lng:
-                self.latitude = lat
-                self.longitude = lng
-        
+        # Most links already contain their coordinates (or we resolved them before)
+        fill_known_coordinates(self, kwargs.get('update_fields'))
+
+        # A pending submission's clock only starts once it goes live
+        if self.end_time is None and self.is_approved:
+            self.end_time = default_end_time(self.start_time if self.pk is None else max(self.start_time, timezone.now()))
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'end_time'}
+
+        # A new or changed observation is stamped as written now. A changed level is a new sighting:
+        # made just now unless its time was changed with it (an observation entered without a time too)
+        observation = (self.observed_crowd_status, self.crowd_observed_at)
+        update_fields = kwargs.get('update_fields')
+        if self.observed_crowd_status and (update_fields is None or {'observed_crowd_status', 'crowd_observed_at'} & set(update_fields)):
+            stored = None
+            if self.pk is not None:
+                stored = Bhandara.objects.filter(pk=self.pk).values_list('observed_crowd_status', 'crowd_observed_at').first()
+            if observation != stored:
+                now = timezone.now()
+                if self.crowd_observed_at is None or (stored and stored[0] != self.observed_crowd_status and stored[1] == self.crowd_observed_at):
+                    self.crowd_observed_at = now
+                self.crowd_recorded_at = now
+                if update_fields is not None:
+                    kwargs['update_fields'] = set(update_fields) | {'crowd_observed_at', 'crowd_recorded_at'}
+
+        # Score the location once here instead of on every prediction
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'latitude', 'longitude', 'area_name'} & set(update_fields):
+            score = area_score(self.latitude, self.longitude, self.area_name)
+            changed = {'area_score'}
+            if self.pk is not None and score != self.area_score:
+                self.crowd_status_updated_at = None # Its stored snapshot was scored from the old area score
+                changed.add('crowd_status_updated_at')
+            self.area_score = score
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | changed
+
         # Call the standard Django save process
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+        # If latitude and longitude are empty, but we have a URL, let the worker extract them!
+        CoordinateJob.enqueue_if_needed(self, kwargs.get('update_fields'))
+
+
+def default_end_time(start_time):
+    """When a Bhandara submitted without an end time goes off the radar."""
+    return start_time + timedelta(hours=getattr(settings, 'RADAR_DEFAULT_DURATION_HOURS', 6))
+
+
+def fill_known_coordinates(instance, update_fields=None):
+    """
+    Fills in latitude/longitude before a save when they can be had without a
+    network call: parsed from the Maps URL itself or from ResolvedMapsUrl.
+    Partial saves are left to the coordinate queue.
+    """
+    if not instance.google_maps_url or (instance.latitude and instance.longitude):
+        return
+    if update_fields is not None:
+        return
+
+    from .geocoding import cached_coordinates
+    lat, lng, _ = cached_coordinates(instance.google_maps_url)
+    if lat is not None:
+        instance.latitude = lat
+        instance.longitude = lng
+
+
+class DensityCell(models.Model):
+    """
+    One cell of the area-density grid (RADAR_DENSITY_CELL_DEGREES wide),
+    rebuilt by `manage.py build_density_grid` from where Bhandaras, Tourist
+    Spots and Posts are.
+    """
+    row = models.IntegerField()
+    col = models.IntegerField()
+    # Points in this cell and its 8 neighbours
+    observations = models.PositiveIntegerField()
+    score = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['row', 'col'], name='unique_density_cell'),
+        ]
+
+    def __str__(self):
+        return f"Cell ({self.row}, {self.col}) | score {self.score}"
+
+
+class BhandaraArchive(models.Model):
+    """
+    Bhandaras that ended more than RADAR_ARCHIVE_AFTER_DAYS ago, moved out of
+    the live table by `manage.py expire_bhandaras` so it (and its indexes)
+    only holds current events. Crowd model training and the density grid
+    read the history from here; the radar never does.
+    """
+    original_id = models.PositiveBigIntegerField(unique=True) # Its Bhandara pk
+    google_maps_url = models.URLField(max_length=500)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    area_name = models.CharField(max_length=100, blank=True, null=True)
+    organizer_name = models.CharField(max_length=200, blank=True, null=True)
+    business_name = models.CharField(max_length=200, blank=True, null=True)
+    menu_details = models.CharField(max_length=255, blank=True, null=True)
+    start_time = models.DateTimeField(db_index=True)
+    end_time = models.DateTimeField()
+    current_crowd_status = models.CharField(max_length=20, choices=Bhandara.CROWD_CHOICES, default='LOW')
+    observed_crowd_status = models.CharField(max_length=20, choices=Bhandara.CROWD_CHOICES, blank=True, null=True)
+    crowd_observed_at = models.DateTimeField(blank=True, null=True)
+    crowd_recorded_at = models.DateTimeField(blank=True, null=True, editable=False, db_index=True)
+    area_score = models.PositiveSmallIntegerField(default=5)
+    is_approved = models.BooleanField(default=False)
+    is_verified_owner = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Archived Bhandara'
+        verbose_name_plural = 'Archived Bhandaras'
+
+    def __str__(self):
+        return f"{self.area_name or 'Unknown'} | {self.start_time:%d %b %Y}"
+
+
+class CoordinateJob(models.Model):
+    """
+    A pending Google Maps lookup for a row that was saved without coordinates.
+    Processed outside the request cycle by `manage.py resolve_coordinates`.
+    """
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    # The Bhandara / TouristSpot waiting for its coordinates
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    target = GenericForeignKey('content_type', 'object_id')
+    google_maps_url = models.URLField(max_length=500)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Not picked up before this time (retry backoff, or the lease of a running job)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='unique_coordinate_job_per_row'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type.model} #{self.object_id} | {self.status}"
+
+    @classmethod
+    def enqueue_if_needed(cls, instance, update_fields=None):
+        """
+        Queues the coordinate lookup for a saved row that has a Maps URL but no
+        coordinates. Partial saves that don't touch the URL (view counters etc.)
+        never queue anything, and a lookup already waiting is left alone.
+        """
+        if not instance.google_maps_url or (instance.latitude and instance.longitude):
+            return
+        if update_fields is not None and 'google_maps_url' not in update_fields:
+            return
+
+        job, created = cls.objects.get_or_create(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk,
+            defaults={'google_maps_url': instance.google_maps_url},
+        )
+        if not created and (job.google_maps_url != instance.google_maps_url or job.status in ('DONE', 'FAILED')):
+            job.google_maps_url = instance.google_maps_url
+            job.status = 'PENDING'
+            job.attempts = 0
+            job.run_after = timezone.now()
+            job.last_error = ''
+            job.save()
+
+
+class ResolvedMapsUrl(models.Model):
+    """
+    Persistent cache of Google Maps links we already resolved over the network.
+    Rows with no coordinates are negative entries: the link expanded fine but
+    carried no location, so we don't ask Google again until they expire.
+    """
+    url_hash = models.CharField(max_length=64, unique=True) # sha256 of the normalized URL
+    url = models.URLField(max_length=500)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    resolved_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        found = f"{self.latitude}, {self.longitude}" if self.latitude is not None else "no coordinates"
+        return f"{self.url} -> {found}"
+
+class TableVersion(models.Model):
+    """
+    Change counter of a group of tables ('radar': Bhandaras, 'tourism':
+    spots, cities and states), bumped on every write. The read APIs turn it
+    into their ETag / Last-Modified (see upzunction/conditional.py), so a
+    repeat request costs one primary-key lookup.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Call after any write to the group, including update()/bulk_update() that skip signals.
+        Returns the new version. Also drops this process's cached nearest answers for the group (see nearest_cache.py).
+        """
+        nearest_cache.invalidate(name)
+        now = timezone.now()
+        if not cls.objects.filter(name=name).update(version=F('version') + 1, updated_at=now):
+            _, created = cls.objects.get_or_create(name=name, defaults={'version': 1, 'updated_at': now})
+            if not created: # Another process created it in between
+                cls.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+        return cls.objects.filter(name=name).values_list('version', flat=True).first()
+
+    @classmethod
+    def current(cls, name):
+        """(version, updated_at); (0, None) before the first write."""
+        row = cls.objects.filter(name=name).values_list('version', 'updated_at').first()
+        return row or (0, None)
+
+    @classmethod
+    async def acurrent(cls, name):
+        """current() for async views."""
+        row = await cls.objects.filter(name=name).values_list('version', 'updated_at').afirst()
+        return row or (0, None)
+
+
+class RadarEvent(models.Model):
+    """
+    Change log of the live radar: Bhandaras going live (or changing), crowd
+    status changes and Bhandaras leaving the radar. Tailed once per process
+    by the /radar/api/stream/ broadcaster (see events.py) and read directly
+    by the /radar/api/events/ poll fallback; the id is the clients' cursor.
+    """
+    KIND_CHOICES = (
+        ('live', 'Live / updated'),
+        ('crowd', 'Crowd status changed'),
+        ('gone', 'No longer live'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Not a foreign key: the event must outlive a deleted Bhandara
+    bhandara_id = models.PositiveBigIntegerField()
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} Bhandara {self.bhandara_id}"
+
+    def as_dict(self):
+        return {'id': self.pk, 'kind': self.kind, 'bhandara_id': self.bhandara_id, **self.payload}
+
+    @staticmethod
+    def crowd_payload(bhandara):
+        return {
+            'crowd_raw': bhandara.current_crowd_status,
+            'crowd_status': bhandara.get_current_crowd_status_display(),
+        }
+
+    @classmethod
+    def live_payload(cls, bhandara):
+        return {
+            'title': bhandara.business_name if bhandara.is_verified_owner else f"📍 Active Bhandara - {bhandara.area_name}",
+            'area': bhandara.area_name or "Unknown Area",
+            'is_verified': bhandara.is_verified_owner,
+            'lat': bhandara.latitude,
+            'lng': bhandara.longitude,
+            'url': bhandara.google_maps_url,
+            **cls.crowd_payload(bhandara),
+        }
+
+    @classmethod
+    def record_live(cls, bhandaras):
+        cls.objects.bulk_create([cls(kind='live', bhandara_id=b.pk, payload=cls.live_payload(b)) for b in bhandaras])
+
+    @classmethod
+    def record_crowd(cls, bhandaras):
+        cls.objects.bulk_create([cls(kind='crowd', bhandara_id=b.pk, payload=cls.crowd_payload(b)) for b in bhandaras], batch_size=500)
+
+    @classmethod
+    def record_gone(cls, bhandara_ids):
+        cls.objects.bulk_create([cls(kind='gone', bhandara_id=bhandara_id) for bhandara_id in bhandara_ids], batch_size=500)
+
+
+@receiver(pre_save, sender=Bhandara)
+def remember_if_live(sender, instance, raw=False, **kwargs):
+    # Only a save taking the row off the radar needs to know whether it was on it (one query)
+    instance._was_live = (
+        not raw
+        and instance.pk is not None
+        and not (instance.is_approved and instance.is_active)
+        and Bhandara.objects.filter(pk=instance.pk, is_approved=True, is_active=True).exists()
+    )
+
+@receiver(post_save, sender=Bhandara)
+def sync_bhandara_index(sender, instance, created, **kwargs):
+    bhandara_index.sync(instance, TableVersion.bump('radar'))
+
+    if instance.is_approved and instance.is_active:
+        RadarEvent.record_live([instance])
+    elif getattr(instance, '_was_live', False):
+        RadarEvent.record_gone([instance.pk]) # Clients drop it if they were showing it
+
+@receiver(post_delete, sender=Bhandara)
+def remove_from_bhandara_index(sender, instance, **kwargs):
+    # Pending and ended rows (e.g. the ones being archived) were never on the radar
+    if instance.is_approved and instance.is_active:
+        bhandara_index.remove([instance.pk], TableVersion.bump('radar'))
+        RadarEvent.record_gone([instance.pk])
+    else:
+        bhandara_index.remove([instance.pk])
@@ -0,0 +1,153 @@
+"""
+Response cache of the nearest-location APIs, keyed by the geohash cell of
+the user's position.
+
+People standing in the same crowd send nearly the same lat/lng, so one
+search from the centre of their ~150 m cell is shared by all of them. The
+entry holds every row that can be in the answer for *any* point of the
+cell, and each request ranks those rows from its own position, so distances
+(and the order) are exactly what a fresh search would return.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .utils import geohash_cell, haversine_distances, nearest_indices
+
+
+class Cell:
+    """A user's geohash cell: its hash, centre, and the farthest any point of it is from the centre."""
+    __slots__ = ('geohash', 'lat', 'lng', 'reach_km')
+
+    def __init__(self, geohash, lat, lng, reach_km):
+        self.geohash = geohash
+        self.lat = lat
+        self.lng = lng
+        self.reach_km = reach_km
+
+
+class CachedRanking:
+    """
+    The candidate rows of one cell (dicts without 'distance') and their
+    coordinates. `extra` holds whatever else the view needs to finish a
+    response for one user (e.g. the coordinates of the alternatives).
+    """
+    __slots__ = ('rows', 'lats', 'lngs', 'extra')
+
+    def __init__(self, rows, lats, lngs, extra=None):
+        self.rows = rows
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.extra = extra or {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def for_user(self, lat, lng, k=None, radius_km=None):
+        """[(row, distance_km), ...] ranked from (lat, lng), closest first."""
+        distances = haversine_distances(lat, lng, self.lats, self.lngs)
+        positions = np.arange(len(distances))
+        if radius_km is not None:
+            positions = np.flatnonzero(distances <= radius_km)
+        order = positions[nearest_indices(distances[positions], k)]
+        return [(self.rows[i], float(distances[i])) for i in order]
+
+
+async def cell_candidates(search, cell, k=None, radius_km=None):
+    """
+    Ids of every row that can be among the k closest (or within radius_km)
+    for some point of `cell`. `search(lat, lng, k=, radius_km=)` is the
+    view's own nearest search, returning (ids, distances) closest first.
+
+    A user is at most reach_km from the centre, so their k closest are all
+    within (k-th distance from the centre) + 2 x reach_km of it, and
+    everything within radius_km of them lies within radius_km + reach_km.
+    """
+    if radius_km is not None:
+        ids, _ = await search(cell.lat, cell.lng, radius_km=radius_km + cell.reach_km)
+        return ids
+    ids, distances = await search(cell.lat, cell.lng, k=k)
+    if k is None or len(ids) < k or not cell.reach_km:
+        return ids # Every row already, or a cell of one point
+    ids, _ = await search(cell.lat, cell.lng, radius_km=float(distances[-1]) + 2 * cell.reach_km)
+    return ids
+
+
+class NearestCache:
+    """
+    This process's cached rankings, least recently used first out once they
+    hold more than max_rows rows in total. Keys start with the TableVersion
+    name and version; bumping the counter (any save, approval or delete)
+    drops that table's entries here, and other workers miss on the new
+    version. precision=0 turns the cache off.
+    """
+
+    def __init__(self, precision=7, ttl=300, max_rows=200000):
+        self.precision = precision
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (expires_at, CachedRanking)
+        self._rows = 0
+
+    @property
+    def enabled(self):
+        return bool(self.precision)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cell(self, lat, lng):
+        """The geohash cell of (lat, lng); with the cache off, the point itself."""
+        if not self.enabled:
+            return Cell(None, lat, lng, 0.0)
+        geohash, (lat_min, lat_max, lng_min, lng_max) = geohash_cell(lat, lng, self.precision)
+        centre_lat, centre_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+        # The corner nearer the equator is the widest one
+        edge_lat = lat_min if abs(lat_min) < abs(lat_max) else lat_max
+        reach_km = float(haversine_distances(centre_lat, centre_lng, [edge_lat], [lng_max])[0])
+        return Cell(geohash, centre_lat, centre_lng, reach_km)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, ranking):
+        if not self.enabled or len(ranking) > self.max_rows:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, ranking)
+            self._rows += len(ranking)
+            while self._rows > self.max_rows:
+                self._pop(next(iter(self._entries)))
+
+    def invalidate(self, table=None):
+        """Drops the entries of one table (the first item of their keys), or all of them."""
+        with self._lock:
+            for key in [key for key in self._entries if table is None or key[0] == table]:
+                self._pop(key)
+
+    def _pop(self, key):
+        _, ranking = self._entries.pop(key)
+        self._rows -= len(ranking)
+
+
+nearest_cache = NearestCache(
+    precision=getattr(settings, 'RADAR_NEAREST_CACHE_PRECISION', 7),
+    ttl=getattr(settings, 'RADAR_NEAREST_CACHE_TTL', 300),
+    max_rows=getattr(settings, 'RADAR_NEAREST_CACHE_MAX_ROWS', 200000),
+)
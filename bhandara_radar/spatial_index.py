@@ -0,0 +1,242 @@
+import math
+import threading
+import time
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .utils import EARTH_RADIUS_KM, haversine_distances, load_coordinates, nearest_indices
+
+# Length of one degree of latitude in kilometers
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class GridIndex:
+    """
+    In-memory spatial index of (id, latitude, longitude) points bucketed into a
+    fixed lat/lng grid. Nearest and radius queries only look at the cells around
+    the user instead of scanning every live point.
+    """
+
+    def __init__(self, cell_degrees=0.05):
+        self.cell_degrees = cell_degrees
+        self._lock = threading.RLock()
+        self._cells = {}   # (row, col) -> set of ids
+        self._points = {}  # id -> (lat, lng, (row, col))
+        self._bounds = None
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def load(self, rows):
+        """Replaces the whole index with the given (id, lat, lng) rows."""
+        with self._lock:
+            self._cells = {}
+            self._points = {}
+            self._bounds = None
+            for point_id, lat, lng in rows:
+                self._insert(int(point_id), float(lat), float(lng))
+
+    def add(self, point_id, lat, lng):
+        with self._lock:
+            self._remove(point_id)
+            self._insert(point_id, float(lat), float(lng))
+
+    def discard(self, point_id):
+        with self._lock:
+            self._remove(point_id)
+
+    def _insert(self, point_id, lat, lng):
+        cell = self._cell(lat, lng)
+        self._cells.setdefault(cell, set()).add(point_id)
+        self._points[point_id] = (lat, lng, cell)
+        self._bounds = None
+
+    def _remove(self, point_id):
+        point = self._points.pop(point_id, None)
+        if point is None:
+            return
+        bucket = self._cells.get(point[2])
+        if bucket is not None:
+            bucket.discard(point_id)
+            if not bucket:
+                del self._cells[point[2]]
+        self._bounds = None
+
+    def _grid_bounds(self):
+        if self._bounds is None:
+            rows = [cell[0] for cell in self._cells]
+            cols = [cell[1] for cell in self._cells]
+            self._bounds = (min(rows), max(rows), min(cols), max(cols))
+        return self._bounds
+
+    def _arrays(self, point_ids):
+        point_ids = list(point_ids)
+        ids = np.fromiter(point_ids, dtype=np.int64, count=len(point_ids))
+        lats = np.fromiter((self._points[i][0] for i in point_ids), dtype=np.float64, count=len(point_ids))
+        lngs = np.fromiter((self._points[i][1] for i in point_ids), dtype=np.float64, count=len(point_ids))
+        return ids, lats, lngs
+
+    def _ranked(self, lat, lng, point_ids, k=None, radius_km=None):
+        ids, lats, lngs = self._arrays(point_ids)
+        distances = haversine_distances(lat, lng, lats, lngs)
+        if radius_km is not None:
+            inside = distances <= radius_km
+            ids, distances = ids[inside], distances[inside]
+        order = nearest_indices(distances, k)
+        return [(int(ids[i]), float(distances[i])) for i in order]
+
+    def query(self, lat, lng, k=None, radius_km=None):
+        """
+        Returns [(id, distance_km), ...] closest first.
+        `k` caps the number of results, `radius_km` drops anything further away.
+        """
+        with self._lock:
+            if not self._points:
+                return []
+            if radius_km is not None:
+                return self._ranked(lat, lng, self._within_box(lat, lng, radius_km), k, radius_km)
+            if k is not None:
+                return self._ranked(lat, lng, self._ring_search(lat, lng, k), k)
+            return self._ranked(lat, lng, self._points)
+
+    def _within_box(self, lat, lng, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + lat_span, 90.0))), 1e-6)
+        lng_span = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+
+        row_min, col_min = self._cell(lat - lat_span, lng - lng_span)
+        row_max, col_max = self._cell(lat + lat_span, lng + lng_span)
+
+        # A huge radius covers more cells than we have; walk the occupied ones instead
+        if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self._cells):
+            cells = [
+                cell for cell in self._cells
+                if row_min <= cell[0] <= row_max and col_min <= cell[1] <= col_max
+            ]
+        else:
+            cells = [
+                (row, col)
+                for row in range(row_min, row_max + 1)
+                for col in range(col_min, col_max + 1)
+                if (row, col) in self._cells
+            ]
+        return [point_id for cell in cells for point_id in self._cells[cell]]
+
+    def _ring_search(self, lat, lng, k):
+        """
+        Walks square rings of cells outwards from the user's cell until the k-th
+        closest candidate is nearer than anything outside the rings can be.
+        """
+        row0, col0 = self._cell(lat, lng)
+        row_min, row_max, col_min, col_max = self._grid_bounds()
+        max_ring = max(row0 - row_min, row_max - row0, col0 - col_min, col_max - col0, 0)
+
+        candidates = []
+        visited = 0
+        ring = 0
+        while True:
+            for row in range(row0 - ring, row0 + ring + 1):
+                step = 1 if abs(row - row0) == ring else max(2 * ring, 1)
+                for col in range(col0 - ring, col0 + ring + 1, step):
+                    visited += 1
+                    bucket = self._cells.get((row, col))
+                    if bucket:
+                        candidates.extend(bucket)
+
+            if ring >= max_ring:
+                return candidates
+            # Sparse data far from the user: a plain scan is cheaper than more rings
+            if visited > len(self._cells) * 4:
+                return list(self._points)
+
+            if len(candidates) >= k:
+                _, lats, lngs = self._arrays(candidates)
+                kth = np.partition(haversine_distances(lat, lng, lats, lngs), k - 1)[k - 1]
+                edge_lat = min(abs(lat) + (ring + 1) * self.cell_degrees, 90.0)
+                covered_km = ring * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+                if kth <= covered_km:
+                    return candidates
+            ring += 1
+
+
+class BhandaraIndex(GridIndex):
+    """
+    The live (approved, not ended, with GPS) Bhandaras of this process. Kept
+    up to date by the post_save/post_delete signals in models.py and fully
+    rebuilt from the database every RADAR_INDEX_MAX_AGE seconds, or as soon
+    as a request has read a newer 'radar' TableVersion than the one the
+    index holds (a write by another worker, or a queryset.update()). So a
+    response is never older than the ETag it is sent under.
+    """
+
+    def __init__(self, cell_degrees=0.05, max_age=300):
+        super().__init__(cell_degrees)
+        self.max_age = max_age
+        self._built_at = None
+        # The 'radar' counter every write up to which is in the index
+        self.version = None
+
+    def invalidate(self):
+        self._built_at = None
+
+    def ensure_fresh(self, version=None):
+        """Rebuilds the index when it is too old, or older than `version` (the counter a request read)."""
+        # The rebuild holds the lock, so no signal update can land in between and be overwritten
+        with self._lock:
+            if (
+                self._built_at is None
+                or time.monotonic() - self._built_at > self.max_age
+                or (version is not None and (self.version is None or self.version < version))
+            ):
+                self.rebuild()
+        return self
+
+    async def aensure_fresh(self, version=None):
+        """ensure_fresh for async views, run in the request's thread like the async ORM's own queries."""
+        return await sync_to_async(self.ensure_fresh)(version)
+
+    def rebuild(self):
+        from .models import Bhandara, TableVersion
+
+        # Counter first: the rows read after it hold at least every write it counts
+        version, _ = TableVersion.current('radar')
+        ids, lats, lngs = load_coordinates(Bhandara.objects.filter(is_approved=True, is_active=True))
+        with self._lock:
+            self.load(zip(ids, lats, lngs))
+            self._built_at = time.monotonic()
+            self.version = version
+
+    def sync(self, bhandara, version=None):
+        """
+        Adds, moves or removes a single Bhandara after it was saved.
+        `version` is what the save bumped the 'radar' counter to.
+        """
+        with self._lock:
+            if bhandara.is_approved and bhandara.is_active and bhandara.latitude is not None and bhandara.longitude is not None:
+                self.add(bhandara.pk, bhandara.latitude, bhandara.longitude)
+            else:
+                self.discard(bhandara.pk)
+            self._advance(version)
+
+    def remove(self, bhandara_ids, version=None):
+        """Drops Bhandaras that were deleted or ended; `version` as in sync()."""
+        with self._lock:
+            for bhandara_id in bhandara_ids:
+                self.discard(bhandara_id)
+            self._advance(version)
+
+    def _advance(self, version):
+        # Still current if this was the only write since; otherwise the next request rebuilds
+        if version is not None and self.version == version - 1:
+            self.version = version
+
+
+bhandara_index = BhandaraIndex(
+    cell_degrees=getattr(settings, 'RADAR_INDEX_CELL_DEGREES', 0.05),
+    max_age=getattr(settings, 'RADAR_INDEX_MAX_AGE', 300),
+)
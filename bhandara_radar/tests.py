@@ -1,3 +1,892 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.admin.sites import site
+from django.core.management import call_command
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+import numpy as np
+from upzunction.testing import QueryPlanTestCase
+from . import coordinate_queue, events
+from .bulk_import import BhandaraImporter
+from .density import area_score, density_grid, density_scores
+from .events import broadcaster
+from .lifecycle import archive_ended, deactivate_expired
+from .ml_engine import training
+from .ml_engine.forest import CompactForest, export_forest
+from .ml_engine.lookup import build_prediction_table
+from .ml_engine.registry import ActiveModel, LoadedModel, activate, load_checkpoint, publish
+from .management.commands.train_crowd_model import Command as TrainCrowdModel
+from .ml_engine.predict import CROWD_LEVELS, SmartAlternatives, current_model_version, get_area_score, predict_crowd_for_rows
+from .models import Bhandara, BhandaraArchive, CoordinateJob, DensityCell, RadarEvent, TableVersion
+from .nearest_cache import nearest_cache
+from .spatial_index import GridIndex, bhandara_index
+from .utils import haversine_distances, nearest_in_box, normalize_maps_url, parse_coordinates
+
+
+class MapsUrlTests(TestCase):
+    """Coordinates are read from the link itself, and they are the Bhandara's, not the sharer's."""
+
+    def test_parse_coordinates(self):
+        cases = {
+            'https://www.google.com/maps/place/Hanuman+Setu/@26.86,80.93,17z/data=!3d26.8612!4d80.9345': (26.8612, 80.9345),
+            'https://www.google.com/maps/@26.85,80.94,15z': (26.85, 80.94),
+            'https://maps.google.com/?q=26.85,80.94': (26.85, 80.94),
+            'https://www.google.com/maps/search/?api=1&query=26.85%2C80.94': (26.85, 80.94),
+            'https://www.google.com/maps/place/26.85,80.94': (26.85, 80.94),
+            # Directions: the destination, never where the sharer set off from
+            'https://maps.google.com/maps?saddr=26.80,80.90&daddr=26.85,80.94': (26.85, 80.94),
+            'https://www.google.com/maps/dir/?api=1&origin=26.80,80.90&destination=26.85,80.94': (26.85, 80.94),
+            'https://www.google.com/maps/dir/26.80,80.90/26.85,80.94/@26.82,80.92,14z': (26.85, 80.94),
+            'https://maps.google.com/maps?saddr=26.80,80.90': (None, None),
+            'https://maps.app.goo.gl/abc123': (None, None),
+            'https://www.google.com/maps?q=95.0,80.94': (None, None),
+            '': (None, None),
+        }
+        for url, expected in cases.items():
+            with self.subTest(url=url):
+                self.assertEqual(parse_coordinates(url), expected)
+
+    def test_normalize_maps_url(self):
+        self.assertEqual(normalize_maps_url(' https://maps.app.goo.gl/AbC123/?g_st=iw '), 'https://maps.app.goo.gl/AbC123')
+        self.assertEqual(normalize_maps_url('HTTPS://Maps.App.Goo.gl/AbC123'), 'https://maps.app.goo.gl/AbC123')
+        # Long links keep their query: it is where the coordinates are
+        self.assertEqual(normalize_maps_url('https://maps.google.com/?q=26.85,80.94 '), 'https://maps.google.com/?q=26.85,80.94')
+
+
+class GridIndexTests(SimpleTestCase):
+    """Ring and box searches give exactly what scanning every point would."""
+
+    def setUp(self):
+        rng = random.Random(3)
+        # Dense in the city, sparse around it, and a few far away
+        self.points = {
+            i: (26.85 + rng.gauss(0, 0.02 if i % 4 else 0.5), 80.95 + rng.gauss(0, 0.02 if i % 4 else 0.5))
+            for i in range(1, 600)
+        }
+        self.points[600] = (-33.87, 151.21)
+        self.index = GridIndex(cell_degrees=0.05)
+        self.index.load((i, lat, lng) for i, (lat, lng) in self.points.items())
+
+    def brute_force(self, lat, lng, k=None, radius_km=None):
+        ids = list(self.points)
+        distances = haversine_distances(lat, lng, [self.points[i][0] for i in ids], [self.points[i][1] for i in ids])
+        ranked = sorted(zip(ids, distances.tolist()), key=lambda row: row[1])
+        if radius_km is not None:
+            ranked = [row for row in ranked if row[1] <= radius_km]
+        return ranked[:k]
+
+    def assertSameRanking(self, lat, lng, **options):
+        found = self.index.query(lat, lng, **options)
+        expected = self.brute_force(lat, lng, **options)
+        self.assertEqual([i for i, _ in found], [i for i, _ in expected])
+        for (_, distance), (_, expected_distance) in zip(found, expected):
+            self.assertAlmostEqual(distance, expected_distance, places=9)
+
+    def test_queries(self):
+        for lat, lng in ((26.85, 80.95), (26.90, 80.90), (27.5, 81.5), (10.0, 10.0)):
+            for options in ({'k': 1}, {'k': 10}, {'k': 1000}, {'radius_km': 0.5}, {'radius_km': 5},
+                            {'radius_km': 20000}, {'k': 5, 'radius_km': 3}, {}):
+                with self.subTest(lat=lat, lng=lng, **options):
+                    self.assertSameRanking(lat, lng, **options)
+
+    def test_add_and_discard(self):
+        self.index.add(1, 26.8501, 80.9501) # Moves point 1
+        self.points[1] = (26.8501, 80.9501)
+        self.index.discard(2)
+        del self.points[2]
+        self.index.discard(12345) # Not there: nothing happens
+        self.assertEqual(len(self.index), len(self.points))
+        self.assertSameRanking(26.85, 80.95, k=5)
+        self.assertSameRanking(26.85, 80.95, radius_km=2)
+
+
+class NearestInBoxTests(TestCase):
+    """Growing bounding-box searches rank rows exactly like a haversine scan of the whole table."""
+
+    points = [
+        # The city, and a few towns around it
+        (26.85, 80.95), (26.851, 80.952), (26.86, 80.94), (26.9, 81.0), (27.2, 80.6), (25.4, 81.8),
+        # Either side of the antimeridian
+        (0.0, 179.99), (0.0, -179.99), (0.0, 179.0), (-16.5, 179.5), (-16.5, -179.5),
+        # Around the north pole, and the far south
+        (89.99, 0.0), (89.99, 180.0), (89.5, 90.0), (88.0, -90.0), (-33.87, 151.21),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        Bhandara.objects.bulk_create([
+            Bhandara(google_maps_url='https://maps.app.goo.gl/abc123', latitude=lat, longitude=lng)
+            for lat, lng in cls.points
+        ])
+
+    def brute_force(self, lat, lng, k=None, radius_km=None):
+        rows = list(Bhandara.objects.values_list('id', 'latitude', 'longitude'))
+        distances = haversine_distances(lat, lng, [row[1] for row in rows], [row[2] for row in rows])
+        ranked = sorted(zip([row[0] for row in rows], distances.tolist()), key=lambda row: row[1])
+        if radius_km is not None:
+            ranked = [row for row in ranked if row[1] <= radius_km]
+        return ranked[:k]
+
+    def assertSameRanking(self, lat, lng, **options):
+        ids, distances = nearest_in_box(Bhandara.objects.all(), lat, lng, **options)
+        expected = self.brute_force(lat, lng, **options)
+        self.assertEqual(ids.tolist(), [i for i, _ in expected])
+        for distance, (_, expected_distance) in zip(distances.tolist(), expected):
+            self.assertAlmostEqual(distance, expected_distance, places=9)
+
+    def test_queries(self):
+        places = {
+            'city': (26.85, 80.95),
+            'antimeridian east': (0.0, 179.995),
+            'antimeridian west': (0.0, -179.995),
+            'fiji': (-16.5, 179.9),
+            'north pole': (90.0, 0.0),
+            'near the pole': (89.995, 45.0),
+            'south pole': (-90.0, 0.0),
+        }
+        for name, (lat, lng) in places.items():
+            for options in ({'k': 1}, {'k': 2}, {'k': 5}, {'radius_km': 5}, {'radius_km': 300}, {'k': 3, 'radius_km': 50}, {}):
+                with self.subTest(name, **options):
+                    self.assertSameRanking(lat, lng, **options)
+
+    def test_k_larger_than_the_table(self):
+        self.assertSameRanking(26.85, 80.95, k=100)
+        self.assertEqual(len(nearest_in_box(Bhandara.objects.all(), 26.85, 80.95, k=100)[0]), len(self.points))
+
+    def test_empty_table(self):
+        Bhandara.objects.all().delete()
+        for options in ({'k': 5}, {'radius_km': 5}, {}):
+            with self.subTest(**options):
+                ids, distances = nearest_in_box(Bhandara.objects.all(), 26.85, 80.95, **options)
+                self.assertEqual((len(ids), len(distances)), (0, 0))
+
+    def test_full_scan_past_max_km(self):
+        expected = [i for i, _ in self.brute_force(0.0, -30.0, k=2)]
+        # Nothing within 1000 km of the Atlantic: boxes of 5, 10, ... 640 km, then one scan of the table
+        with self.assertNumQueries(9):
+            ids, _ = nearest_in_box(Bhandara.objects.all(), 0.0, -30.0, k=2)
+        self.assertEqual(ids.tolist(), expected)
+        # A smaller max_km gives up on boxes sooner
+        with self.assertNumQueries(2):
+            ids, _ = nearest_in_box(Bhandara.objects.all(), 0.0, -30.0, k=2, max_km=8)
+        self.assertEqual(ids.tolist(), expected)
+
+
+class HotQueryIndexTests(QueryPlanTestCase):
+    """The radar feed and nearest API must be answered from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Bhandara.objects.bulk_create([
+            Bhandara(
+                google_maps_url='https://www.google.com/maps/@26.85,80.94,15z',
+                latitude=26.80 + i * 0.005,
+                longitude=80.90 + i * 0.005,
+                area_name='Alambagh' if i % 2 else 'Gomti Nagar',
+                start_time=timezone.now() - timedelta(hours=i),
+                is_approved=bool(i % 4),
+            )
+            for i in range(50)
+        ])
+
+    def setUp(self):
+        bhandara_index.invalidate()
+        nearest_cache.invalidate()
+
+    def test_feed(self):
+        self.assertUsesIndexes('/radar/', 'bhandara_radar_bhandara')
+
+    def test_nearest_api(self):
+        self.assertUsesIndexes('/radar/api/nearest/?lat=26.85&lng=80.95&k=5', 'bhandara_radar_bhandara')
+
+    def test_nearest_api_box_query(self):
+        with self.settings(RADAR_SPATIAL_INDEX=False):
+            self.assertUsesIndexes('/radar/api/nearest/?lat=26.85&lng=80.95&k=5', 'bhandara_radar_bhandara')
+
+
+class ConditionalGetTests(TestCase):
+    """Repeat nearest requests are answered with a 304 until a Bhandara changes."""
+
+    url = '/radar/api/nearest/?lat=26.85&lng=80.95&k=5'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bhandara = Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.85,80.94,15z',
+            area_name='Alambagh',
+            is_approved=True,
+        )
+
+    def setUp(self):
+        nearest_cache.invalidate()
+
+    def test_unchanged_data_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        # Only the change counter is read
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_saved_bhandara_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.bhandara.menu_details = 'Puri Sabzi'
+        self.bhandara.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+    def test_write_by_another_worker_is_served_under_its_etag(self):
+        bhandara_index.invalidate()
+        etag = self.client.get(self.url)['ETag']
+        # Another worker's write: this process's index and nearest cache never saw it
+        Bhandara.objects.bulk_create([Bhandara(
+            google_maps_url='https://www.google.com/maps/@26.85,80.95,15z',
+            latitude=26.85,
+            longitude=80.95,
+            is_approved=True,
+            end_time=timezone.now() + timedelta(hours=1),
+        )])
+        TableVersion.objects.filter(name='radar').update(version=F('version') + 1)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['bhandaras']), 2)
+
+
+class NearestCacheTests(TestCase):
+    """Users in the same geohash cell share one ranking, but get their own exact distances."""
+
+    # Two users ~60 m apart, in the same ~150 m cell
+    first_url = '/radar/api/nearest/?lat=26.84950&lng=80.94900&k=5'
+    second_url = '/radar/api/nearest/?lat=26.85000&lng=80.94950&k=5'
+
+    @classmethod
+    def setUpTestData(cls):
+        Bhandara.objects.bulk_create([
+            Bhandara(
+                google_maps_url='https://www.google.com/maps/@26.85,80.94,15z',
+                latitude=26.845 + (i % 5) * 0.002,
+                longitude=80.945 + (i // 5) * 0.002,
+                area_name='Alambagh',
+                start_time=timezone.now(),
+                is_approved=True,
+            )
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        bhandara_index.invalidate()
+        nearest_cache.invalidate()
+
+    def test_same_cell_is_served_from_cache(self):
+        self.client.get(self.first_url)
+        # Only the change counter is read
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.second_url).json()
+
+        with mock.patch.object(nearest_cache, 'precision', 0):
+            fresh = self.client.get(self.second_url).json()
+        self.assertEqual(cached, fresh)
+
+    def test_miss_reads_only_the_returned_rows(self):
+        bhandara_index.ensure_fresh()
+        # The change counter, then the 5 rows sent back: no query over every live row
+        with self.assertNumQueries(2):
+            rows = self.client.get(self.first_url + '&fields=id,crowd_raw').json()['bhandaras']
+        self.assertEqual(len(rows), 5)
+
+    def test_cached_alternatives_are_each_users_own(self):
+        rng = random.Random(7)
+        Bhandara.objects.bulk_create([
+            Bhandara(
+                google_maps_url='https://www.google.com/maps/@26.85,80.94,15z',
+                latitude=26.85 + rng.uniform(-0.02, 0.02),
+                longitude=80.95 + rng.uniform(-0.02, 0.02),
+                area_name='Alambagh',
+                start_time=timezone.now(),
+                is_approved=True,
+                current_crowd_status='HIGH' if i % 3 == 0 else 'LOW',
+                crowd_status_updated_at=timezone.now(),
+                crowd_status_model=current_model_version() or '',
+            )
+            for i in range(200)
+        ])
+        cell = nearest_cache.cell(26.85, 80.95)
+        users = [(cell.lat + rng.uniform(-0.001, 0.001), cell.lng + rng.uniform(-0.001, 0.001)) for _ in range(200)]
+        users = [user for user in users if nearest_cache.cell(*user).geohash == cell.geohash][:20]
+        self.assertGreater(len(users), 5)
+
+        for query in ('', '&alt_radius_km=1.5'):
+            for lat, lng in users:
+                url = f'/radar/api/nearest/?lat={lat}&lng={lng}&k=20&fields=id,crowd_raw,alternatives{query}'
+                cached = self.client.get(url).json()
+                with mock.patch.object(nearest_cache, 'precision', 0):
+                    fresh = self.client.get(url).json()
+                self.assertEqual(cached, fresh)
+                self.assertTrue(any(row['alternatives'] for row in cached['bhandaras']))
+
+    def test_saved_bhandara_drops_cached_rankings(self):
+        first = self.client.get(self.first_url).json()['bhandaras'][0]
+        self.assertEqual(len(nearest_cache), 1)
+
+        Bhandara.objects.filter(pk=first['id']).get().delete()
+        self.assertEqual(len(nearest_cache), 0)
+        ids = [row['id'] for row in self.client.get(self.first_url).json()['bhandaras']]
+        self.assertNotIn(first['id'], ids)
+
+
+def fitted_forest(seed, n_estimators=10):
+    """A small crowd forest fitted on random observations."""
+    rng = np.random.default_rng(seed)
+    counts = training.empty_counts()
+    size = 5000
+    training.add_counts(counts, rng.integers(0, 24, size), rng.integers(0, 7, size), rng.integers(1, 11, size), rng.integers(0, 3, size))
+    return training.fit_forest(counts, n_estimators=n_estimators, n_jobs=1, random_state=seed)
+
+
+class CompactForestTests(SimpleTestCase):
+    """The exported forest answers exactly like the sklearn model it came from."""
+
+    def test_same_answers_as_sklearn(self):
+        model = fitted_forest(seed=1)
+        with tempfile.TemporaryDirectory() as path:
+            export_forest(model, path)
+            forest = CompactForest(path)
+
+            # Every input the radar can ask about, and some it never does
+            hours, days, scores = np.meshgrid(np.arange(24), np.arange(7), np.arange(1, 11), indexing='ij')
+            X = np.column_stack([hours.ravel(), days.ravel(), scores.ravel()]).astype(float)
+            X = np.vstack([X, np.random.default_rng(2).uniform(-5, 30, (500, 3))])
+
+            np.testing.assert_array_equal(forest.predict_proba(X), model.predict_proba(X))
+            np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+            np.testing.assert_array_equal(build_prediction_table(forest), build_prediction_table(model))
+
+
+class ModelRegistryTests(SimpleTestCase):
+    """Workers swap to a newly activated model, but never to one whose files don't match its checksum."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.first = publish(fitted_forest(seed=1), root=self.root)
+        self.active = ActiveModel(root=self.root, check_interval=0)
+
+    def test_hot_swap(self):
+        self.assertEqual(self.active.get().version, self.first)
+        second = publish(fitted_forest(seed=2, n_estimators=5), root=self.root)
+        self.assertEqual(self.active.get().version, second)
+
+    def test_bad_checksum_is_rejected(self):
+        self.assertEqual(self.active.get().version, self.first)
+        broken = publish(fitted_forest(seed=2, n_estimators=5), root=self.root, make_current=False)
+        # A file changed after publishing (disk corruption, a bad copy)
+        threshold_path = os.path.join(self.root, broken, 'threshold.npy')
+        thresholds = np.load(threshold_path)
+        np.save(threshold_path, thresholds + 1)
+
+        with self.assertRaisesMessage(ValueError, 'Checksum mismatch'):
+            LoadedModel(os.path.join(self.root, broken))
+
+        activate(broken, self.root)
+        with self.assertLogs('bhandara_radar.ml_engine.registry', 'WARNING'):
+            model = self.active.get()
+        # Keeps serving the model it had
+        self.assertEqual(model.version, self.first)
+
+
+class DensityTests(TestCase):
+    """area_score comes from how busy a location's grid cell and its neighbours are."""
+
+    def setUp(self):
+        density_grid.invalidate()
+        self.addCleanup(density_grid.invalidate)
+
+    def scores(self, points, weights=None):
+        rows, cols, observations, scores = density_scores([lat for lat, _ in points], [lng for _, lng in points], 0.01, weights)
+        return {(int(row), int(col)): (int(count), int(score)) for row, col, count, score in zip(rows, cols, observations, scores)}
+
+    def test_density_scores(self):
+        # A busy square, a quieter one, and a lone spot
+        points = [(26.855, 80.945)] * 20 + [(26.905, 80.995)] * 5 + [(27.205, 81.205)]
+        cells = self.scores(points)
+        self.assertEqual(len(cells), 27) # Every point's cell and its 8 neighbours
+        self.assertEqual(cells[(2685, 8094)], cells[(2686, 8095)]) # Neighbours count the same block
+        busy, quiet, lone = cells[(2685, 8094)], cells[(2690, 8099)], cells[(2720, 8120)]
+        self.assertEqual([busy[0], quiet[0], lone[0]], [20, 5, 1])
+        self.assertEqual([busy[1], quiet[1], lone[1]], [7, 4, 1])
+        self.assertTrue(all(1 <= score <= 10 for _, score in cells.values()))
+
+        # A weight counts as that many points
+        self.assertEqual(self.scores([(26.855, 80.945), (26.905, 80.995)], weights=[20, 5]), self.scores(points[:25]))
+        self.assertEqual(self.scores([]), {})
+
+    def test_area_score(self):
+        # No grid built yet: the area-name guess
+        self.assertEqual(area_score(26.855, 80.945, 'Hazratganj'), get_area_score('Hazratganj'))
+
+        DensityCell.objects.create(row=2685, col=8094, observations=20, score=9)
+        density_grid.invalidate()
+        self.assertEqual(area_score(26.855, 80.945, 'Hazratganj'), 9)
+        # Nothing seen around it is no evidence that it is quiet
+        self.assertEqual(area_score(27.5, 81.5, 'Hazratganj'), get_area_score('Hazratganj'))
+        self.assertEqual(area_score(None, None, 'Hazratganj'), get_area_score('Hazratganj'))
+
+    def test_reload_on_new_version(self):
+        self.assertIsNone(density_grid.ensure_fresh().score(26.855, 80.945))
+        # Rebuilt by another process: seen at the next check, well before max_age
+        DensityCell.objects.create(row=2685, col=8094, observations=20, score=9)
+        TableVersion.bump('density')
+        self.assertIsNone(density_grid.ensure_fresh().score(26.855, 80.945))
+        with mock.patch.object(density_grid, 'check_interval', 0):
+            self.assertEqual(density_grid.ensure_fresh().score(26.855, 80.945), 9)
+            # Unchanged: the counter is all that is read
+            with self.assertNumQueries(1):
+                density_grid.ensure_fresh()
+
+    def test_build_density_grid(self):
+        bhandara = Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.855,80.945,17z',
+            area_name='Hazratganj',
+            is_approved=True,
+        )
+        call_command('build_density_grid', stdout=io.StringIO())
+        self.assertEqual(DensityCell.objects.count(), 9)
+        bhandara.refresh_from_db()
+        self.assertEqual(bhandara.area_score, density_grid.score(bhandara.latitude, bhandara.longitude))
+
+
+class CrowdSnapshotTests(TestCase):
+    """A stored crowd status is served only while it is what the live model would say."""
+
+    def predict(self, updated_at, status_model):
+        rows = [(1, 5, 'HIGH', updated_at, status_model)]
+        with mock.patch('bhandara_radar.ml_engine.predict.get_live_crowd_predictions', return_value=[CROWD_LEVELS[1]]):
+            return predict_crowd_for_rows(rows)[1][0]
+
+    def test_snapshot_of_the_live_model(self):
+        self.assertEqual(self.predict(timezone.now(), current_model_version() or ''), 'HIGH')
+
+    def test_snapshot_of_another_model_is_rescored(self):
+        self.assertEqual(self.predict(timezone.now(), 'an-older-version'), 'MODERATE')
+
+    def test_snapshot_of_an_earlier_hour_is_rescored(self):
+        self.assertEqual(self.predict(timezone.now() - timedelta(hours=1), current_model_version() or ''), 'MODERATE')
+
+    def test_new_area_score_drops_the_snapshot(self):
+        bhandara = Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.85,80.94,17z',
+            area_name='Alambagh',
+            crowd_status_updated_at=timezone.now(),
+        )
+        Bhandara.objects.filter(pk=bhandara.pk).update(area_score=F('area_score') % 10 + 1)
+        bhandara.refresh_from_db()
+        bhandara.latitude = 26.851
+        bhandara.save(update_fields=['latitude'])
+        bhandara.refresh_from_db()
+        self.assertIsNone(bhandara.crowd_status_updated_at)
+
+
+class RadarEventTests(TestCase):
+    """Radar clients hear about rows going live and leaving, through the poll API or the SSE stream."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.live = Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.85,80.94,17z',
+            area_name='Alambagh',
+            is_approved=True,
+        )
+
+    def events(self, since=None):
+        return self.client.get('/radar/api/events/' + ('' if since is None else f'?since={since}')).json()
+
+    def test_poll(self):
+        cursor = self.events()['cursor']
+        self.assertEqual(cursor, RadarEvent.objects.get().pk)
+
+        # A pending submission, then the coordinate queue filling it in: never on the radar, nothing to say
+        pending = Bhandara.objects.create(google_maps_url='https://maps.app.goo.gl/abc123')
+        pending.latitude, pending.longitude = 26.86, 80.95
+        pending.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(self.events(cursor), {'events': [], 'cursor': cursor, 'more': False})
+
+        pending.is_approved = True
+        pending.save()
+        self.live.is_approved = False
+        self.live.save()
+        page = self.events(cursor)
+        self.assertEqual([(event['kind'], event['bhandara_id']) for event in page['events']], [('live', pending.pk), ('gone', self.live.pk)])
+        self.assertEqual(page['cursor'], page['events'][-1]['id'])
+        self.assertEqual(page['events'][0]['area'], 'Unknown Area')
+
+    def test_no_stream_under_wsgi(self):
+        # A WSGI worker would be held by the stream for good: the page polls instead
+        response = self.client.get('/radar/api/stream/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(broadcaster), 0)
+
+    def take_off_the_radar(self):
+        self.live.is_active = False
+        self.live.save()
+
+    async def test_stream(self):
+        with mock.patch.object(broadcaster, 'poll_interval', 0.01):
+            response = await self.async_client.get('/radar/api/stream/?since=0')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = response.streaming_content
+            # Replayed from the database
+            self.assertIn(b'event: live', await anext(stream))
+            task = broadcaster._task
+
+            # Pushed by the broadcaster
+            await sync_to_async(self.take_off_the_radar)()
+            message = await asyncio.wait_for(anext(stream), timeout=5)
+            self.assertIn(b'event: gone', message)
+            self.assertIn(b'"bhandara_id":%d' % self.live.pk, message.replace(b' ', b''))
+
+            # The browser goes away: the broadcaster stops with its last subscriber
+            await response._iterator.aclose()
+            await asyncio.wait_for(task, timeout=5)
+            self.assertEqual(len(broadcaster), 0)
+
+    async def test_stream_handoff(self):
+        # An event lands after the client's replay, before the broadcaster first reads the table
+        replayed, inserted = asyncio.Event(), []
+
+        def hooked(read):
+            async def wrapper(*args):
+                if asyncio.current_task() is not broadcaster._task:
+                    result = await read(*args)
+                    if not result:
+                        replayed.set()
+                    return result
+                if not inserted:
+                    await replayed.wait()
+                    inserted.append(await sync_to_async(self.take_off_the_radar)())
+                return await read(*args)
+            return wrapper
+
+        with mock.patch.object(broadcaster, 'poll_interval', 0.01), \
+                mock.patch.object(events, 'events_since', hooked(events.events_since)), \
+                mock.patch.object(events, 'latest_event_id', hooked(events.latest_event_id)):
+            response = await self.async_client.get('/radar/api/stream/?since=0')
+            stream = response.streaming_content
+            self.assertIn(b'event: live', await anext(stream))
+            self.assertIn(b'event: gone', await asyncio.wait_for(anext(stream), timeout=5))
+            await response._iterator.aclose()
+        self.assertEqual(len(inserted), 1)
+
+    async def test_late_commit(self):
+        # Id 1 goes to a transaction that commits after id 3 is read; id 2 never commits
+        await RadarEvent.objects.all().adelete()
+        self.addCleanup(broadcaster._subscribers.clear)
+        with mock.patch.object(broadcaster, 'poll_interval', 0.01):
+            queue = broadcaster.subscribe(0)
+            await RadarEvent.objects.acreate(id=3, kind='gone', bhandara_id=self.live.pk)
+            self.assertEqual((await asyncio.wait_for(queue.get(), timeout=5)).pk, 3)
+            await RadarEvent.objects.acreate(id=1, kind='live', bhandara_id=self.live.pk)
+            self.assertEqual((await asyncio.wait_for(queue.get(), timeout=5)).pk, 1)
+            await RadarEvent.objects.acreate(id=4, kind='gone', bhandara_id=self.live.pk)
+            self.assertEqual((await asyncio.wait_for(queue.get(), timeout=5)).pk, 4)
+            broadcaster.unsubscribe(queue)
+            await asyncio.wait_for(broadcaster._task, timeout=5)
+
+
+class SmartAlternativesTests(TestCase):
+    """Alternatives are the closest Bhandaras that are not crowded, from the user or from the crowded site."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # The crowded site, then a line of Bhandaras east of it; the user stands 5 km east
+        longitudes = {'site': 80.95, 'a': 80.951, 'b': 80.953, 'c': 80.955, 'd': 80.96, 'e': 80.99, 'gps': None}
+        cls.ids = {}
+        for name, lng in longitudes.items():
+            cls.ids[name] = Bhandara.objects.create(
+                google_maps_url='https://maps.app.goo.gl/abc123',
+                area_name=name,
+                latitude=None if lng is None else 26.85,
+                longitude=lng,
+                is_approved=True,
+            ).pk
+        high, low = CROWD_LEVELS[2], CROWD_LEVELS[0]
+        cls.predictions = {bhandara_id: high if name in ('site', 'a') else low for name, bhandara_id in cls.ids.items()}
+
+    def alternatives(self, **options):
+        engine = SmartAlternatives(Bhandara.objects.all(), self.predictions, 26.85, 81.0, **options)
+        return engine.for_site(self.ids['site'], 26.85, 80.95)
+
+    def names(self, alternatives):
+        by_id = {bhandara_id: name for name, bhandara_id in self.ids.items()}
+        return [by_id[alternative['id']] for alternative in alternatives]
+
+    def test_from_the_user(self):
+        alternatives = self.alternatives()
+        self.assertEqual(self.names(alternatives), ['e', 'd', 'c'])
+        self.assertEqual(alternatives[0], {'id': self.ids['e'], 'title': '📍 e', 'crowd_status': 'Moving Fast', 'distance': 0.99})
+
+    def test_from_the_site(self):
+        self.assertEqual(self.names(self.alternatives(origin='site')), ['b', 'c', 'd'])
+
+    def test_max_detour(self):
+        self.assertEqual(self.names(self.alternatives(max_detour_km=0.6)), ['c', 'b'])
+        self.assertEqual(self.names(self.alternatives(origin='site', max_detour_km=0.6, limit=1)), ['b'])
+        self.assertEqual(self.alternatives(max_detour_km=0.1), [])
+
+    def test_pool_gives_each_user_their_own(self):
+        engine = SmartAlternatives(Bhandara.objects.all(), self.predictions, 26.85, 80.975)
+        pool = engine.pool_for_site(26.85, 80.95, reach_km=1.5)
+        cards = [engine.cards[i] for i in pool]
+        for user_lng in (80.962, 80.975, 80.988):
+            with self.subTest(user_lng=user_lng):
+                exact = SmartAlternatives(Bhandara.objects.all(), self.predictions, 26.85, user_lng)
+                self.assertEqual(
+                    SmartAlternatives.rank_pool(cards, engine.lats[pool], engine.lngs[pool], 26.85, user_lng, self.ids['site']),
+                    exact.for_site(self.ids['site'], 26.85, 80.95),
+                )
+
+
+class CoordinateQueueTests(TestCase):
+    """Lookups are leased to one worker at a time and retried with backoff until they give up."""
+
+    def setUp(self):
+        self.bhandara = Bhandara.objects.create(google_maps_url='https://maps.app.goo.gl/abc123', is_approved=True)
+        self.job = CoordinateJob.objects.get()
+
+    def test_lease(self):
+        self.assertEqual(self.job.status, 'PENDING')
+        [claimed] = coordinate_queue.claim_jobs(10)
+        self.assertEqual(claimed.status, 'RUNNING')
+        self.assertGreater(claimed.run_after, timezone.now() + timedelta(seconds=coordinate_queue.LEASE_SECONDS - 5))
+        # Another worker finds nothing due while the lease runs...
+        self.assertEqual(coordinate_queue.claim_jobs(10), [])
+        # ...and takes the job over once it has run out (the first worker died)
+        CoordinateJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([job.pk for job in coordinate_queue.claim_jobs(10)], [self.job.pk])
+
+    def test_backoff_delay(self):
+        base = coordinate_queue.BACKOFF_SECONDS
+        for attempts, seconds in ((1, base), (2, base * 2), (3, base * 4), (20, coordinate_queue.MAX_BACKOFF_SECONDS)):
+            with self.subTest(attempts=attempts):
+                delay = coordinate_queue.backoff_delay(attempts).total_seconds()
+                self.assertTrue(seconds * 0.8 <= delay <= seconds * 1.2, delay)
+
+    def test_retry_then_give_up(self):
+        [job] = coordinate_queue.claim_jobs(10)
+        self.assertEqual(coordinate_queue.finish_job(job, (None, None), 'Read timed out'), 'PENDING')
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.last_error), (1, 'Read timed out'))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=coordinate_queue.BACKOFF_SECONDS * 0.7))
+        self.assertEqual(coordinate_queue.claim_jobs(10), [])
+
+        job.attempts = coordinate_queue.MAX_ATTEMPTS - 1
+        self.assertEqual(coordinate_queue.finish_job(job, (None, None)), 'FAILED')
+        CoordinateJob.objects.update(run_after=timezone.now())
+        self.assertEqual(coordinate_queue.claim_jobs(10), [])
+
+    def test_run_jobs(self):
+        results = {'https://maps.app.goo.gl/abc123': (26.85, 80.94, '')}
+        with mock.patch.object(coordinate_queue, 'resolve_many', return_value=results) as resolve_many:
+            summary = coordinate_queue.run_jobs(coordinate_queue.claim_jobs(10), concurrency=4)
+        resolve_many.assert_called_once_with(['https://maps.app.goo.gl/abc123'], 4)
+        self.assertEqual(summary, {'DONE': 1})
+        self.bhandara.refresh_from_db()
+        self.assertEqual((self.bhandara.latitude, self.bhandara.longitude), (26.85, 80.94))
+        self.assertEqual(bhandara_index.query(26.85, 80.94, k=1)[0][0], self.bhandara.pk)
+
+
+class BulkImportTests(TestCase):
+    """Bulk imports insert valid rows in batches and do what the skipped post_save receivers would."""
+
+    def test_csv_import(self):
+        data = (
+            'Google Maps URL,Area Name,Menu Details\n'
+            '"https://www.google.com/maps/@26.85,80.94,17z",Alambagh,Poori Sabzi\n'
+            'not a url,Hazratganj,\n'
+            'https://maps.app.goo.gl/abc123,Charbagh,Halwa\n'
+        ).encode()
+        importer = BhandaraImporter(batch_size=1, approve=True).import_file(io.BytesIO(data), 'csv')
+
+        self.assertEqual(importer.created, 2)
+        self.assertEqual([line for line, _ in importer.errors], [3])
+        located = Bhandara.objects.get(area_name='Alambagh')
+        self.assertEqual((located.latitude, located.longitude), (26.85, 80.94))
+        # The short link can't be resolved offline: it waits in the coordinate queue
+        self.assertEqual(importer.queued, 1)
+        self.assertTrue(CoordinateJob.objects.filter(object_id=Bhandara.objects.get(area_name='Charbagh').pk).exists())
+        self.assertEqual(RadarEvent.objects.filter(kind='live').count(), 2)
+        self.assertEqual(TableVersion.current('radar')[0], 2)
+
+    def test_ndjson_dry_run(self):
+        data = (
+            b'{"google_maps_url": "https://www.google.com/maps/@26.85,80.94,17z", "latitude": 26.85}\n'
+            b'{"google_maps_url": "https://www.google.com/maps/@26.85,80.94,17z", "area_name": "Alambagh"}\n'
+            b'\n'
+            b'[1, 2]\n'
+        )
+        importer = BhandaraImporter(dry_run=True).import_file(io.BytesIO(data), 'ndjson')
+
+        self.assertEqual(importer.valid, 1)
+        self.assertEqual([line for line, _ in importer.errors], [1, 4])
+        self.assertFalse(Bhandara.objects.exists())
+
+
+class LifecycleTests(TestCase):
+    """Ended Bhandaras leave the radar, and later the live table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.live = Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.85,80.94,17z',
+            start_time=now - timedelta(hours=1),
+            is_approved=True,
+        )
+        cls.ended = Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.86,80.95,17z',
+            start_time=now - timedelta(days=10),
+            end_time=now - timedelta(days=9),
+            current_crowd_status='HIGH',
+            is_approved=True,
+        )
+
+    def test_default_end_time(self):
+        self.assertEqual(self.live.end_time - self.live.start_time, timedelta(hours=6))
+
+    def test_late_approval(self):
+        # Submitted from the public form yesterday, approved today
+        submitted = timezone.now() - timedelta(days=1)
+        pending = Bhandara.objects.create(google_maps_url='https://maps.app.goo.gl/abc123', start_time=submitted)
+        self.assertIsNone(pending.end_time)
+        self.assertEqual(deactivate_expired(timezone.now()), 1) # Only self.ended
+
+        site._registry[Bhandara].approve_bhandaras(None, Bhandara.objects.filter(pk=pending.pk))
+        pending.refresh_from_db()
+        self.assertGreater(pending.end_time, timezone.now() + timedelta(hours=5))
+        self.assertTrue(RadarEvent.objects.filter(kind='live', bhandara_id=pending.pk).exists())
+
+        # Approving it by saving does the same
+        other = Bhandara.objects.create(google_maps_url='https://maps.app.goo.gl/def456', start_time=submitted)
+        other.is_approved = True
+        other.save()
+        self.assertGreater(other.end_time, timezone.now() + timedelta(hours=5))
+
+    def test_submit_form_end_time(self):
+        end_time = timezone.localtime() + timedelta(hours=3)
+        self.client.post('/radar/add/', {
+            'google_maps_url': 'https://maps.app.goo.gl/abc123',
+            'area_name': 'Alambagh',
+            'end_time': f'{end_time:%Y-%m-%dT%H:%M}',
+        })
+        bhandara = Bhandara.objects.get(google_maps_url='https://maps.app.goo.gl/abc123')
+        self.assertEqual(bhandara.end_time, end_time.replace(second=0, microsecond=0))
+        self.assertFalse(bhandara.is_approved)
+
+    def test_expire_then_archive(self):
+        now = timezone.now()
+        self.assertEqual(deactivate_expired(now, chunk_size=1), 1)
+        self.assertEqual(
+            list(RadarEvent.objects.filter(kind='gone').values_list('bhandara_id', flat=True)),
+            [self.ended.pk]
+        )
+        ids = [row['id'] for row in self.client.get('/radar/api/nearest/?lat=26.85&lng=80.94').json()['bhandaras']]
+        self.assertEqual(ids, [self.live.pk])
+
+        self.assertEqual(archive_ended(now - timedelta(days=7)), 1)
+        self.assertFalse(Bhandara.objects.filter(pk=self.ended.pk).exists())
+        archived = BhandaraArchive.objects.get(original_id=self.ended.pk)
+        self.assertEqual(archived.current_crowd_status, 'HIGH')
+
+
+class CrowdTrainingTests(TestCase):
+    """The crowd model learns from observed crowd levels, never from its own snapshots."""
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        cls.observed_at = start + timedelta(hours=5)
+        Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.85,80.94,17z',
+            start_time=start,
+            observed_crowd_status='HIGH',
+            crowd_observed_at=cls.observed_at,
+            is_approved=True,
+        )
+        # Written by snapshot_crowd_status: the model's own guess
+        Bhandara.objects.create(
+            google_maps_url='https://www.google.com/maps/@26.86,80.95,17z',
+            start_time=start,
+            current_crowd_status='HIGH',
+            crowd_status_updated_at=start,
+            is_approved=True,
+        )
+        BhandaraArchive.objects.create(
+            original_id=1000,
+            google_maps_url='https://www.google.com/maps/@26.87,80.96,17z',
+            start_time=start - timedelta(days=30),
+            end_time=start - timedelta(days=30),
+            observed_crowd_status='LOW',
+            crowd_observed_at=start - timedelta(days=30),
+            crowd_recorded_at=start - timedelta(days=30),
+        )
+
+    def test_only_observed_rows_are_training_rows(self):
+        command = TrainCrowdModel()
+        rows = list(command.training_rows(command.history(None, command.latest_recording()), {'chunk_size': 100}))
+        self.assertEqual([status for _, _, status in rows], ['LOW', 'HIGH'])
+        # Labelled at the hour the crowd was seen, not the start time
+        self.assertEqual(rows[1][0], timezone.localtime(self.observed_at))
+
+    def test_dry_run(self):
+        out = io.StringIO()
+        call_command('train_crowd_model', source='db', holdout=0, n_estimators=5, n_jobs=1, dry_run=True, stdout=out)
+        self.assertIn('Trained on 2 row(s)', out.getvalue())
+
+    def test_observation_time_defaults_to_now(self):
+        bhandara = Bhandara.objects.create(google_maps_url='https://www.google.com/maps/@26.85,80.94,17z')
+        bhandara.observed_crowd_status = 'MODERATE'
+        bhandara.save(update_fields=['observed_crowd_status'])
+        bhandara.refresh_from_db()
+        self.assertIsNotNone(bhandara.crowd_observed_at)
+
+    def test_incremental(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        options = {'holdout': 0, 'n_estimators': 5, 'n_jobs': 1}
+
+        def train(**extra):
+            out = io.StringIO()
+            call_command('train_crowd_model', stdout=out, **options, **extra)
+            return out.getvalue()
+
+        with self.settings(RADAR_MODEL_REGISTRY=root):
+            train(source='db')
+            # A new observation, and a changed one: a new sighting, made now
+            Bhandara.objects.create(google_maps_url='https://www.google.com/maps/@26.88,80.97,17z', observed_crowd_status='LOW')
+            changed = Bhandara.objects.get(observed_crowd_status='HIGH')
+            changed.observed_crowd_status = 'MODERATE'
+            changed.save()
+            self.assertGreater(changed.crowd_observed_at, self.observed_at)
+            self.assertIn('2 new row(s)', train(incremental=True))
+            self.assertEqual(load_checkpoint()[0].sum(), 4)
+
+            # Saving it unchanged records nothing; backdating its time does
+            changed.save()
+            self.assertIn('nothing to do', train(incremental=True))
+            changed.crowd_observed_at = self.observed_at
+            changed.save(update_fields=['crowd_observed_at'])
+            self.assertIn('1 new row(s)', train(incremental=True))
+            self.assertEqual(load_checkpoint()[0].sum(), 5)
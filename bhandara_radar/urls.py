@@ -7,4 +7,6 @@ urlpatterns = [
     path('', views.bhandara_feed, name='feed'),
     path('add/', views.submit_bhandara, name='submit'),
     path('api/nearest/', views.api_nearest_bhandaras, name='api_nearest'),
+    path('api/stream/', views.api_radar_stream, name='api_stream'),
+    path('api/events/', views.api_radar_events, name='api_events'),
 ]
\ No newline at end of file
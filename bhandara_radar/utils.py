@@ -1,31 +1,94 @@
 import requests
 import re
 import math
+import numpy as np
+from asgiref.sync import sync_to_async
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, unquote_plus
 
-def extract_coordinates(url):
-    # 1. We create a fake "disguise" so Google thinks Render is a real computer
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept-Language': 'en-US,en;q=0.9',
-    }
+# Radius of the Earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+# We create a fake "disguise" so Google thinks Render is a real computer
+MAPS_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+# Short links that only tell us where they point after a redirect
+SHORT_LINK_HOSTS = ('maps.app.goo.gl', 'goo.gl', 'g.co')
+
+# !3d26.85!4d80.94 -> the pinned place itself (most precise, so it is checked first)
+PIN_PATTERN = re.compile(r'!3d(-?\d+(?:\.\d+)?)!4d(-?\d+(?:\.\d+)?)')
+# @26.85,80.94,17z -> the map viewport centre
+VIEWPORT_PATTERN = re.compile(r'@(-?\d+\.\d+),(-?\d+\.\d+)')
+# "26.85,80.94", "26.85, 80.94", "loc:26.85+80.94" inside a query value or path segment
+PAIR_PATTERN = re.compile(r'^\s*(?:loc:)?\s*(-?\d+(?:\.\d+)?)\s*[,+ ]\s*\+?(-?\d+(?:\.\d+)?)\s*$')
+# Query parameters Google Maps uses to carry a location, most specific first.
+# Never saddr: in a directions link that is where the sharer set off from
+COORDINATE_PARAMS = ('destination', 'daddr', 'q', 'query', 'll', 'sll', 'center', 'viewpoint')
+
+
+def _valid(lat, lng):
+    lat, lng = float(lat), float(lng)
+    if -90 <= lat <= 90 and -180 <= lng <= 180:
+        return lat, lng
+    return None
+
+
+def parse_coordinates(url):
+    """
+    Reads coordinates straight out of any known Google Maps URL shape
+    (!3d..!4d.., q=/ll=/query=/center=... parameters, /place/lat,lng and @lat,lng)
+    without any network I/O. Returns (lat, lng) or (None, None).
+    """
+    if not url:
+        return None, None
+
+    match = PIN_PATTERN.search(url)
+    if match and _valid(*match.groups()):
+        return _valid(*match.groups())
+
+    parts = urlsplit(url.strip())
+    params = dict(parse_qsl(parts.query))
+    params.update(parse_qsl(parts.fragment))
+    for name in COORDINATE_PARAMS:
+        match = PAIR_PATTERN.match(params.get(name, ''))
+        if match and _valid(*match.groups()):
+            return _valid(*match.groups())
+
+    # /maps/dir/<origin>/<destination>: the place is the last pair, never the first
+    for segment in reversed(parts.path.split('/')):
+        match = PAIR_PATTERN.match(unquote_plus(segment))
+        if match and _valid(*match.groups()):
+            return _valid(*match.groups())
+
+    match = VIEWPORT_PATTERN.search(url)
+    if match and _valid(*match.groups()):
+        return _valid(*match.groups())
 
-    try:
-        # 2. We pass the disguise in the request
-        response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
-        
-        # 3. Now Google will let the link expand, and we search for the coordinates
-        final_url = response.url
-        
-        # Your existing regex logic to find @26.xxx,80.xxx goes here...
-        match = re.search(r'@(-?\d+\.\d+),(-?\d+\.\d+)', final_url)
-        if match:
-            return float(match.group(1)), float(match.group(2))
-            
-    except Exception as e:
-        print(f"Extraction failed: {e}")
-        
     return None, None
 
+
+def normalize_maps_url(url):
+    """
+    Canonical form used as the resolution cache key: share trackers such as
+    WhatsApp's ?g_st=iw are dropped from short links.
+    """
+    parts = urlsplit(url.strip())
+    if parts.hostname in SHORT_LINK_HOSTS:
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), '', ''))
+    return url.strip()
+
+
+def expand_maps_url(url, session=None):
+    """
+    Follows a (short) Google Maps link to its final URL. This is the only
+    network call in here; it raises requests.RequestException on failure.
+    """
+    response = (session or requests).get(url, headers=MAPS_HEADERS, timeout=10, allow_redirects=True)
+    return response.url
+
+
 def calculate_haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculates the exact distance (in kilometers) between two GPS points 
@@ -35,8 +98,7 @@ def calculate_haversine_distance(lat1, lon1, lat2, lon2):
     if not all([lat1, lon1, lat2, lon2]):
         return float('inf')
 
-    # Radius of the Earth in kilometers
-    R = 6371.0
+    R = EARTH_RADIUS_KM
 
     # Convert coordinates to radians for the math equation
     lat1_rad = math.radians(lat1)
@@ -54,4 +116,190 @@ def calculate_haversine_distance(lat1, lon1, lat2, lon2):
     distance = R * c
     
     # Return distance rounded to 2 decimal places (e.g., 1.45 km)
-    return round(distance, 2)
\ No newline at end of file
+    return round(distance, 2)
+
+
+def load_coordinates(queryset):
+    """
+    Pulls (id, latitude, longitude) for every row of the queryset that has GPS
+    data into three contiguous NumPy arrays, without building model instances.
+    """
+    return _coordinate_arrays(list(_located(queryset)))
+
+
+def _located(queryset):
+    return queryset.filter(
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).values_list('id', 'latitude', 'longitude')
+
+
+def _coordinate_arrays(rows):
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return np.empty(0, dtype=np.int64), empty, empty
+
+    ids, lats, lngs = zip(*rows)
+    return (
+        np.fromiter(ids, dtype=np.int64, count=len(rows)),
+        np.fromiter(lats, dtype=np.float64, count=len(rows)),
+        np.fromiter(lngs, dtype=np.float64, count=len(rows)),
+    )
+
+
+def haversine_distances(lat, lng, lats, lngs):
+    """
+    Vectorized version of calculate_haversine_distance: the distance (in km,
+    unrounded) from one point to every point in the lats/lngs arrays, computed
+    in a single NumPy pass.
+    """
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lng)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lngs, dtype=np.float64))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def nearest_indices(distances, k=None):
+    """
+    Returns the positions of the k smallest distances, closest first.
+    Uses argpartition so only the selected k values are ever fully sorted.
+    """
+    n = len(distances)
+    if k is None or k >= n:
+        return np.argsort(distances, kind='stable')
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    top = np.argpartition(distances, k - 1)[:k]
+    return top[np.argsort(distances[top], kind='stable')]
+
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_cell(lat, lng, precision=7):
+    """
+    Geohash of (lat, lng) with `precision` characters, and the bounds of its
+    cell as (lat_min, lat_max, lng_min, lng_max). Every extra character
+    shrinks the cell: 6 is ~1.2 km x 0.6 km, 7 is ~150 m x 150 m.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True # Bits alternate between longitude and latitude, longitude first
+    while len(chars) < precision:
+        span, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (span[0] + span[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            span[0] = mid
+        else:
+            bits = bits * 2
+            span[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars), (lat_range[0], lat_range[1], lng_range[0], lng_range[1])
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Lat/lng range filters for a box that contains every point within
+    radius_km of (lat, lng). Meant for an indexed range query before the
+    exact haversine math; the box is slightly larger than the circle.
+    """
+    lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+    box = {
+        'latitude__gte': lat - lat_span,
+        'latitude__lte': lat + lat_span,
+    }
+    # Over a pole or across the antimeridian one longitude range can't hold the circle: the latitude band alone does
+    edge_lat = min(abs(lat) + lat_span, 90.0)
+    if edge_lat < 90.0:
+        lng_span = lat_span / math.cos(math.radians(edge_lat))
+        if -180.0 <= lng - lng_span and lng + lng_span <= 180.0:
+            box['longitude__gte'] = lng - lng_span
+            box['longitude__lte'] = lng + lng_span
+    return box
+
+
+def nearest_in_box(queryset, lat, lng, k=None, radius_km=None, start_km=5.0, max_km=1000.0):
+    """
+    Finds the closest rows of a queryset without loading the whole table:
+    only rows inside a lat/lng bounding box are fetched, and the box doubles
+    in size until it holds k rows (or reaches max_km, after which the whole
+    table is scanned). With a radius_km, only that one box is queried.
+    Returns (ids, distances) as arrays, closest first.
+    """
+    search_km = radius_km or start_km
+    if radius_km is None and k is None:
+        search_km = float('inf') # Everything was asked for
+    while True:
+        if radius_km is None and search_km > max_km:
+            candidates = queryset # Nothing close by: fall back to a full scan
+        else:
+            candidates = queryset.filter(**bounding_box(lat, lng, search_km))
+
+        ids, lats, lngs = load_coordinates(candidates)
+        distances = haversine_distances(lat, lng, lats, lngs)
+
+        if candidates is not queryset:
+            # The box corners reach further than search_km; only the circle is complete
+            inside = distances <= search_km
+            if radius_km is None and np.count_nonzero(inside) < k:
+                search_km *= 2
+                continue
+            ids, distances = ids[inside], distances[inside]
+
+        order = nearest_indices(distances, k)
+        return ids[order], distances[order]
+
+
+async def anearest_in_box(queryset, lat, lng, **options):
+    """nearest_in_box for async views, run in the request's thread like the async ORM's own queries."""
+    return await sync_to_async(nearest_in_box)(queryset, lat, lng, **options)
+
+
+def parse_limit(value):
+    """
+    Reads an optional positive integer query parameter (e.g. ?k=10).
+    Anything missing or invalid means "no limit".
+    """
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+def parse_radius(value):
+    """
+    Reads an optional positive distance in km (e.g. ?radius_km=2.5).
+    Anything missing or invalid means "no radius".
+    """
+    try:
+        radius = float(value)
+    except (TypeError, ValueError):
+        return None
+    return radius if 0 < radius < float('inf') else None
+
+
+def parse_cursor(value):
+    """
+    Reads an optional event cursor (e.g. ?since=1234 or a Last-Event-ID header).
+    Anything missing or invalid means "from now on".
+    """
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
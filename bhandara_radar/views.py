@@ -1,16 +1,30 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from .models import Bhandara
+from .models import Bhandara, RadarEvent
 from .forms import BhandaraSubmitForm
-from django.http import JsonResponse
-from .utils import calculate_haversine_distance
-from .ml_engine.predict import get_live_crowd_prediction, get_smart_alternatives
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from upzunction.conditional import table_condition, table_version
+from upzunction.serialization import json_response, json_rows_response, requested_fields, pick_fields, avalues_by_id, is_asgi
+from .utils import anearest_in_box, parse_cursor, parse_limit, parse_radius
+from .spatial_index import bhandara_index
+from .nearest_cache import CachedRanking, cell_candidates, nearest_cache
+from .events import BATCH_SIZE, event_stream
+from .ml_engine.predict import CROWD_LEVELS, PREDICTION_COLUMNS, predict_crowd_for_rows, current_model_version, current_time_bucket, SmartAlternatives
+
+# Everything a /radar/api/nearest/ row can hold; ?fields= picks a subset
+NEAREST_FIELDS = ('id', 'title', 'area', 'owner', 'is_verified', 'menu', 'crowd_status', 'crowd_raw', 'distance', 'url', 'alternatives')
+# Columns read for those rows
+NEAREST_COLUMNS = ('latitude', 'longitude', 'area_name', 'business_name', 'organizer_name', 'menu_details', 'is_verified_owner', 'google_maps_url')
 def bhandara_feed(request):
-    active_bhandaras = Bhandara.objects.filter(is_approved=True).order_by('-start_time')
+    active_bhandaras = list(Bhandara.objects.filter(is_approved=True, is_active=True).order_by('-start_time'))
     
-    # Inject AI prediction into each object for the initial page load
+    # Inject AI prediction into each object for the initial page load (stored snapshot, or one batch for the whole page)
+    predictions = predict_crowd_for_rows(
+        (b.id, b.area_score, b.current_crowd_status, b.crowd_status_updated_at, b.crowd_status_model) for b in active_bhandaras
+    )
     for b in active_bhandaras:
-        raw_status, display_status = get_live_crowd_prediction(b.area_name)
+        raw_status, display_status = predictions[b.id]
         b.ai_crowd_raw = raw_status
         b.ai_crowd_display = display_status
         
@@ -35,54 +49,189 @@ def submit_bhandara(request):
 
     return render(request, 'bhandara_radar/add_form.html', {'form': form})
 
-def api_nearest_bhandaras(request):
+def prediction_state():
+    # Same rows can still answer differently after the hour turns or a new model goes live
+    return (f"{current_time_bucket():%Y%m%d%H}", current_model_version())
+
+@table_condition('radar', etag_parts=prediction_state, not_before=current_time_bucket)
+async def api_nearest_bhandaras(request):
     """
     Receives live GPS coordinates from the frontend, calculates distances, 
     sorts them, and returns JSON.
+    Optional `k` limits the response to the k closest locations and
+    `radius_km` drops everything further away than that.
+    Alternatives for crowded locations are ranked from the user, or from the
+    crowded site with `alt_origin=site`, within `alt_radius_km` of the site.
+    `fields=id,distance,...` returns only those keys per row.
+    Async: every query runs off the event loop (async ORM or sync_to_async),
+    so a worker keeps serving other GPS lookups while this one waits on the database.
+    Rankings are shared by everyone in the same geohash cell (see nearest_cache.py).
     """
     user_lat = request.GET.get('lat')
     user_lng = request.GET.get('lng')
 
     if not user_lat or not user_lng:
-        return JsonResponse({'error': 'GPS coordinates missing'}, status=400)
+        return json_response({'error': 'GPS coordinates missing'}, status=400)
 
     user_lat = float(user_lat)
     user_lng = float(user_lng)
+    k = parse_limit(request.GET.get('k'))
+    radius_km = parse_radius(request.GET.get('radius_km'))
+    fields = requested_fields(request, NEAREST_FIELDS)
+    alternatives = None
+    if 'alternatives' in fields:
+        alternatives = {
+            'origin': request.GET.get('alt_origin', 'user'),
+            'max_detour_km': parse_radius(request.GET.get('alt_radius_km')),
+        }
 
-    # Get all live locations
-    active_bhandaras = Bhandara.objects.filter(is_approved=True)
-    
+    # 1. Everyone in the user's ~150 m cell shares one ranking per table version and prediction state
+    cell = nearest_cache.cell(user_lat, user_lng)
+    version = table_version(request, 'radar')
+    key = ('radar', version, cell.geohash, *prediction_state(), k, radius_km,
+           tuple(alternatives.values()) if alternatives else None)
+    ranking = nearest_cache.get(key)
+    if ranking is None:
+        ranking = await rank_bhandaras(cell, k, radius_km, alternatives, version)
+        nearest_cache.set(key, ranking)
+
+    # 2. Exact distances (and order) from where this user actually stands
     results = []
-    for b in active_bhandaras:
-        # 1. Calculate distance
-        if b.latitude is None or b.longitude is None:
-            continue # Skip this location, it has no GPS data!
-        distance = calculate_haversine_distance(user_lat, user_lng, b.latitude, b.longitude)
-        
-        # 2. 🔥 GET LIVE ML PREDICTION 🔥
-        raw_status, display_status = get_live_crowd_prediction(b.area_name)
-        # 3. 🔥 GET SMART ALTERNATIVES (If crowded) 🔥
+    for row, distance in ranking.for_user(user_lat, user_lng, k=k, radius_km=radius_km):
+        row = dict(row, distance=round(distance, 2))
+        if row['alternatives'] and alternatives['origin'] != 'site':
+            row['alternatives'] = user_alternatives(row, ranking.extra, user_lat, user_lng)
+        results.append(row)
+
+    return json_rows_response(
+        'bhandaras',
+        pick_fields(results, fields, NEAREST_FIELDS),
+        {'model_version': current_model_version()},
+        asynchronous=is_asgi(request),
+    )
+
+async def rank_bhandaras(cell, k, radius_km, alternatives=None, version=None):
+    """
+    Every live Bhandara that can be in the answer for someone in `cell`, as
+    response rows without their distance (a CachedRanking). With
+    origin=user, a row's alternatives are the pool every user in the cell
+    picks their own from (see user_alternatives); the pool's coordinates go
+    in `extra`.
+    `version` is the 'radar' counter the response goes out under: the
+    spatial index is brought up to it first.
+    """
+    # Get all live locations (ended ones are switched off by expire_bhandaras)
+    active_bhandaras = Bhandara.objects.filter(is_approved=True, is_active=True)
+
+    async def search(lat, lng, k=None, radius_km=None):
+        # The in-memory spatial index (rows without GPS data are never indexed)
+        if settings.RADAR_SPATIAL_INDEX:
+            nearest = (await bhandara_index.aensure_fresh(version)).query(lat, lng, k=k, radius_km=radius_km)
+            return [i for i, _ in nearest], [d for _, d in nearest]
+        # Or let the database narrow them down with an indexed lat/lng box
+        return await anearest_in_box(active_bhandaras, lat, lng, k=k, radius_km=radius_km)
+
+    ids = [int(i) for i in await cell_candidates(search, cell, k=k, radius_km=radius_km)]
+
+    # Only the columns we send, and only for the rows we are actually sending back
+    selected = await avalues_by_id(active_bhandaras, ids, NEAREST_COLUMNS + PREDICTION_COLUMNS)
+
+    # One batch of predictions (mostly the stored snapshot) for exactly those rows
+    predictions = predict_crowd_for_rows(
+        tuple(row[column] for column in PREDICTION_COLUMNS) for row in selected.values()
+    )
+    alternatives_engine = None
+
+    rows, lats, lngs = [], [], []
+    for bhandara_id in ids:
+        b = selected.get(bhandara_id)
+        if b is None:
+            continue # Index is a few moments behind the database
+        is_verified = b['is_verified_owner']
+
+        # 🔥 GET LIVE ML PREDICTION 🔥
+        raw_status, display_status = predictions.get(bhandara_id, CROWD_LEVELS[0])
+        # 🔥 GET SMART ALTERNATIVES (If crowded, and asked for) 🔥
         alternatives_data = []
-        if raw_status == 'HIGH':
-            # We pass the full queryset so the function can scan for neighbors
-            alternatives_data = get_smart_alternatives(b.id, user_lat, user_lng, active_bhandaras)
-        # 3. Package data
-        results.append({
-            'id': b.id,
-            'title': b.business_name if b.is_verified_owner else f"📍 Active Bhandara - {b.area_name}",
-            'area': b.area_name or "Unknown Area",
-            'owner': b.organizer_name or "Generous Soul",
-            'is_verified': b.is_verified_owner,
-            'menu': b.menu_details if b.is_verified_owner else "Menu Unconfirmed",
+        if raw_status == 'HIGH' and alternatives:
+            # The candidate pool (every live row, scored) is only read for the first crowded location
+            if alternatives_engine is None:
+                alternatives_engine = await SmartAlternatives.acreate(
+                    active_bhandaras, None, cell.lat, cell.lng, **alternatives
+                )
+            if alternatives_engine.origin == 'site':
+                alternatives_data = alternatives_engine.for_site(bhandara_id, b['latitude'], b['longitude'])
+            else:
+                pool = alternatives_engine.pool_for_site(b['latitude'], b['longitude'], cell.reach_km)
+                alternatives_data = [alternatives_engine.cards[i] for i in pool]
+        # Package data (the distance is added per user)
+        rows.append({
+            'id': bhandara_id,
+            'title': b['business_name'] if is_verified else f"📍 Active Bhandara - {b['area_name']}",
+            'area': b['area_name'] or "Unknown Area",
+            'owner': b['organizer_name'] or "Generous Soul",
+            'is_verified': is_verified,
+            'menu': b['menu_details'] if is_verified else "Menu Unconfirmed",
             'crowd_status': display_status, # Sent by AI
             'crowd_raw': raw_status,        # Sent by AI
-            'distance': distance,
-            'url': b.google_maps_url,
-            'alternatives': alternatives_data # <-- ADD THIS NEW LINE!
+            'url': b['google_maps_url'],
+            'alternatives': alternatives_data
         })
+        lats.append(b['latitude'])
+        lngs.append(b['longitude'])
+
+    extra = {}
+    if alternatives_engine is not None and alternatives_engine.origin != 'site':
+        used = {alternative['id'] for row in rows for alternative in row['alternatives']}
+        extra = {
+            'limit': alternatives_engine.limit,
+            'coordinates': {
+                int(bhandara_id): (lat, lng)
+                for bhandara_id, lat, lng in zip(alternatives_engine.ids, alternatives_engine.lats, alternatives_engine.lngs)
+                if bhandara_id in used
+            },
+        }
+    return CachedRanking(rows, lats, lngs, extra)
+
+def user_alternatives(row, extra, user_lat, user_lng):
+    """The user's own closest alternatives, picked from a cached row's pool (see rank_bhandaras)."""
+    pool = row['alternatives']
+    lats, lngs = zip(*(extra['coordinates'][alternative['id']] for alternative in pool))
+    return SmartAlternatives.rank_pool(pool, lats, lngs, user_lat, user_lng, row['id'], extra['limit'])
 
-    # 3. Sort the list by distance (closest first)
-    # We use a lambda function to handle any "None" distances safely
-    results.sort(key=lambda x: float('inf') if x['distance'] is None else x['distance'])
+async def api_radar_stream(request):
+    """
+    Server-Sent Events feed of radar changes: `live` (a Bhandara went live or
+    changed), `crowd` (its crowd status changed) and `gone` (it left the radar).
+    Browsers resume with Last-Event-ID after a dropped connection; `since`
+    replays from an older cursor.
+
+    Needs the ASGI server (start.sh): under WSGI every open stream would hold
+    a sync worker for good, so it answers 503 and the page polls
+    api_radar_events instead.
+    """
+    if not is_asgi(request):
+        return json_response({'error': 'Live stream unavailable; poll /radar/api/events/'}, status=503)
+    cursor = parse_cursor(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+    response = StreamingHttpResponse(event_stream(cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Don't let a proxy hold events back
+    return response
+
+def api_radar_events(request):
+    """
+    Polling fallback of api_radar_stream: the events after `since`, oldest
+    first, and the cursor to send next time. Without `since` it only returns
+    the current cursor.
+    """
+    cursor = parse_cursor(request.GET.get('since'))
+    if cursor is None:
+        latest = RadarEvent.objects.order_by('-id').values_list('id', flat=True).first()
+        return json_response({'events': [], 'cursor': latest or 0, 'more': False})
 
-    return JsonResponse({'bhandaras': results})
\ No newline at end of file
+    events = list(RadarEvent.objects.filter(id__gt=cursor).order_by('id')[:BATCH_SIZE])
+    return json_response({
+        'events': [event.as_dict() for event in events],
+        'cursor': events[-1].pk if events else cursor,
+        'more': len(events) == BATCH_SIZE,
+    })
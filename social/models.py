@@ -30,6 +30,18 @@ class Post(models.Model):
     expires_at = models.DateTimeField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Home feed: only active posts are ever listed, so only they are indexed
+            models.Index(
+                fields=['expires_at', '-created_at'],
+                condition=models.Q(is_active=True),
+                name='post_active_expiry_idx',
+            ),
+            # Location filter on the home feed
+            models.Index(fields=['location', 'is_location_specific'], name='post_location_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # Automatically set the expiration date on creation
         if not self.id:
@@ -50,6 +62,14 @@ class Message(models.Model):
     sender_phone = models.CharField(max_length=15, blank=True, null=True)
     recipient_phone_on_approval = models.CharField(max_length=15, blank=True, null=True)
     is_approved = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Dashboard inbox / outbox, newest first
+            models.Index(fields=['recipient', '-sent_at'], name='message_recipient_sent_idx'),
+            models.Index(fields=['sender', '-sent_at'], name='message_sender_sent_idx'),
+        ]
+
     def __str__(self):
         status = "Approved" if self.is_approved else "Pending"
         return f"Message from {self.sender.username} to {self.recipient.username} on '{self.post.title}' [{status}]"
@@ -1,3 +1,50 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from upzunction.testing import QueryPlanTestCase
+from .models import Location, Post, Message
+
+
+class HotQueryIndexTests(QueryPlanTestCase):
+    """The home feed and dashboard queries must be answered from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'pass')
+        cls.other = User.objects.create_user('buyer', 'buyer@example.com', 'pass')
+        cls.location = Location.objects.create(name='Alambagh')
+
+        posts = [
+            Post(
+                author=cls.user,
+                title=f'Post {i}',
+                description='Details',
+                location=cls.location if i % 2 else None,
+                is_location_specific=bool(i % 3),
+                expires_at=timezone.now() + timedelta(days=7 if i % 4 else -1),
+                is_active=bool(i % 5),
+            )
+            for i in range(50)
+        ]
+        Post.objects.bulk_create(posts)
+
+        post = Post.objects.first()
+        Message.objects.bulk_create([
+            Message(post=post, sender=cls.other, recipient=cls.user, body=f'Offer {i}')
+            for i in range(20)
+        ] + [
+            Message(post=post, sender=cls.user, recipient=cls.other, body=f'Reply {i}')
+            for i in range(20)
+        ])
+
+    def test_home_feed(self):
+        self.assertUsesIndexes('/community/', 'social_post')
+
+    def test_home_feed_by_location(self):
+        self.assertUsesIndexes(f'/community/?location={self.location.id}', 'social_post')
+
+    def test_dashboard_messages(self):
+        self.client.force_login(self.user)
+        self.assertUsesIndexes('/community/dashboard/', 'social_message')
@@ -0,0 +1,8 @@
+#!/usr/bin/env bash
+
+#exit on error
+set -o errexit
+
+# ASGI: the live radar stream (/radar/api/stream/) holds a connection per browser,
+# which the uvicorn workers' event loops handle; WSGI workers would each be tied up by one
+exec gunicorn upzunction.asgi:application -k uvicorn_worker.UvicornWorker
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bhandara_radar.models import TableVersion
+from tourism.models import SpotCard
+
+class Command(BaseCommand):
+    help = ('Rebuilds the spot cards the tourism APIs read, after writes that skip the post_save receivers '
+            '(bulk_create, update(), raw SQL) or a deploy that changes what a card holds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spot', type=int, action='append',
+                            help='Only rebuild the card of this spot (can be repeated). Default: every spot.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Cards written per upsert.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        started = time.perf_counter()
+        written = SpotCard.refresh(options['spot'], batch_size=options['batch_size'])
+        # The APIs' ETags and nearest cache must not keep serving the old cards
+        TableVersion.bump('tourism')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} spot card(s) in {elapsed:.2f}s.'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0004_alter_touristspot_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='touristspot',
+            index=models.Index(fields=['latitude', 'longitude'], name='touristspot_lat_lng_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0005_touristspot_touristspot_lat_lng_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='touristspot',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_approved', True)), fields=['-rating'], name='touristspot_live_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='touristspot',
+            index=models.Index(fields=['city', 'is_active'], name='touristspot_city_active_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:49
+
+from django.db import migrations, models
+
+
+def build_cards(apps, schema_editor):
+    # Same fields as SpotCard.from_spot; historical models don't carry its methods
+    TouristSpot = apps.get_model('tourism', 'TouristSpot')
+    SpotCard = apps.get_model('tourism', 'SpotCard')
+    batch = []
+    for spot in TouristSpot.objects.select_related('city__state').order_by('pk').iterator(chunk_size=500):
+        batch.append(SpotCard(
+            id=spot.pk,
+            city_id=spot.city_id,
+            state_id=spot.city.state_id,
+            name=spot.name,
+            city=spot.city.name,
+            state=spot.city.state.name,
+            rating=spot.rating,
+            views=spot.views,
+            description=(spot.description or '')[:150],
+            image=spot.image.url if spot.image else '',
+            map_url=spot.google_maps_url,
+            latitude=spot.latitude,
+            longitude=spot.longitude,
+            is_active=spot.is_active,
+        ))
+        if len(batch) >= 500:
+            SpotCard.objects.bulk_create(batch)
+            batch = []
+    SpotCard.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourism', '0006_touristspot_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpotCard',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('city_id', models.IntegerField()),
+                ('state_id', models.IntegerField(db_index=True)),
+                ('name', models.CharField(max_length=200)),
+                ('city', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('rating', models.FloatField(default=0)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('description', models.CharField(blank=True, max_length=150)),
+                ('image', models.CharField(blank=True, max_length=500)),
+                ('map_url', models.CharField(max_length=500)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['city_id', 'is_active'], name='spotcard_city_active_idx'), models.Index(fields=['latitude', 'longitude'], name='spotcard_lat_lng_idx')],
+            },
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
-from bhandara_radar.utils import extract_coordinates
+from bhandara_radar.models import CoordinateJob, TableVersion, fill_known_coordinates
 from django.contrib.auth.models import User
 from cloudinary.models import CloudinaryField
 
@@ -36,15 +38,169 @@ class TouristSpot(models.Model):
     created_at = models.DateTimeField( default=timezone.now)
     is_approved = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Bounding-box prefilter of the nearest queries
+            models.Index(fields=['latitude', 'longitude'], name='touristspot_lat_lng_idx'),
+            # Tourism feed: only live spots, best rated first
+            models.Index(
+                fields=['-rating'],
+                condition=models.Q(is_active=True, is_approved=True),
+                name='touristspot_live_rating_idx',
+            ),
+            # City listing and related spots on the detail page
+            models.Index(fields=['city', 'is_active'], name='touristspot_city_active_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
 
-        if self.google_maps_url and not ( self.latitude and self.longitude):
-            lat, lng = extract_coordinates(self.google_maps_url)
-            if lat and lng:
-                self.latitude = lat
-                self.longitude = lng
+        fill_known_coordinates(self, kwargs.get('update_fields'))
+
+        super().save(*args, **kwargs)
+
+        # Coordinates are looked up by the resolve_coordinates worker
+        CoordinateJob.enqueue_if_needed(self, kwargs.get('update_fields'))
+
+
+class SpotCard(models.Model):
+    """
+    Read model of the tourism APIs: one row per spot holding exactly the
+    fields they send, with the city and state names copied in, the
+    description already cut to 150 characters and the Cloudinary URL
+    already built. Kept in step by the receivers below; rebuild it with
+    `manage.py rebuild_spot_cards` after writes that skip them
+    (bulk_create, update(), raw SQL).
+    """
+    # Same id as the spot; the card goes when the spot does (see remove_spot_card)
+    id = models.IntegerField(primary_key=True)
+    # Plain columns rather than foreign keys: 'city' and 'state' are the names the APIs send
+    city_id = models.IntegerField()
+    state_id = models.IntegerField(db_index=True)
+    name = models.CharField(max_length=200)
+    city = models.CharField(max_length=100)
+    state = models.CharField(max_length=100)
+    rating = models.FloatField(default=0)
+    views = models.PositiveIntegerField(default=0)
+    description = models.CharField(max_length=150, blank=True)
+    image = models.CharField(max_length=500, blank=True)
+    map_url = models.CharField(max_length=500)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # City listing API
+            models.Index(fields=['city_id', 'is_active'], name='spotcard_city_active_idx'),
+            # Bounding-box prefilter of the nearest API
+            models.Index(fields=['latitude', 'longitude'], name='spotcard_lat_lng_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_spot(cls, spot):
+        """The card of a spot read with select_related('city__state')."""
+        return cls(
+            id=spot.pk,
+            city_id=spot.city_id,
+            state_id=spot.city.state_id,
+            name=spot.name,
+            city=spot.city.name,
+            state=spot.city.state.name,
+            rating=spot.rating,
+            views=spot.views,
+            description=(spot.description or '')[:150],
+            image=spot.image.url if spot.image else '',
+            map_url=spot.google_maps_url,
+            latitude=spot.latitude,
+            longitude=spot.longitude,
+            is_active=spot.is_active,
+        )
+
+    @classmethod
+    def refresh(cls, spot_ids=None, batch_size=500):
+        """
+        Rebuilds the cards of the given spots (every spot when None, which
+        also drops the cards of spots that are gone). Returns how many were written.
+        """
+        spots = TouristSpot.objects.select_related('city__state').order_by('pk')
+        if spot_ids is not None:
+            spots = spots.filter(pk__in=list(spot_ids))
+        else:
+            cls.objects.exclude(id__in=TouristSpot.objects.values('pk')).delete()
+
+        written = 0
+        batch = []
+        for spot in spots.iterator(chunk_size=batch_size):
+            batch.append(cls.from_spot(spot))
+            if len(batch) >= batch_size:
+                written += cls._upsert(batch)
+                batch = []
+        return written + cls._upsert(batch)
+
+    @classmethod
+    def _upsert(cls, cards):
+        if cards:
+            cls.objects.bulk_create(
+                cards,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=[field.name for field in cls._meta.concrete_fields if not field.primary_key],
+            )
+        return len(cards)
+
+
+# Registered before bump_tourism_version, so the cards are current when the version moves
+@receiver(post_save, sender=TouristSpot)
+def sync_spot_card(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    # The detail page's view counter: one column, no need to read the city and state again
+    if update_fields is not None and set(update_fields) <= {'views'}:
+        if SpotCard.objects.filter(id=instance.pk).update(views=instance.views):
+            return
+    SpotCard.refresh([instance.pk])
+
+
+@receiver(post_delete, sender=TouristSpot)
+def remove_spot_card(sender, instance, **kwargs):
+    # Deleting a city or state cascades to its spots, which come through here too
+    SpotCard.objects.filter(id=instance.pk).delete()
+
+
+@receiver(post_save, sender=City)
+def rename_city_on_cards(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    SpotCard.objects.filter(city_id=instance.pk).update(
+        city=instance.name,
+        state_id=instance.state_id,
+        state=instance.state.name,
+    )
+
+
+@receiver(post_save, sender=State)
+def rename_state_on_cards(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    SpotCard.objects.filter(state_id=instance.pk).update(state=instance.name)
+
 
-        super().save(*args, **kwargs)
\ No newline at end of file
+# Every tourism API reads spots with their city and state names, so one counter covers all three
+@receiver(post_save, sender=State)
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=TouristSpot)
+@receiver(post_delete, sender=State)
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=TouristSpot)
+def bump_tourism_version(sender, update_fields=None, **kwargs):
+    # Not for the detail page's view counter, or every page view would expire every ETag and cached
+    # answer: the view counts the APIs serve catch up with the next real change
+    if update_fields is not None and set(update_fields) <= {'views'}:
+        return
+    TableVersion.bump('tourism')
@@ -1,3 +1,198 @@
+import json
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from bhandara_radar.models import TableVersion
+from bhandara_radar.nearest_cache import nearest_cache
+from upzunction import serialization
+from upzunction.testing import QueryPlanTestCase
+from .models import State, City, SpotCard, TouristSpot
+from .views import SPOT_FIELDS
+
+
+class HotQueryIndexTests(QueryPlanTestCase):
+    """The tourism feed and APIs must be answered from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('guide', 'guide@example.com', 'pass')
+        state = State.objects.create(name='Uttar Pradesh')
+        cls.city = City.objects.create(state=state, name='Lucknow')
+        other_city = City.objects.create(state=state, name='Agra')
+
+        TouristSpot.objects.bulk_create([
+            TouristSpot(
+                user=user,
+                city=cls.city if i % 2 else other_city,
+                name=f'Spot {i}',
+                google_maps_url='https://www.google.com/maps/@26.85,80.94,15z',
+                latitude=26.80 + i * 0.01,
+                longitude=80.90 + i * 0.01,
+                rating=i % 5,
+                is_active=bool(i % 7),
+                is_approved=bool(i % 3),
+            )
+            for i in range(50)
+        ])
+        # bulk_create skips the receivers that keep the cards current
+        SpotCard.refresh()
+        cls.spot = TouristSpot.objects.filter(city=cls.city, is_active=True).first()
+
+    def setUp(self):
+        nearest_cache.invalidate()
+
+    def test_feed(self):
+        self.assertUsesIndexes('/tourism/', 'tourism_touristspot')
+
+    def test_city_spots_api(self):
+        self.assertUsesIndexes(f'/tourism/api/spots/?city={self.city.id}', 'tourism_spotcard')
+
+    def test_nearest_api(self):
+        self.assertUsesIndexes('/tourism/api/nearest/?lat=26.85&lng=80.95&k=5', 'tourism_spotcard')
+
+    def test_spot_detail(self):
+        self.assertUsesIndexes(f'/tourism/spot/{self.spot.id}/', 'tourism_touristspot')
+
+
+class SpotCardTests(TestCase):
+    """The spot cards follow every save, rename and delete the APIs can see."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('guide', 'guide@example.com', 'pass')
+        cls.state = State.objects.create(name='Uttar Pradesh')
+        cls.city = City.objects.create(state=cls.state, name='Lucknow')
+        cls.spot = TouristSpot.objects.create(
+            user=user,
+            city=cls.city,
+            name='Bara Imambara',
+            description='x' * 400,
+            google_maps_url='https://www.google.com/maps/@26.8692,80.9125,17z',
+            rating=4.5,
+        )
+
+    def setUp(self):
+        nearest_cache.invalidate()
+
+    def spots(self):
+        return self.client.get(f'/tourism/api/spots/?city={self.city.id}').json()['spots']
+
+    def test_api_reads_one_table(self):
+        # The TableVersion counter, then the cards: no per-spot queries
+        with self.assertNumQueries(2):
+            spots = self.spots()
+        self.assertEqual(spots, [{
+            'id': self.spot.pk,
+            'name': 'Bara Imambara',
+            'city': 'Lucknow',
+            'state': 'Uttar Pradesh',
+            'rating': 4.5,
+            'views': 0,
+            'description': 'x' * 150,
+            'image': '',
+            'map_url': 'https://www.google.com/maps/@26.8692,80.9125,17z',
+        }])
+
+        nearest = self.client.get('/tourism/api/nearest/?lat=26.87&lng=80.91&fields=id,state').json()['spots']
+        self.assertEqual(nearest, [{'id': self.spot.pk, 'state': 'Uttar Pradesh'}])
+
+    def test_view_counter_keeps_the_version(self):
+        version = TableVersion.current('tourism')
+        # What the detail page's view counter does
+        self.spot.views += 1
+        self.spot.save(update_fields=['views'])
+        self.assertEqual(SpotCard.objects.get(id=self.spot.pk).views, 1)
+        self.assertEqual(TableVersion.current('tourism'), version)
+
+    def test_cards_follow_writes(self):
+        # What the detail page's view counter does
+        self.spot.views += 1
+        self.spot.save(update_fields=['views'])
+        self.state.name = 'UP'
+        self.state.save()
+        self.city.name = 'Lakhnau'
+        self.city.save()
+        self.assertEqual(
+            [(spot['views'], spot['city'], spot['state']) for spot in self.spots()],
+            [(1, 'Lakhnau', 'UP')]
+        )
+
+        self.spot.is_active = False
+        self.spot.save()
+        self.assertEqual(self.spots(), [])
+
+        self.city.delete()
+        self.assertFalse(SpotCard.objects.exists())
+
+
+class JsonRowsTests(TestCase):
+    """Large arrays are streamed, byte for byte what encoding them in one piece gives; ?fields= trims the rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('guide', 'guide@example.com', 'pass')
+        state = State.objects.create(name='Uttar Pradesh')
+        cls.city = City.objects.create(state=state, name='Lucknow')
+        TouristSpot.objects.bulk_create([
+            TouristSpot(
+                user=user,
+                city=cls.city,
+                name=f'Spot {i}',
+                google_maps_url='https://www.google.com/maps/@26.85,80.94,15z',
+                rating=i % 5,
+            )
+            for i in range(serialization.STREAM_MIN_ROWS + 100)
+        ])
+        SpotCard.refresh()
+
+    def setUp(self):
+        nearest_cache.invalidate()
+
+    def url(self, fields=None):
+        return f'/tourism/api/spots/?city={self.city.id}' + ('' if fields is None else f'&fields={fields}')
+
+    def whole_body(self, url):
+        with mock.patch.object(serialization, 'STREAM_MIN_ROWS', 10 ** 6):
+            response = self.client.get(url)
+        self.assertFalse(response.streaming)
+        return response.content
+
+    def test_stream_matches_whole_body(self):
+        expected = self.whole_body(self.url())
+        self.assertEqual(len(json.loads(expected)['spots']), serialization.STREAM_MIN_ROWS + 100)
+
+        response = self.client.get(self.url())
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        self.assertEqual(b''.join(response.streaming_content), expected)
+
+    async def test_async_stream_matches_whole_body(self):
+        expected = await sync_to_async(self.whole_body)(self.url())
+        # Under ASGI the body is an async iterator: no thread per streamed response
+        response = await self.async_client.get(self.url())
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), expected)
+
+    def test_chunk_boundaries(self):
+        for count in (serialization.STREAM_MIN_ROWS, serialization.STREAM_CHUNK_ROWS * 2, serialization.STREAM_CHUNK_ROWS * 2 + 1):
+            with self.subTest(count=count):
+                rows = [{'id': i, 'name': f'Spot {i}'} for i in range(count)]
+                response = serialization.json_rows_response('spots', rows, {'cursor': count, 'more': False})
+                self.assertTrue(response.streaming)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    serialization.dumps({'spots': rows, 'cursor': count, 'more': False})
+                )
+
+    def test_fields(self):
+        # Asked-for fields in the API's own order; unknown names are ignored
+        spots = json.loads(b''.join(self.client.get(self.url(' rating,name,colour')).streaming_content))['spots']
+        self.assertEqual(list(spots[0]), ['name', 'rating'])
+        self.assertEqual(len(spots), serialization.STREAM_MIN_ROWS + 100)
+
+        # Nothing known asked for: every field, as without ?fields=
+        self.assertEqual(self.whole_body(self.url('colour')), self.whole_body(self.url()))
+        self.assertEqual(list(json.loads(self.whole_body(self.url()))['spots'][0]), list(SPOT_FIELDS))
@@ -1,5 +1,4 @@
 from django.shortcuts import render
-from django.http import JsonResponse
 
 from tourism.forms import TouristSpotForm
 from django.contrib.auth.decorators import login_required
@@ -18,11 +17,34 @@ from .models import TouristSpot
 from .models import (
     State,
     City,
+    SpotCard,
     TouristSpot
 )
 
+from bhandara_radar.nearest_cache import (
+    CachedRanking,
+    cell_candidates,
+    nearest_cache
+)
+
 from bhandara_radar.utils import (
-    calculate_haversine_distance
+    anearest_in_box,
+    parse_limit,
+    parse_radius
+)
+
+from upzunction.conditional import (
+    table_condition,
+    table_version
+)
+
+from upzunction.serialization import (
+    avalues_by_id,
+    is_asgi,
+    json_response,
+    json_rows_response,
+    pick_fields,
+    requested_fields
 )
 
 def tourism_feed(request):
@@ -48,147 +70,195 @@ def tourism_feed(request):
         context
     )
 
-def api_cities(request):
+@table_condition('tourism')
+async def api_cities(request):
 
     state_id = request.GET.get('state')
 
     cities = City.objects.filter(
         state_id=state_id
-    ).order_by('name')
-
-    data = []
+    ).order_by('name').values(
+        'id',
+        'name'
+    )
 
-    for city in cities:
+    return json_rows_response(
+        'cities',
+        [city async for city in cities.aiterator()],
+        asynchronous=is_asgi(request)
+    )
 
-        data.append({
-            'id': city.id,
-            'name': city.name
-        })
+# Everything a spot row can hold (SpotCard columns of the same names); ?fields= picks a subset
+SPOT_FIELDS = (
+    'id',
+    'name',
+    'city',
+    'state',
+    'rating',
+    'views',
+    'description',
+    'image',
+    'map_url'
+)
 
-    return JsonResponse({
-        'cities': data
-    })
+NEAREST_SPOT_FIELDS = SPOT_FIELDS + (
+    'distance',
+)
 
-def api_tourist_spots(request):
+@table_condition('tourism')
+async def api_tourist_spots(request):
 
     city_id = request.GET.get('city')
 
-    spots = TouristSpot.objects.filter(
+    fields = requested_fields(
+        request,
+        SPOT_FIELDS
+    )
+
+    # One indexed read of the precomputed cards, only the columns asked for
+    cards = SpotCard.objects.filter(
         city_id=city_id,
         is_active=True
+    ).values(
+        *fields
     )
 
-    results = []
-
-    for spot in spots:
-
-        results.append({
-
-            'id': spot.id,
-
-            'name': spot.name,
-
-            'city': spot.city.name,
-
-            'state': spot.city.state.name,
-
-            'rating': spot.rating,
-
-            'views': spot.views,
-
-            'description': (
-                spot.description[:150]
-                if spot.description
-                else ''
-            ),
-
-            'image': (
-                spot.image.url
-                if spot.image
-                else ''
-            ),
-
-            'map_url': spot.google_maps_url
-        })
-
-    return JsonResponse({
-        'spots': results
-    })
+    return json_rows_response(
+        'spots',
+        [card async for card in cards.aiterator()],
+        asynchronous=is_asgi(request)
+    )
 
-def api_nearest_tourist_spots(request):
+@table_condition('tourism')
+async def api_nearest_tourist_spots(request):
 
     user_lat = request.GET.get('lat')
     user_lng = request.GET.get('lng')
 
     if not user_lat or not user_lng:
 
-        return JsonResponse({
+        return json_response({
             'error': 'GPS missing'
         }, status=400)
 
     user_lat = float(user_lat)
     user_lng = float(user_lng)
 
-    spots = TouristSpot.objects.filter(
-        is_active=True
+    k = parse_limit(
+        request.GET.get('k')
     )
 
-    results = []
+    radius_km = parse_radius(
+        request.GET.get('radius_km')
+    )
 
-    for spot in spots:
+    fields = requested_fields(
+        request,
+        NEAREST_SPOT_FIELDS
+    )
 
-        if (
-            spot.latitude is None or
-            spot.longitude is None
-        ):
-            continue
+    # Everyone in the user's ~150 m cell shares one ranking per table version
+    cell = nearest_cache.cell(
+        user_lat,
+        user_lng
+    )
+
+    key = (
+        'tourism',
+        table_version(request, 'tourism'),
+        cell.geohash,
+        k,
+        radius_km
+    )
+
+    ranking = nearest_cache.get(key)
+
+    if ranking is None:
 
-        distance = calculate_haversine_distance(
+        ranking = await rank_spots(
+            cell,
+            k,
+            radius_km
+        )
+
+        nearest_cache.set(key, ranking)
+
+    # Exact distances (and order) from where this user actually stands
+    results = [
+        dict(row, distance=round(distance, 2))
+        for row, distance in ranking.for_user(
             user_lat,
             user_lng,
-            spot.latitude,
-            spot.longitude
+            k=k,
+            radius_km=radius_km
         )
+    ]
+
+    return json_rows_response(
+        'spots',
+        pick_fields(
+            results,
+            fields,
+            NEAREST_SPOT_FIELDS
+        ),
+        asynchronous=is_asgi(request)
+    )
 
-        results.append({
-
-            'id': spot.id,
+async def rank_spots(cell, k, radius_km):
+    """
+    Every active spot that can be in the answer for someone
+    in `cell`, as full rows without their distance.
+    """
+    cards = SpotCard.objects.filter(
+        is_active=True
+    )
 
-            'name': spot.name,
+    async def search(lat, lng, k=None, radius_km=None):
 
-            'city': spot.city.name,
+        # Indexed lat/lng box first, exact distances only for the survivors
+        return await anearest_in_box(
+            cards,
+            lat,
+            lng,
+            k=k,
+            radius_km=radius_km
+        )
 
-            'state': spot.city.state.name,
+    ids = await cell_candidates(
+        search,
+        cell,
+        k=k,
+        radius_km=radius_km
+    )
 
-            'distance': distance,
+    # The ready-made cards of only the spots we may return
+    selected = await avalues_by_id(
+        cards,
+        [int(spot_id) for spot_id in ids],
+        SPOT_FIELDS + ('latitude', 'longitude')
+    )
 
-            'rating': spot.rating,
+    rows = []
+    lats = []
+    lngs = []
 
-            'views': spot.views,
+    for spot_id in ids:
 
-            'image': (
-                spot.image.url
-                if spot.image
-                else ''
-            ),
+        row = selected.get(int(spot_id))
 
-            'description': (
-                spot.description[:150]
-                if spot.description
-                else ''
-            ),
+        if row is None:
+            continue
 
-            'map_url': spot.google_maps_url
-        })
+        lats.append(row.pop('latitude'))
+        lngs.append(row.pop('longitude'))
+        rows.append(row)
 
-    results.sort(
-        key=lambda x: x['distance']
+    return CachedRanking(
+        rows,
+        lats,
+        lngs
     )
 
-    return JsonResponse({
-        'spots': results
-    })
-
 @login_required
 def add_tourist_spot(request):
 
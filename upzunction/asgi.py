@@ -3,6 +3,14 @@ ASGI config for upzunction project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with gunicorn and the uvicorn worker class (what start.sh runs):
+
+    gunicorn upzunction.asgi:application -k uvicorn_worker.UvicornWorker
+
+The async JSON APIs (/radar/api/nearest/, /radar/api/stream/, /tourism/api/...)
+then share each worker's event loop, while the sync HTML views run in
+Django's thread pool as before.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
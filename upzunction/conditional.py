@@ -0,0 +1,81 @@
+"""
+Conditional GET for the read APIs: ETag / Last-Modified validators built
+from a TableVersion change counter, checked before the view runs.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+def table_condition(table, etag_parts=None, not_before=None):
+    """
+    View decorator. Answers If-None-Match / If-Modified-Since with a bodiless
+    304 when the `table` counter (see bhandara_radar.models.TableVersion) has
+    not moved, so repeat requests never run the view's queries.
+
+    etag_parts: callable returning extra values the response depends on
+    (e.g. the prediction time bucket and model version).
+    not_before: callable returning a datetime the response can't be older
+    than (e.g. the start of the current time bucket).
+
+    Works on sync and async views alike.
+    """
+
+    def state(request):
+        # ETag and Last-Modified are computed separately; read the counter once per request
+        cached = request.__dict__.setdefault('_table_versions', {})
+        if table not in cached:
+            from bhandara_radar.models import TableVersion
+            cached[table] = TableVersion.current(table)
+        return cached[table]
+
+    async def astate(request):
+        cached = request.__dict__.setdefault('_table_versions', {})
+        if table not in cached:
+            from bhandara_radar.models import TableVersion
+            cached[table] = await TableVersion.acurrent(table)
+        return cached[table]
+
+    def etag(request, *args, **kwargs):
+        version, _ = state(request)
+        parts = [table, version, *(etag_parts() if etag_parts else ())]
+        return '"' + '-'.join(str(part) for part in parts) + '"'
+
+    def last_modified(request, *args, **kwargs):
+        _, updated_at = state(request)
+        candidates = [moment for moment in (updated_at, not_before() if not_before else None) if moment is not None]
+        return max(candidates) if candidates else None
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # condition() reads the validators synchronously: fetch the counter through the async ORM first
+                await astate(request)
+                response = await conditional_view(request, *args, **kwargs)
+                patch_cache_control(response, no_cache=True)
+                return response
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Let browsers keep the body, but always revalidate it with us first
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def table_version(request, table):
+    """The `table` counter table_condition already read for this request."""
+    return request._table_versions[table][0]
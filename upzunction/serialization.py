@@ -0,0 +1,109 @@
+"""
+Shared JSON plumbing for the public APIs: column-only fetches, a fast
+encoder, streamed arrays and ?fields= selection.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError: # Optional: falls back to the standard library encoder
+    orjson = None
+
+# Arrays with at least this many rows are streamed instead of encoded in one piece
+STREAM_MIN_ROWS = 500
+STREAM_CHUNK_ROWS = 500
+
+
+def dumps(data):
+    """Encodes `data` to UTF-8 JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+
+def json_rows_response(key, rows, extra=None, asynchronous=False):
+    """
+    Responds with {key: rows, **extra}. Large arrays are encoded and sent
+    STREAM_CHUNK_ROWS rows at a time, so the whole body never has to sit in
+    memory as one string. Pass asynchronous=is_asgi(request) from async
+    views, so an ASGI server gets a body it can stream without a thread.
+    """
+    extra = extra or {}
+    if len(rows) < STREAM_MIN_ROWS:
+        return json_response({key: rows, **extra})
+    body = _stream_rows(key, rows, extra)
+    if asynchronous:
+        body = _async_chunks(body)
+    return StreamingHttpResponse(body, content_type='application/json')
+
+
+def is_asgi(request):
+    """True when the request came in through upzunction/asgi.py."""
+    return isinstance(request, ASGIRequest)
+
+
+async def _async_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _stream_rows(key, rows, extra):
+    yield b'{' + dumps(key) + b':['
+    for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+        # Encode a slice as a list, then drop its brackets to splice it into the open array
+        chunk = dumps(rows[start:start + STREAM_CHUNK_ROWS])[1:-1]
+        yield chunk if start == 0 else b',' + chunk
+    yield b']'
+    for name, value in extra.items():
+        yield b',' + dumps(name) + b':' + dumps(value)
+    yield b'}'
+
+
+def requested_fields(request, available):
+    """
+    The fields a client asked for with ?fields=a,b,c, in `available` order.
+    Unknown names are ignored; no (or no valid) selection means every field.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return tuple(available)
+    wanted = {name.strip() for name in value.split(',')}
+    return tuple(name for name in available if name in wanted) or tuple(available)
+
+
+def pick_fields(rows, fields, available):
+    """Trims every row dict to `fields` (no copy when all fields were asked for)."""
+    if tuple(fields) == tuple(available):
+        return rows
+    return [{name: row[name] for name in fields} for row in rows]
+
+
+def values_by_id(queryset, ids, fields):
+    """
+    {id: {'id': ..., field: value, ...}} for the given ids, fetching only
+    `fields` (a values() in_bulk, batched under the database's parameter limit).
+    """
+    ids = list(ids)
+    fields = [name for name in fields if name != 'id']
+    batch_size = connections[queryset.db].features.max_query_params or len(ids) or 1
+
+    rows = {}
+    for start in range(0, len(ids), batch_size):
+        for row in queryset.filter(pk__in=ids[start:start + batch_size]).values('id', *fields):
+            rows[row['id']] = row
+    return rows
+
+
+async def avalues_by_id(queryset, ids, fields):
+    """values_by_id for async views, run in the request's thread like the async ORM's own queries."""
+    return await sync_to_async(values_by_id)(queryset, ids, fields)
@@ -93,6 +93,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'upzunction.wsgi.application'
+# Production serves both through ASGI (see asgi.py); the JSON APIs are async views
+ASGI_APPLICATION = 'upzunction.asgi.application'
 
 
 # --- DATABASE CONFIGURATION FOR RENDER (POSTGRESQL) ---
@@ -141,6 +143,42 @@ DEFAULT_FROM_EMAIL = os.getenv('SENDER_EMAIL', 'upzunction@gmail.com')
 SENDGRID_SANDBOX_MODE_IN_DEBUG = False
 
 
+# --- BHANDARA RADAR SETTINGS ---
+# Answer /radar/api/nearest/ from a per-worker in-memory index (False = indexed lat/lng box query in the database)
+RADAR_SPATIAL_INDEX = True
+# Grid cell size (in degrees, ~5.5 km) of the in-memory spatial index used by /radar/api/nearest/
+RADAR_INDEX_CELL_DEGREES = 0.05
+# Each worker rebuilds its index from the database at least this often (seconds)
+RADAR_INDEX_MAX_AGE = 300
+# Google Maps lookups run in the `manage.py resolve_coordinates` worker, never inside a request
+RADAR_GEOCODE_CONCURRENCY = 4
+RADAR_GEOCODE_MAX_ATTEMPTS = 5
+RADAR_GEOCODE_BACKOFF_SECONDS = 30
+# Resolved short links are cached in the database: found coordinates for 30 days, "no coordinates" for an hour
+RADAR_MAPS_CACHE_TTL = 30 * 24 * 60 * 60
+RADAR_MAPS_NEGATIVE_CACHE_TTL = 60 * 60
+# Versioned crowd models; workers check the registry's CURRENT pointer this often (seconds) and hot-swap new versions
+RADAR_MODEL_REGISTRY = BASE_DIR / 'bhandara_radar' / 'ml_engine' / 'registry'
+RADAR_MODEL_CHECK_SECONDS = 10
+# Area-density grid behind the crowd model's area_score (~1.1 km cells; rerun `manage.py build_density_grid` after changing it)
+RADAR_DENSITY_CELL_DEGREES = 0.01
+# Workers check for a rebuilt grid this often (seconds), and reload it at least this often
+RADAR_DENSITY_CHECK_SECONDS = 10
+RADAR_DENSITY_MAX_AGE = 60 * 60
+# Live radar updates (/radar/api/stream/): each ASGI worker checks the RadarEvent log this often (seconds); events are kept a day
+RADAR_EVENT_POLL_SECONDS = 1.0
+RADAR_EVENT_RETENTION = 24 * 60 * 60
+# Nearest APIs share one ranking per geohash cell of the user (7 characters = ~150 m; 0 turns the cache off).
+# Entries live this long (seconds) and each worker keeps at most this many cached rows
+RADAR_NEAREST_CACHE_PRECISION = 7
+RADAR_NEAREST_CACHE_TTL = 5 * 60
+RADAR_NEAREST_CACHE_MAX_ROWS = 200000
+# Bhandaras without an end time stay live this long after start_time; `manage.py expire_bhandaras`
+# takes ended ones off the radar and moves them to the archive table this many days later
+RADAR_DEFAULT_DURATION_HOURS = 6
+RADAR_ARCHIVE_AFTER_DAYS = 7
+
+
 # --- AUTHENTICATION SETTINGS ---
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
@@ -0,0 +1,54 @@
+"""
+Test helpers shared by the apps' test suites.
+"""
+import re
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+# Templates use {% static %}, which needs a collectstatic manifest with the production storage
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class QueryPlanTestCase(TestCase):
+    """
+    Runs a view, captures the SQL it sends for a given table and fails if
+    the database would answer any of those queries with a sequential scan.
+    """
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # A handful of seeded rows always makes Postgres prefer a seq scan; we only care whether an index *can* be used
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def is_sequential_scan(self, plan, table):
+        if connection.vendor == 'postgresql':
+            return re.search(rf'Seq Scan on {table}\b', plan) is not None
+        # SQLite: "SCAN table" without "USING (COVERING) INDEX" reads every row
+        return re.search(rf'\bSCAN {table}\b(?! USING)', plan) is not None
+
+    def assertUsesIndexes(self, url, table):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        queries = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']
+        ]
+        self.assertTrue(queries, f'{url} sent no query for {table}')
+
+        for sql in queries:
+            plan = self.explain(sql)
+            self.assertFalse(
+                self.is_sequential_scan(plan, table),
+                f'{url} scans all of {table}:\n{sql}\n{plan}'
+            )